@@ -88,4 +88,40 @@ def get_element_types(arr):
     types = []
     for elem in arr:
         types.append(type(elem).__name__)
-    return types
\ No newline at end of file
+    return types
+
+# Array-like classes by name
+array_classes = {
+    cls.__name__: cls
+    for cls in [list, tuple, set, frozenset]
+}
+
+# Scalar classes by name
+scalar_classes = {
+    cls.__name__: cls
+    for cls in [int, float, str, bool, date, time, datetime]
+}
+
+
+# Convert a saved scalar value back to the python type with the given name
+# Values saved as text (compound arrays, dates and times in sqlite)
+# are parsed, booleans saved as integers are converted
+def convert_scalar(type_name, value):
+    if type_name == 'bool':
+        return value == 'True' if isinstance(value, str) else bool(value)
+    elif type_name in ('date', 'time', 'datetime') and isinstance(value, str):
+        return scalar_classes[type_name].fromisoformat(value)
+    elif type_name in ('int', 'float', 'str'):
+        return scalar_classes[type_name](value)
+    return value
+
+
+# Rebuild an array-like object of the given type (name) from its saved values
+# and the type names of its elements (the same type for all the elements,
+# or one type per element for compound arrays)
+def load_array(arr_type, values, types):
+    if isinstance(types, str):
+        types = [types] * len(values)
+    return array_classes[arr_type](
+        convert_scalar(type_name, value)
+        for type_name, value in zip(types, values))
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from datetime import datetime
+from dbObject import DbObject
+from dbResource import get_backend_class
+"""
+Benchmark comparing the storage backends (see dbResource):
+ - the time needed to connect and start a run (startup of a run)
+ - the time needed to save scalars, lists and dataframes
+
+Usage:
+    python backend_benchmark.py [number_of_values] [number_of_rows]
+
+The postgresql changes are rolled back at the end and the run is dropped,
+the sqlite backend writes in a temporary file
+"""
+
+ltz = datetime.utcnow().astimezone().tzinfo
+
+
+# Create the objects to save: number_of_values scalars and lists,
+# and 10 dataframes of number_of_rows rows
+def make_objects(n_values, n_rows):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'int_col': rng.integers(0, 1000, n_rows),
+        'float_col': rng.random(n_rows),
+        'str_col': rng.choice(['a', 'bb', 'ccc', 'dddd'], n_rows),
+    })
+    now = datetime.now(ltz)
+    objs = {
+        'scalars': [
+            DbObject(int, now, i, 'x', i) for i in range(n_values)
+        ],
+        'lists': [
+            DbObject(list, now, i, 'l', [i, i + 1, i + 2])
+            for i in range(n_values)
+        ],
+        'dataframes': [
+            DbObject(pd.DataFrame, now, i, 'df', df) for i in range(10)
+        ],
+    }
+    return objs
+
+
+def bench_backend(backend, objs, **kwargs):
+    db = get_backend_class(backend)(delta_logging=False, **kwargs)
+    times = {}
+    t1 = perf_counter()
+    db.connect()
+    run_id = db.start_run('backend_benchmark')
+    times['connect'] = perf_counter() - t1
+    for kind, kind_objs in objs.items():
+        t1 = perf_counter()
+        for obj in kind_objs:
+            db.save(obj)
+        times[kind] = perf_counter() - t1
+    db.disconnect(commit=False)
+    # The run itself is committed when it starts
+    db.set_run_id(None)
+    db.connect()
+    db.drop_run(run_id)
+    db.disconnect()
+    return times
+
+
+def main(n_values, n_rows):
+    objs = make_objects(n_values, n_rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'benchmark.sqlite')
+        results['sqlite'] = bench_backend('sqlite', objs, path=path)
+    try:
+        results['postgresql'] = bench_backend('postgresql', objs)
+    except Exception as e:
+        print("postgresql backend not available: {}".format(e))
+    print("Values: {}, rows: {}".format(n_values, n_rows))
+    print("{:<12}".format('') + ''.join('{:>12}'.format(k) for k in results))
+    for step in ['connect', *objs]:
+        print("{:<12}".format(step) + ''.join('{:>11.3f}s'.format(t[step])
+                                              for t in results.values()))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
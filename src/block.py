@@ -1,3 +1,5 @@
+import heapq
+import bisect
 import itertools
 import typing
 
@@ -7,8 +9,13 @@ class Block:
     Block class
 
     Specifies essentially a range of integers
+
+    A block can have its own loop logging policy (see logger),
+    None to use the default policy
     """
-    def __init__(self, start: int, end: int):
+    __slots__ = ('start', 'end', 'loop_policy')
+
+    def __init__(self, start: int, end: int, loop_policy: str = None):
         super(Block, self).__init__()
         try:
             start = int(start)
@@ -23,6 +30,7 @@ class Block:
                     "Start value must be smaller than or equal to end value")
             self.start = start
             self.end = end
+            self.loop_policy = loop_policy
 
     # Implementation of the 'in' operator
     def __contains__(self, item):
@@ -32,10 +40,20 @@ class Block:
     def overlap(self, other):
         return self.start <= other.end and self.end >= other.start
 
+    # Checks if two blocks follow each other without overlapping
+    def adjacent(self, other):
+        return self.end + 1 == other.start or other.end + 1 == self.start
+
     def __repr__(self):
+        if self.loop_policy is not None:
+            return 'Block({}, {}, {!r})'.format(self.start, self.end,
+                                                self.loop_policy)
         return 'Block({}, {})'.format(self.start, self.end)
 
     def __str__(self):
+        if self.loop_policy is not None:
+            return '[{}, {}, {}]'.format(self.start, self.end,
+                                         self.loop_policy)
         return '[{}, {}]'.format(self.start, self.end)
 
 
@@ -47,33 +65,97 @@ class BlockList:
 
     Implements the 'in' operator to check if an integer 
     is in any of the contained blocks
+
+    The blocks don't overlap, so they are kept sorted by their start,
+    and the block of an integer is found with a binary search
+    on the block starts (O(log n) lookups and overlap checks)
     """
+    __slots__ = ('blocks', 'starts')
+
     def __init__(self, *blocks):
         super(BlockList, self).__init__()
         self.blocks = []
+        self.starts = []
         self.add_blocks(blocks)
 
+    # Create a block list from blocks sorted by their start
+    # The blocks are only checked in one pass, without sorting them again
+    @classmethod
+    def from_sorted(cls, blocks):
+        blocklist = cls()
+        blocks = list(blocks)
+        check_blocks(blocks)
+        blocklist.blocks = blocks
+        blocklist.starts = [block.start for block in blocks]
+        return blocklist
+
     # Implementation of the 'in' operator
     def __contains__(self, item):
-        for block in self.blocks:
-            if item in block:
-                return True
-        return False
+        return self.get_block(item) is not None
 
-    def add_block(self, new_block):
-        if not isinstance(new_block, Block):
-            raise TypeError("Argument must be of type Block (found: ",
-                            type(new_block), ")")
-        for block in self.blocks:
-            if block.overlap(new_block):
-                raise ValueError(
-                    "New block must not overlap with previously defined blocks"
-                )
-        self.blocks.append(new_block)
+    def __len__(self):
+        return len(self.blocks)
 
+    def __iter__(self):
+        return iter(self.blocks)
+
+    # Get the index of the last block starting at or before item,
+    # -1 if all the blocks start after item
+    def bisect(self, item):
+        return bisect.bisect_right(self.starts, item) - 1
+
+    # Get the block containing item, or None if there is none
+    def get_block(self, item):
+        i = self.bisect(item)
+        if i >= 0 and item in self.blocks[i]:
+            return self.blocks[i]
+        return None
+
+    def add_block(self, new_block):
+        check_block_type(new_block)
+        i = self.bisect(new_block.start)
+        if (i >= 0 and self.blocks[i].overlap(new_block)) or \
+                (i + 1 < len(self.blocks)
+                 and self.blocks[i + 1].overlap(new_block)):
+            raise ValueError(
+                "New block must not overlap with previously defined blocks")
+        self.blocks.insert(i + 1, new_block)
+        self.starts.insert(i + 1, new_block.start)
+
+    # Add multiple blocks by sorting them with the existing blocks,
+    # instead of adding them one by one
     def add_blocks(self, blocks):
-        for block in blocks:
-            self.add_block(block)
+        blocks = sorted(self.blocks + list(blocks),
+                        key=lambda block: block.start)
+        check_blocks(blocks)
+        self.blocks = blocks
+        self.starts = [block.start for block in blocks]
+
+    # Get the blocks adjacent to the given block
+    def get_adjacent_blocks(self, block):
+        i = self.bisect(block.start)
+        return tuple(self.blocks[j] for j in (i - 1, i, i + 1)
+                     if 0 <= j < len(self.blocks)
+                     and self.blocks[j].adjacent(block))
+
+    # Get a new block list with the blocks of this list and of the other list
+    # Overlapping and adjacent blocks with the same loop logging policy
+    # are merged into one block, overlapping blocks with different loop
+    # logging policies raise a ValueError
+    def merge(self, other=None):
+        other = [] if other is None else other
+        blocks = []
+        for block in heapq.merge(self.blocks,
+                                 other,
+                                 key=lambda block: block.start):
+            last = blocks[-1] if blocks else None
+            if last is not None and (last.overlap(block) or last.adjacent(block)) \
+                    and last.loop_policy == block.loop_policy:
+                blocks[-1] = Block(last.start, max(last.end, block.end),
+                                   last.loop_policy)
+            else:
+                blocks.append(block)
+        return BlockList.from_sorted(blocks)
 
     # Return the list of blocks as a tuple
     def get_blocks(self):
@@ -83,4 +165,22 @@ class BlockList:
         return 'BlockList{}'.format(self.get_blocks())
 
     def __str__(self):
-        return str(self.get_blocks())
\ No newline at end of file
+        return str(self.get_blocks())
+
+
+def check_block_type(block):
+    if not isinstance(block, Block):
+        raise TypeError("Argument must be of type Block (found: ",
+                        type(block), ")")
+
+
+# Checks that the blocks, sorted by their start, don't overlap
+def check_blocks(blocks):
+    for block in blocks:
+        check_block_type(block)
+    for previous, block in zip(blocks, blocks[1:]):
+        if block.start < previous.start:
+            raise ValueError("Blocks must be sorted by their start")
+        if previous.overlap(block):
+            raise ValueError(
+                "New block must not overlap with previously defined blocks")
@@ -0,0 +1,204 @@
+import io
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from decimal import Decimal
+from datetime import date, time, datetime, timedelta
+from dataframe_utils import restore_pandas
+"""
+Functions to store dataframe columns as content-addressed chunks
+
+A column is cut in blocks of a fixed number of rows,
+every block is encoded in the numpy .npy format
+and identified by the hash of its bytes, so two identical blocks
+(in the same or in different dataframes) are only stored once
+
+Blocks of object columns (strings, mixed types, ...) are encoded
+in JSON instead, so that loading a chunk never unpickles anything
+"""
+
+# Default number of rows per chunk
+CHUNK_ROWS = 65536
+
+# Prefix of the chunks encoded in JSON
+# (the .npy bytes start with b'\x93NUMPY')
+JSON_PREFIX = b'JSON'
+
+
+def encode_value(value):
+    """
+    Returns the JSON value of an element of an object array
+
+    Strings, numbers, booleans and None are kept as they are,
+    the other supported values are JSON objects {"type": ..., "value": ...}
+    Raises a TypeError for the values that can't be encoded
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return encode_value(value.item())
+    if value is pd.NaT:
+        return {'type': 'NaT', 'value': None}
+    if value is pd.NA:
+        return {'type': 'NA', 'value': None}
+    if isinstance(value, pd.Timestamp):
+        return {'type': 'Timestamp', 'value': value.isoformat()}
+    if isinstance(value, pd.Timedelta):
+        return {'type': 'Timedelta', 'value': value.value}
+    if isinstance(value, datetime):
+        return {'type': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, date):
+        return {'type': 'date', 'value': value.isoformat()}
+    if isinstance(value, time):
+        return {'type': 'time', 'value': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'type': 'timedelta',
+                'value': [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, Decimal):
+        return {'type': 'Decimal', 'value': str(value)}
+    if isinstance(value, bytes):
+        return {'type': 'bytes', 'value': value.hex()}
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, tuple):
+        return {'type': 'tuple', 'value': [encode_value(v) for v in value]}
+    if isinstance(value, dict):
+        return {'type': 'dict',
+                'value': [[encode_value(k), encode_value(v)]
+                          for k, v in value.items()]}
+    raise TypeError("Values of type {} can't be saved in chunks".format(
+        type(value).__name__))
+
+
+def decode_value(value):
+    """
+    Returns the element of an object array encoded by encode_value
+    """
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    value_type, value = value['type'], value['value']
+    if value_type == 'NaT':
+        return pd.NaT
+    if value_type == 'NA':
+        return pd.NA
+    if value_type == 'Timestamp':
+        return pd.Timestamp(value)
+    if value_type == 'Timedelta':
+        return pd.Timedelta(value)
+    if value_type == 'datetime':
+        return datetime.fromisoformat(value)
+    if value_type == 'date':
+        return date.fromisoformat(value)
+    if value_type == 'time':
+        return time.fromisoformat(value)
+    if value_type == 'timedelta':
+        return timedelta(*value)
+    if value_type == 'Decimal':
+        return Decimal(value)
+    if value_type == 'bytes':
+        return bytes.fromhex(value)
+    if value_type == 'tuple':
+        return tuple(decode_value(v) for v in value)
+    if value_type == 'dict':
+        return {decode_value(k): decode_value(v) for k, v in value}
+    raise ValueError("Unknown chunk value type {}".format(value_type))
+
+
+def encode_chunk(values: np.ndarray):
+    """
+    Returns the .npy bytes of a numpy array
+
+    Object arrays (strings, mixed types, ...) are encoded in JSON
+    (see encode_value), behind JSON_PREFIX
+    """
+    if values.dtype == object:
+        return JSON_PREFIX + json.dumps(
+            [encode_value(v) for v in values],
+            separators=(',', ':')).encode()
+    buf = io.BytesIO()
+    np.save(buf, values, allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_chunk(data):
+    """
+    Returns the numpy array saved in the given chunk bytes
+    (see encode_chunk)
+    """
+    data = bytes(data)
+    if data.startswith(JSON_PREFIX):
+        items = json.loads(data[len(JSON_PREFIX):].decode())
+        values = np.empty(len(items), dtype=object)
+        for i, item in enumerate(items):
+            values[i] = decode_value(item)
+        return values
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def chunk_id(data):
+    """
+    Returns the content hash identifying a chunk
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def get_column_values(col: pd.Series):
+    """
+    Returns the values of a column as a numpy array
+    (without copying them when possible)
+    """
+    return col.to_numpy()
+
+
+def split_column(col: pd.Series, chunk_rows=CHUNK_ROWS):
+    """
+    Returns the list of (chunk_id, data) tuples of a column
+
+    An empty column gives one empty chunk, so that all columns
+    of a dataframe always have at least one chunk
+    """
+    values = get_column_values(col)
+    chunks = []
+    for start in range(0, max(len(values), 1), chunk_rows):
+        data = encode_chunk(values[start:start + chunk_rows])
+        chunks.append((chunk_id(data), data))
+    return chunks
+
+
+def split_pandas(pd_obj, chunk_rows=CHUNK_ROWS):
+    """
+    Returns the dataframe with the index reset of a dataframe or series,
+    and the list of chunks of each of its columns (see split_column)
+    """
+    df = pd_obj.to_frame() if isinstance(pd_obj, pd.Series) else pd_obj
+    df = df.reset_index()
+    col_chunks = [
+        split_column(df.iloc[:, i], chunk_rows)
+        for i in range(len(df.columns))
+    ]
+    return df, col_chunks
+
+
+def join_column(chunks, dtype):
+    """
+    Rebuilds a column from its decoded chunks and its pandas dtype name
+    """
+    values = np.concatenate([decode_chunk(data) for data in chunks])
+    return pd.Series(values).astype(dtype)
+
+
+def join_pandas(obj_type, nlevels, clist, dtypes, col_chunks):
+    """
+    Rebuilds a dataframe or series (obj_type is the type name)
+    from the decoded chunks of each of its columns,
+    the first nlevels columns being the index (see split_pandas)
+    """
+    df = pd.DataFrame({
+        i: join_column(chunks, dtype)
+        for i, (chunks, dtype) in enumerate(zip(col_chunks, dtypes))
+    })
+    df.columns = clist
+    return restore_pandas(df, obj_type, nlevels)
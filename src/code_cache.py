@@ -0,0 +1,80 @@
+import os
+import marshal
+import hashlib
+import importlib.util
+from version import __version__
+"""
+On-disk cache of the compiled instrumented code of a script
+
+Like __pycache__, the code objects of the code blocks are saved with marshal
+in a __daggercache__ directory next to the script
+A cache entry is keyed by the hash of the source of the script,
+the blocks (with their loop logging policy), the modifier attribute functions,
+the default loop logging policy, the version of dagger
+and the marshal format of the python version
+"""
+
+CACHE_DIR = '__daggercache__'
+
+
+# Get the cache key of the instrumented code of a script
+def get_cache_key(source: bytes, blocks, modifier_attr_fcts, loop_policy):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(hashlib.blake2b(source).digest())
+    h.update(
+        repr([(block.start, block.end, block.loop_policy)
+              for block in blocks]).encode())
+    h.update(repr(sorted(set(modifier_attr_fcts))).encode())
+    h.update(repr(loop_policy).encode())
+    h.update(__version__.encode())
+    h.update(importlib.util.MAGIC_NUMBER)
+    return h.hexdigest()
+
+
+class CodeCache(object):
+    """
+    CodeCache class
+
+    Cache of the compiled code blocks of one script (see the module description)
+    A cached entry is a (code_splits, block_flags) tuple,
+    as created by run.instrument
+    Errors when reading or writing the cache are ignored,
+    the code is then compiled again
+    """
+    def __init__(self, script_path):
+        super(CodeCache, self).__init__()
+        self.script_path = script_path
+        self.cache_dir = os.path.join(
+            os.path.dirname(os.path.abspath(script_path)), CACHE_DIR)
+
+    # Get the path of the cache file of a key
+    def get_path(self, key):
+        return os.path.join(
+            self.cache_dir, '{}.{}.dagger'.format(
+                os.path.basename(self.script_path), key))
+
+    # Get the cached code blocks of a key, or None if there are none
+    def get(self, key):
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                code_splits, block_flags = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return list(code_splits), list(block_flags)
+
+    # Cache the code blocks of a key
+    # The file is written under a temporary name and then renamed,
+    # so that concurrent runs never read a partially written file
+    def put(self, key, code_splits, block_flags):
+        path = self.get_path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                marshal.dump((tuple(code_splits), tuple(block_flags)), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
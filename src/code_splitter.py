@@ -30,16 +30,13 @@ class CodeSplitter():
     # Returns the code of block between start_lineno and end_lineno
     def basic_split(self, tree: ast.Module, start_lineno: int,
                     end_lineno: int):
-        node = copy.deepcopy(tree)
-        new_body = []
-        if isinstance(node, ast.Module):
-            for elem in node.body:
-                if elem.lineno >= start_lineno and elem.lineno <= end_lineno:
-                    new_body.append(elem)
-            node.body = new_body
-        else:
+        if not isinstance(tree, ast.Module):
             raise TypeError("Argument must be a Module node")
-        return node
+        return ast.Module(body=[
+            copy.deepcopy(elem) for elem in tree.body
+            if elem.lineno >= start_lineno and elem.lineno <= end_lineno
+        ],
+                          type_ignores=[])
 
     # Returns a list of code blocks and
     # a flag list specifying whether each code block corresponds
@@ -47,6 +44,11 @@ class CodeSplitter():
     # Ex: if the blocklist was: ([12,23], [41,56]) and the code was 60 lines long,
     # the function would return code blocks with line numbers:
     # ([1,11], [12,23], [24,40], [41,56], [57,60]) and list of flags: [0,1,0,1,0]
+    # The top-level statements are put in the code blocks in one pass,
+    # finding the block of a statement with a binary search on the block starts
+    # (see BlockList.bisect)
+    # Only the statements of the blocks are copied, as the Logger modifies them,
+    # the code blocks in between share the statements of the given tree
     def split(self, tree: ast.Module, blocklist: BlockList = None):
         if blocklist is None:
             blocklist = self.blocklist
@@ -57,22 +59,37 @@ class CodeSplitter():
                 raise TypeError(
                     "second argument must be of type BlockList or convertable to it"
                 )
+        if not isinstance(tree, ast.Module):
+            raise TypeError("Argument must be a Module node")
         blocks = blocklist.get_blocks()
-        tree_splits = []
+        # Index of the code block of every block,
+        # and of the code block in between the block and the previous one
+        block_splits = []
+        gap_splits = []
         block_flags = []
         lineno = 0
         max_lineno = self.get_max_lineno(tree)
         for block in blocks:
+            gap_splits.append(len(block_flags) if lineno < block.start else None)
             if lineno < block.start:
-                tree_splits.append(
-                    self.basic_split(tree, lineno, block.start - 1))
                 block_flags.append(0)
-            tree_splits.append(self.basic_split(tree, block.start, block.end))
+            block_splits.append(len(block_flags))
             block_flags.append(1)
             lineno = block.end + 1
+        last_split = len(block_flags) if lineno <= max_lineno else None
         if lineno <= max_lineno:
-            tree_splits.append(self.basic_split(tree, lineno, max_lineno))
             block_flags.append(0)
+
+        bodies = [[] for _ in block_flags]
+        for elem in tree.body:
+            i = blocklist.bisect(elem.lineno)
+            if i >= 0 and elem.lineno <= blocks[i].end:
+                bodies[block_splits[i]].append(copy.deepcopy(elem))
+            else:
+                split = gap_splits[i + 1] if i + 1 < len(blocks) else last_split
+                if split is not None:
+                    bodies[split].append(elem)
+        tree_splits = [ast.Module(body=body, type_ignores=[]) for body in bodies]
         return tree_splits, block_flags
 
     def add_blocks(self, *blocks: Block):
@@ -82,22 +99,6 @@ class CodeSplitter():
         return self.blocklist.get_blocks()
 
     # Get the maximum line number of the given code
-    def get_max_lineno(self, tree: ast.AST):
-        class LineCounter(ast.NodeVisitor):
-            """docstring for LineCounter"""
-            def __init__(self):
-                super(LineCounter, self).__init__()
-                self.max_lineno = -1
-
-            def visit(self, node):
-                try:
-                    self.max_lineno = max(self.max_lineno, node.lineno)
-                except Exception as e:
-                    pass
-                self.generic_visit(node)
-
-            def count(self, tree):
-                self.visit(tree)
-                return self.max_lineno
-
-        return LineCounter().count(tree)
+    # (the last line of the last top-level statement)
+    def get_max_lineno(self, tree: ast.Module):
+        return max((elem.end_lineno for elem in tree.body), default=-1)
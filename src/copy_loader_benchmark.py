@@ -0,0 +1,73 @@
+import sys
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from dbConnection import connect, disconnect, get_engine
+from database_utils import copy_dataframe
+from dataframe_utils import get_df_type_map
+"""
+Benchmark comparing the two ways of saving a dataframe in its own table:
+ - pandas to_sql (row-wise inserts through an sqlalchemy engine)
+ - copy_dataframe (COPY FROM STDIN using an in-memory csv buffer)
+
+Usage:
+    python copy_loader_benchmark.py [number_of_rows]
+
+The benchmark tables are dropped at the end
+"""
+
+
+# Create a dataframe with the most common column types
+def make_df(n_rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'int_col': rng.integers(0, 1000, n_rows),
+        'float_col': rng.random(n_rows),
+        'str_col': rng.choice(['a', 'bb', 'ccc', 'dddd'], n_rows),
+        'date_col': pd.date_range('2020-01-01', periods=n_rows, freq='s'),
+    })
+
+
+def bench_to_sql(df, table_name):
+    engine = get_engine()
+    t1 = perf_counter()
+    df.to_sql(table_name, engine)
+    t2 = perf_counter()
+    return t2 - t1
+
+
+def bench_copy(df, table_name):
+    cur, conn = connect()
+    t1 = perf_counter()
+    df = df.reset_index()
+    copy_dataframe(cur, table_name, df, get_df_type_map(df))
+    conn.commit()
+    t2 = perf_counter()
+    disconnect(cur, conn)
+    return t2 - t1
+
+
+def drop_tables(*table_names):
+    cur, conn = connect()
+    for table_name in table_names:
+        cur.execute("DROP TABLE IF EXISTS {}".format(table_name))
+    disconnect(cur, conn)
+
+
+def main(n_rows):
+    df = make_df(n_rows)
+    tables = ('bench_to_sql', 'bench_copy')
+    drop_tables(*tables)
+    try:
+        dt_to_sql = bench_to_sql(df, tables[0])
+        dt_copy = bench_copy(df, tables[1])
+    finally:
+        drop_tables(*tables)
+    print("Rows: ", n_rows)
+    print("to_sql: {:.3f}s".format(dt_to_sql))
+    print("copy:   {:.3f}s".format(dt_copy))
+    print("speedup: {:.1f}x".format(dt_to_sql / dt_copy))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
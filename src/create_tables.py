@@ -10,70 +10,116 @@ This could maybe be changed by creating one table with an extra column
 specifying the object type instead of all the 
 
 Not sure which idea is better
+
+Every saved value belongs to a run (see prepare_run_tables)
+The tables of the saved values are partitioned by run, with one
+partition per run and table (named <table>_run_<run_id>),
+so a run is dropped or archived by detaching its partitions
+(see DbInterface.drop_run) instead of deleting its rows
 """
 
 
+# Runs of dagger: a run is created when a script starts being logged
+# The ended time is set when the run finishes, and the status is
+# 'running', 'finished' or 'archived' (its partitions were detached)
+# The dependencies of a run are the runs whose dataframe rows it reuses
+# (see DbInterface.save_dataframe_delta), when they are dropped
+# the rows it reuses are moved to it (see DbInterface.move_shared_rows)
+def prepare_run_tables():
+    sql = """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id serial PRIMARY KEY,
+                script text,
+                started timestamptz NOT NULL DEFAULT current_timestamp,
+                ended timestamptz,
+                status text NOT NULL DEFAULT 'running'
+            );
+            CREATE TABLE IF NOT EXISTS run_dependency (
+                run_id integer NOT NULL,
+                depends_on integer NOT NULL,
+                PRIMARY KEY (run_id, depends_on)
+            );
+            CREATE INDEX IF NOT EXISTS run_dependency_depends_on_idx
+                ON run_dependency (depends_on);
+        """
+    return sql
+
+
 # for scalar values ex: 4, 'a', True, 12.90
 # and for date, time and datetime types
 # (they are handled as scalar values)
 def prepare_scalar_tables():
     sql = """
             CREATE TABLE IF NOT EXISTS int_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value integer NOT NULL
-            );
+                value integer NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS float_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value double precision NOT NULL
-            );
+                value double precision NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS str_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value text NOT NULL
-            );
+                value text NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS bool_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value boolean NOT NULL
-            );
+                value boolean NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS date_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value date NOT NULL
-            );
+                value date NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS time_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value time NOT NULL
-            );
+                value time NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS datetime_scalar (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value timestamp NOT NULL
-            );
+                value timestamp NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
         """
     return sql
 
@@ -83,164 +129,330 @@ def prepare_scalar_tables():
 def prepare_scalar_array_tables():
     sql = """
             CREATE TABLE IF NOT EXISTS empty_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
-                name text NOT NULL
-            );
+                name text NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS int_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value integer array NOT NULL
-            );
+                value integer array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS float_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value double precision array NOT NULL
-            );
+                value double precision array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS str_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value text array NOT NULL
-            );
+                value text array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS bool_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value boolean array NOT NULL
-            );
+                value boolean array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS date_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value date array NOT NULL
-            );
+                value date array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS time_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value time array NOT NULL
-            );
+                value time array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS datetime_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
-                value timestamp array NOT NULL
-            );
+                value timestamp array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS compound_scalar_array (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 arr_type text NOT NULL,
                 name text NOT NULL,
                 types text array NOT NULL,
-                value text array NOT NULL
-            );
+                value text array NOT NULL,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
         """
     return sql
 
 
 # Pandas dataframes and series
+# (and the profiles of dataframes, series and numpy arrays)
+# The policy column is the logging policy used to save the value
+# (see logging_policies), NULL if the full value is saved
+# The rows of the dataframes saved with delta logging are keyed by
+# a hash of their index values (index_key), the last row of every
+# index_key of a variable is in dataframe_max_rid
 def prepare_pandas_tables():
     sql = """
             CREATE TABLE IF NOT EXISTS dataframe_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value serial NOT NULL
-            );
+                value serial NOT NULL,
+                nlevels integer NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS series_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
-                value serial NOT NULL
-            );
+                value serial NOT NULL,
+                nlevels integer NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS dataframe_delta_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
+                nlevels integer NOT NULL,
                 rlist integer array NOT NULL,
-                clist text array NOT NULL
-            );
+                clist text array NOT NULL,
+                names text array NOT NULL,
+                freq text,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS dataframe_data (
-                rid serial PRIMARY KEY,
-                index bigint NOT NULL
+                rid serial,
+                run_id integer NOT NULL,
+                index_key bigint NOT NULL,
+                PRIMARY KEY (run_id, rid)
+            ) PARTITION BY LIST (run_id);
+            CREATE TABLE IF NOT EXISTS dataframe_column (
+                col_id serial UNIQUE,
+                name text PRIMARY KEY,
+                type text NOT NULL
             );
-            CREATE TABLE IF NOT EXISTS dataframe_max_rid (
-                index bigint PRIMARY KEY,
-                max_rid integer NOT NULL
+            CREATE TABLE IF NOT EXISTS dataframe_fingerprint (
+                run_id integer NOT NULL,
+                rid integer NOT NULL,
+                index_key bigint NOT NULL,
+                fingerprint bigint NOT NULL,
+                checksum bigint NOT NULL
+            ) PARTITION BY LIST (run_id);
+            CREATE INDEX IF NOT EXISTS dataframe_fingerprint_rid_idx
+                ON dataframe_fingerprint (rid);
+            CREATE INDEX IF NOT EXISTS dataframe_fingerprint_index_fingerprint_idx
+                ON dataframe_fingerprint (index_key, fingerprint);
+            CREATE INDEX IF NOT EXISTS dataframe_fingerprint_fingerprint_idx
+                ON dataframe_fingerprint (fingerprint);
+            CREATE TABLE IF NOT EXISTS dataframe_chunk_object (
+                id serial,
+                run_id integer NOT NULL,
+                s_id integer,
+                t timestamptz NOT NULL DEFAULT current_timestamp,
+                lineno integer NOT NULL,
+                name text NOT NULL,
+                obj_type text NOT NULL,
+                nlevels integer NOT NULL,
+                nrows bigint NOT NULL,
+                clist text array NOT NULL,
+                dtypes text array NOT NULL,
+                chunks text array NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
+            CREATE TABLE IF NOT EXISTS dataframe_chunk (
+                chunk_id text PRIMARY KEY,
+                data bytea NOT NULL
             );
+            CREATE TABLE IF NOT EXISTS profile_object (
+                id serial,
+                run_id integer NOT NULL,
+                s_id integer,
+                t timestamptz NOT NULL DEFAULT current_timestamp,
+                lineno integer NOT NULL,
+                name text NOT NULL,
+                obj_type text NOT NULL,
+                nrows bigint NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
+            CREATE TABLE IF NOT EXISTS column_profile (
+                run_id integer NOT NULL,
+                profile_id integer NOT NULL,
+                position integer NOT NULL,
+                column_name text NOT NULL,
+                dtype text NOT NULL,
+                count bigint NOT NULL,
+                null_count bigint NOT NULL,
+                distinct_count bigint NOT NULL,
+                min double precision,
+                max double precision,
+                mean double precision,
+                std double precision,
+                quantiles double precision array,
+                hll bytea NOT NULL,
+                PRIMARY KEY (run_id, profile_id, position)
+            ) PARTITION BY LIST (run_id);
+            CREATE TABLE IF NOT EXISTS dataframe_max_rid (
+                run_id integer NOT NULL,
+                name text NOT NULL,
+                index_key bigint NOT NULL,
+                max_rid integer NOT NULL,
+                PRIMARY KEY (run_id, name, index_key)
+            ) PARTITION BY LIST (run_id);
         """
     return sql
 
 
 # Numpy arrays for 0d, 1d and 2d arrays
+# (policy column: see prepare_pandas_tables)
 def prepare_numpy_tables():
     sql = """
             CREATE TABLE IF NOT EXISTS np_0d_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
                 value serial NOT NULL,
-                dtype text NOT NULL
-            );
+                dtype text NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS np_1d_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
                 value serial NOT NULL,
-                dtype text NOT NULL
-            );
+                dtype text NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
             CREATE TABLE IF NOT EXISTS np_2d_object (
-                id serial PRIMARY KEY,
+                id serial,
+                run_id integer NOT NULL,
                 s_id integer,
                 t timestamptz NOT NULL DEFAULT current_timestamp,
                 lineno integer NOT NULL,
                 name text NOT NULL,
                 value serial NOT NULL,
-                dtype text NOT NULL
-            );
+                dtype text NOT NULL,
+                policy text,
+                PRIMARY KEY (run_id, id)
+            ) PARTITION BY LIST (run_id);
         """
     return sql
 
 
+# Tables where the logged objects are saved, with the columns
+# id, s_id, t, lineno and name (one row per logged value)
+OBJECT_TABLES = [
+    'int_scalar', 'float_scalar', 'str_scalar', 'bool_scalar', 'date_scalar',
+    'time_scalar', 'datetime_scalar', 'empty_array', 'int_scalar_array',
+    'float_scalar_array', 'str_scalar_array', 'bool_scalar_array',
+    'date_scalar_array', 'time_scalar_array', 'datetime_scalar_array',
+    'compound_scalar_array', 'dataframe_object', 'series_object',
+    'dataframe_delta_object', 'dataframe_chunk_object', 'profile_object',
+    'np_0d_object', 'np_1d_object', 'np_2d_object'
+]
+
+
+# Tables partitioned by run, the partitions are created
+# when a run starts (see DbInterface.create_partitions)
+# The tables of the dataframe columns saved with delta logging
+# (dataframe_column_<col_id>) are partitioned by run as well
+PARTITIONED_TABLES = OBJECT_TABLES + [
+    'dataframe_data', 'dataframe_fingerprint', 'dataframe_max_rid',
+    'column_profile'
+]
+
+
+# Indexes of the object tables on the lookup path of a variable:
+# its name, then the split, then the time and line of the saved values
+# (ex: the history of a variable, or its last value before a time)
+def prepare_object_indexes(tables=OBJECT_TABLES):
+    return ''.join("""
+            CREATE INDEX IF NOT EXISTS {0}_lookup_idx
+                ON {0} (name, s_id, t, lineno);""".format(table)
+                   for table in tables)
+
+
+# View of all the saved objects: the table and id of the saved values
+# of every variable, with their run, split, time and line
+# The conditions on the view are applied to every object table,
+# so the lookups of a variable use the indexes of the tables
+def prepare_catalog_view(tables=OBJECT_TABLES):
+    return """
+            CREATE OR REPLACE VIEW variable_catalog AS
+{};
+        """.format('\n                UNION ALL\n'.join(
+        """                SELECT '{0}' AS table_name, run_id, id, s_id, t, lineno, name
+                FROM {0}""".format(table) for table in tables))
+
+
 # Tables used for testing
 def prepare_test_tables():
     sql = """
@@ -267,10 +479,13 @@ def prepare_test_tables():
 # List of all needed statements to fully create the database
 def get_create_statements():
     sql_stmts = []
+    sql_stmts.append(prepare_run_tables())
     sql_stmts.append(prepare_scalar_tables())
     sql_stmts.append(prepare_scalar_array_tables())
     sql_stmts.append(prepare_pandas_tables())
     sql_stmts.append(prepare_numpy_tables())
+    sql_stmts.append(prepare_object_indexes())
+    sql_stmts.append(prepare_catalog_view())
     sql_stmts.append(prepare_test_tables())
     return sql_stmts
 
@@ -1,3 +1,11 @@
+import io
+import pandas as pd
+from dataframe_utils import psql_read_dtypes, read_psql_column
+
+# Number of dataframe rows sent per COPY statement
+COPY_CHUNK_SIZE = 100000
+
+
 def get_db_cols(cur, table_name, schema='public', type_map=True):
     """
     Gets the column names of a given table
@@ -9,7 +17,8 @@ def get_db_cols(cur, table_name, schema='public', type_map=True):
     db_cols_sql = """SELECT column_name, data_type 
         FROM information_schema.columns 
         WHERE table_schema = '{}' 
-        AND table_name   = '{}';
+        AND table_name   = '{}'
+        ORDER BY ordinal_position;
     """.format(schema, table_name)
     cur.execute(db_cols_sql)
     res_rows = [row for row in cur][1:]
@@ -28,6 +37,90 @@ def add_columns(cur, table_name, new_columns, type_map):
     """
     alter_sql = "ALTER TABLE {} {};".format(
         table_name, ','.join(
-            map(lambda x: 'ADD COLUMN {} {}'.format(x, type_map.get(x)),
+            map(lambda x: 'ADD COLUMN IF NOT EXISTS {} {}'.format(x, type_map.get(x)),
                 new_columns)))
     cur.execute(alter_sql)
+
+
+def quote_ident(name):
+    """
+    Quotes a column or table name, so that names
+    with spaces, upper case letters, ... can be used
+    """
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def copy_rows(cur, table_name, df, columns=None):
+    """
+    Loads the rows of a dataframe in an existing table
+    with COPY FROM STDIN statements
+
+    The rows are written as csv to an in-memory buffer,
+    COPY_CHUNK_SIZE rows at a time
+
+    'columns' are the table columns receiving the dataframe columns,
+    by default the dataframe column names are used
+    """
+    if columns is None:
+        columns = df.columns
+    copy_sql = "COPY {}({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+        table_name, ','.join(map(quote_ident, columns)))
+    for start in range(0, len(df), COPY_CHUNK_SIZE):
+        buf = io.StringIO()
+        df.iloc[start:start + COPY_CHUNK_SIZE].to_csv(buf,
+                                                      header=False,
+                                                      index=False,
+                                                      na_rep='\\N')
+        buf.seek(0)
+        cur.copy_expert(copy_sql, buf)
+
+
+def copy_dataframe(cur, table_name, df, type_map):
+    """
+    Creates a new table with the columns of the dataframe
+    and loads the dataframe rows with COPY FROM STDIN statements
+
+    'type_map' is a dictionary mapping the columns name 
+    to the corresponding postgres column type
+    """
+    create_sql = "CREATE TABLE {} ({});".format(
+        table_name, ','.join(
+            map(lambda x: '{} {}'.format(quote_ident(x), type_map.get(x)),
+                df.columns)))
+    cur.execute(create_sql)
+    copy_rows(cur, table_name, df)
+
+
+def copy_query(cur, query, type_map, args=None):
+    """
+    Runs a query with a COPY TO STDOUT statement
+    and returns its result rows as a dataframe
+
+    The result is read as csv in one pass, and the columns
+    are converted with their postgres type (see read_psql_column)
+
+    'type_map' is a dictionary mapping the result columns names,
+    in the order of the query, to their postgres column types
+    """
+    copy_sql = "COPY ({}) TO STDOUT WITH (FORMAT csv, NULL '\\N')".format(
+        cur.mogrify(query, args).decode())
+    buf = io.StringIO()
+    cur.copy_expert(copy_sql, buf)
+    buf.seek(0)
+    cols = list(type_map)
+    df = pd.read_csv(buf,
+                     header=None,
+                     names=list(range(len(cols))),
+                     dtype={
+                         i: psql_read_dtypes.get(type_map[col], object)
+                         for i, col in enumerate(cols)
+                     },
+                     na_values=['\\N'],
+                     keep_default_na=False,
+                     float_precision='round_trip')
+    return pd.DataFrame(
+        {
+            i: read_psql_column(df[i], type_map[col])
+            for i, col in enumerate(cols)
+        },
+        index=df.index).set_axis(cols, axis='columns')
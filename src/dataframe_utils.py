@@ -12,6 +12,7 @@ conversion_table = {
     float: 'double precision',
     str: 'text',
     bool: 'bool',
+    np.bool_: 'bool',
     date: 'date',
     time: 'time',
     datetime: 'timestamp without time zone',
@@ -30,6 +31,75 @@ conversion_table = {
     pd.Categorical: 'text'
 }
 
+# Default key of the row fingerprints (see hash_df_rows)
+HASH_KEY = '0123456789123456'
+
+"""
+Dictionary with the pandas types used to read the columns
+of some postgres types (see read_psql_column)
+
+Columns of the other types are read as text
+"""
+psql_read_dtypes = {
+    'smallint': 'Int16',
+    'integer': 'Int32',
+    'bigint': 'Int64',
+    'real': 'float32',
+    'double precision': 'float64',
+}
+
+
+def get_df_data(df: pd.DataFrame):
+    """
+    Returns a new dataframe with the index levels as first columns
+    and lower case column names, as it is saved in the database,
+    and a dictionary mapping each column name to the
+    corresponding postgres column type
+    """
+    df_2 = df.reset_index(
+    )  # Make new columns corresponding to the index levels, to save them too.
+    df_2 = df_2.rename(str.lower, axis='columns')
+    return df_2, get_df_type_map(df_2)
+
+
+def restore_pandas(df: pd.DataFrame, obj_type, nlevels):
+    """
+    Returns the dataframe or series (obj_type is the type name)
+    saved as the given dataframe, with its index
+    as the first nlevels columns (see get_df_data)
+
+    The default names given by reset_index and to_frame
+    to unnamed indexes and series are removed
+    """
+    df = df.set_index(list(df.columns[:nlevels]))
+    df.index.names = [
+        None if is_default_name(name) else name for name in df.index.names
+    ]
+    if obj_type.lower() == 'series':
+        series = df.iloc[:, -1]
+        if str(series.name) == '0':
+            series.name = None
+        return series
+    return df
+
+
+def is_default_name(name):
+    """
+    Checks if a column name is the name given by reset_index
+    to an unnamed index level
+    """
+    return name == 'index' or (isinstance(name, str) and
+                               name.startswith('level_') and
+                               name[len('level_'):].isdigit())
+
+
+def get_df_rows(df: pd.DataFrame):
+    """
+    Returns the list of rows of the dataframe as tuples
+    """
+    return [tuple(r) for r in df.values.astype(object)
+            ]  # cast to type, to get only python types instead of numpy types
+
 
 def get_df_cols_rows(df: pd.DataFrame, type_map=True):
     """
@@ -40,15 +110,114 @@ def get_df_cols_rows(df: pd.DataFrame, type_map=True):
     mapping each column name to the corresponding 
     postgres column type
     """
-    df_2 = df.copy()
-    df_2.reset_index(
-        level=0, inplace=True
-    )  # Make new column corresponding to the index, to save it too.
-    df_2 = df_2.rename(str.lower, axis='columns')
+    df_2, df_type_map = get_df_data(df)
     columns = list(df_2.columns.values)
-    rows = [tuple(r) for r in df_2.values.astype(object)
-            ]  # cast to type, to get only python types instead of numpy types
+    rows = get_df_rows(df_2)
     if type_map:
-        s = df_2.dtypes.map(lambda x: conversion_table.get(x.type, 'text'))
-        return columns, rows, s.to_dict()
-    return columns, rows
\ No newline at end of file
+        return columns, rows, df_type_map
+    return columns, rows
+
+
+def get_df_type_map(df: pd.DataFrame):
+    """
+    Returns a dictionary mapping each column name
+    of the dataframe to the corresponding postgres column type
+    """
+    s = df.dtypes.map(lambda x: conversion_table.get(x.type, 'text'))
+    return s.to_dict()
+
+
+def read_psql_column(col: pd.Series, psql_type):
+    """
+    Converts a column read from postgres as text
+    (or with its psql_read_dtypes type) to the pandas
+    column type corresponding to its postgres type
+
+    Integer columns with null values become float columns,
+    like in pandas
+    """
+    if psql_type in ('smallint', 'integer', 'bigint'):
+        if col.isna().any():
+            return col.astype('float64')
+        return col.astype(col.dtype.numpy_dtype)
+    elif psql_type in ('bool', 'boolean'):
+        col = col.map({'t': True, 'f': False})
+        return col if col.isna().any() else col.astype(bool)
+    elif psql_type == 'timestamp without time zone':
+        return pd.to_datetime(col)
+    elif psql_type == 'timestamp with time zone':
+        return pd.to_datetime(col, utc=True)
+    elif psql_type == 'date':
+        return col.map(date.fromisoformat, na_action='ignore')
+    elif psql_type in ('time', 'time without time zone'):
+        return col.map(time.fromisoformat, na_action='ignore')
+    elif psql_type == 'interval':
+        return pd.to_timedelta(col)
+    return col.where(col.notna(), None)
+
+
+def round_significant(values, digits):
+    """
+    Rounds floats to the given number of significant digits,
+    on a whole array at once (the result can differ in the last bit
+    from float(format(x, '.{digits}g')), but the same input values
+    always give the same output)
+
+    NaN values are all replaced by the same NaN value,
+    so that they all have the same bytes (and hash)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        mag = np.floor(np.log10(np.abs(values)))
+        mag = np.where(np.isfinite(mag), mag, 0)
+        scale = np.power(10.0, digits - 1 - mag)
+        rounded = np.round(values * scale) / scale
+    rounded = np.where(np.isfinite(rounded), rounded, values)
+    return np.where(np.isnan(values), np.nan, rounded)
+
+
+def normalize_column(col: pd.Series, psql_type):
+    """
+    Converts a column to a canonical representation
+    depending on its equivalent postgres type
+
+    This is used to be able to compare new (from the new dataframe) 
+    and old (from the database) dataframe rows using their hashes,
+    the same values give the same representation on both sides
+    """
+    if psql_type == 'real':
+        return round_significant(col, 6)
+    elif psql_type == 'double precision':
+        return round_significant(col, 15)
+    elif psql_type in ('smallint', 'integer', 'bigint'):
+        return pd.array(col, dtype='Int64')
+    elif psql_type == 'timestamp without time zone':
+        return pd.to_datetime(col).to_numpy(dtype='datetime64[ns]')
+    else:
+        return col.where(col.notna(), 'NaN').astype(str).to_numpy()
+
+
+def hash_df_rows(df: pd.DataFrame, type_map, hash_key=HASH_KEY):
+    """
+    Returns an array with a 64-bit fingerprint of every row of the dataframe
+
+    The columns are normalized using their postgres type
+    (see normalize_column) and hashed column by column,
+    without converting the rows to python objects
+
+    'type_map' is a dictionary mapping the columns name 
+    to the corresponding postgres column type
+
+    'hash_key' is the 16 characters key of the hash function,
+    other keys give independent fingerprints of the same rows
+    """
+    normalized = pd.DataFrame(
+        {
+            i: normalize_column(df[col], type_map.get(col))
+            for i, col in enumerate(df.columns)
+        },
+        index=pd.RangeIndex(len(df)))
+    if len(normalized.columns) == 0:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(normalized, index=False,
+                                      hash_key=hash_key).to_numpy()
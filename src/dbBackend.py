@@ -0,0 +1,532 @@
+import os
+import json
+import contextlib
+import numpy as np
+import pandas as pd
+from dbObject import DbObject
+from dbWriter import DbWriter
+from profile_utils import Profile, ColumnProfile
+from dataframe_utils import restore_pandas
+from chunk_utils import join_pandas
+from fingerprint_utils import get_fingerprint
+from datetime import date, time, datetime
+from array_utils import ArrayType, get_array_type, get_element_types, \
+    convert_scalar, load_array
+
+
+class DbBackend(object):
+    """
+    DbBackend class
+
+    Base class of the storage backends saving DbObject instances
+    (DbInterface for postgresql, SqliteInterface for a local sqlite file)
+
+    Handles the split id, the dispatch of the objects
+    to the save functions and the asynchronous logging
+
+    A backend implements:
+     - open and close: connect and disconnect the storage
+     - insert_rows: insert multiple rows in a table
+     - save_pandas and save_numpy
+     - fetch_rows and read_table: read rows and saved tables
+    Scalars and array-likes are saved as rows built by
+    get_scalar_insert and get_array_like_insert
+
+    The saved values are loaded back with load (see load_row)
+
+    Every saved value belongs to a run (see create_tables): a run is
+    started with start_run, or when the first value is saved
+    Worker processes saving in the same run get its id with set_run_id
+    """
+    scalar_classes = [int, float, str, bool, date, time, datetime]  # complex?
+    array_like_classes = [list, tuple, set, frozenset]
+    dict_class = [dict]  # Not handled yet
+    pandas_classes = [pd.DataFrame, pd.Series]
+    numpy_classes = [np.ndarray]
+    # Query parameter placeholder of the backend
+    placeholder = '%s'
+
+    def __init__(self, async_logging=False, queue_size=1000, batch_size=500):
+        super(DbBackend, self).__init__()
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.conn = None
+        self.split_id = None
+        self.run_id = None
+        self.writer = None
+        self.async_errors = []
+        self.concurrent = False
+        self.policies = {}
+        self.skip_unchanged = False
+        self.pid = None
+        self.fingerprints = {}
+        self.profiler = None
+
+    # Disconnect without committing if the instance is deleted
+    def __del__(self):
+        if self.conn is not None:
+            self.disconnect(False)
+
+    # when deepcopying the globals,
+    # just return the same backend instance
+    def __deepcopy__(self, memo):
+        return self
+
+    # Connect to the storage
+    # raises an exception if the connection fails
+    def connect(self):
+        self.open()
+        self.pid = os.getpid()
+        self.fingerprints = {}
+        if self.async_logging:
+            self.writer = DbWriter(self, self.queue_size, self.batch_size)
+            self.writer.start()
+
+    # Diconnect from the storage and commit the changes
+    # The background writer is stopped after writing the queued objects
+    # The storage is disconnected even if the writer failed
+    def disconnect(self, commit=True):
+        writer, self.writer = self.writer, None
+        try:
+            if writer is not None:
+                try:
+                    writer.close()
+                finally:
+                    self.async_errors.extend(writer.errors)
+        finally:
+            self.close(commit)
+
+    def open(self):
+        raise NotImplementedError()
+
+    def close(self, commit=True):
+        raise NotImplementedError()
+
+    # Wait until all the objects queued by asynchronous logging are written
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    # Get the (obj, exception) tuples of the objects
+    # that the background writer failed to save
+    def get_async_errors(self):
+        if self.writer is not None:
+            return self.async_errors + self.writer.errors
+        return list(self.async_errors)
+
+    # Commit the changes (Could be called after each save call if needed)
+    def commit(self):
+        if self.conn is not None:
+            self.conn.commit()
+
+    # Roll back the changes that are not committed
+    def rollback(self):
+        if self.conn is not None:
+            self.conn.rollback()
+        self.discard_caches()
+
+    # Get a context manager undoing the changes made in its block
+    # if it raises, but not the changes made before
+    # (with postgresql, a failed statement aborts the whole transaction)
+    @contextlib.contextmanager
+    def savepoint(self):
+        self.execute("SAVEPOINT dagger_save")
+        try:
+            yield
+        except Exception:
+            self.execute("ROLLBACK TO SAVEPOINT dagger_save")
+            self.discard_caches()
+            raise
+        self.execute("RELEASE SAVEPOINT dagger_save")
+
+    # Forget what is known about the saved rows
+    # when the changes are rolled back
+    def discard_caches(self):
+        pass
+
+    # Set when other processes save in the same storage at the same time
+    # (parallel execution of split partitions): the saves are then
+    # committed right away, so that the locks on the shared tables
+    # are not kept until the end of the run
+    def set_concurrent(self, concurrent):
+        self.concurrent = concurrent
+
+    # Set the logging policies of the dataframes, series and numpy arrays
+    # as a dictionary mapping variable names to LoggingPolicy instances,
+    # the policy with the key None is used for the other variables
+    def set_logging_policies(self, policies):
+        self.policies = dict(policies or {})
+
+    # Skip saving values that didn't change since they were last saved or not
+    def set_skip_unchanged(self, skip_unchanged):
+        self.skip_unchanged = skip_unchanged
+
+    # Set the profiler recording the save and database times (see profiler)
+    # It must be set before connecting, None to stop profiling
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+
+    # Get a context manager timing the saving of the given objects
+    # with the profiler (does nothing without profiler)
+    def profile_save(self, objs):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.save_timer(objs)
+
+    # Get the logging policy of a variable (None if the full value is saved)
+    def get_policy(self, name):
+        return self.policies.get(name, self.policies.get(None))
+
+    # Replace the value of a dataframe, series or numpy object
+    # by the part of it to save, according to its logging policy
+    # (or by its profile, see profile_utils)
+    # The policy is saved with the object
+    def apply_policy(self, obj: DbObject):
+        policy = self.get_policy(obj.name)
+        if policy is None or policy.is_full():
+            return
+        obj.value = policy.apply(obj.value)
+        obj.policy = str(policy)
+
+    # Start a new run, with the name of the logged script
+    # Returns the id of the run
+    # The values saved in another run are not compared with skip_unchanged
+    def start_run(self, script=None):
+        self.run_id = self.create_run(script)
+        self.fingerprints = {}
+        return self.run_id
+
+    # Set the end time and status of the current run
+    def end_run(self, status='finished'):
+        if self.run_id is None:
+            return
+        self.flush()
+        p = self.placeholder
+        self.execute("UPDATE runs SET ended = {}, status = {} WHERE run_id = {}".
+                     format(p, p, p), (datetime.now().astimezone(), status,
+                                       self.run_id))
+        self.commit()
+
+    # Set the id of the run the values are saved in
+    # (a run started by another process, ex: parallel execution)
+    def set_run_id(self, run_id):
+        self.run_id = run_id
+
+    # Get the runs as dictionaries, by run id
+    def get_runs(self):
+        return self.fetch_rows("SELECT * FROM runs ORDER BY run_id")
+
+    # Get the storage savings of delta logging for every run
+    # (see DbInterface.get_storage_savings), none without delta logging
+    def get_storage_savings(self):
+        return []
+
+    # Insert a new run and prepare its storage, returns its id
+    def create_run(self, script):
+        raise NotImplementedError()
+
+    # Drop the values saved in a run
+    # With archive, the values are kept outside of the saved values
+    # instead of being removed (with postgresql, in detached partitions)
+    def drop_run(self, run_id, archive=False):
+        raise NotImplementedError()
+
+    # Execute a statement without result
+    def execute(self, sql, args=()):
+        raise NotImplementedError()
+
+    # Set the current split id
+    def set_split_id(self, split_id: int):
+        if isinstance(split_id, int):
+            if split_id >= 0:
+                self.split_id = split_id
+            else:
+                raise ValueError("split_id must be positive")
+        else:
+            raise TypeError("split_id must be an integer")
+
+    # Set the current split id to None
+    def reset_split_id(self):
+        self.split_id = None
+
+    # Save a DbObject
+    # The current run and split ids are saved with the object
+    # Dataframes, series and numpy arrays are reduced by their logging policy
+    # With asynchronous logging, a snapshot of the object is queued,
+    # otherwise the object is saved directly
+    # With skip_unchanged, the object is not saved if the variable
+    # has the same content as the last time it was saved in this split
+    # Returns False if the object was skipped, True otherwise
+    # If the type of the object is not handled, raise a TypeError
+    def save(self, obj: DbObject):
+        if not self.is_handled(obj):
+            raise TypeError("Obj type is not handled yet")
+        # A worker process saves its partition with its own backend, a value
+        # saved with the backend of the parent would have no split id
+        if self.pid is not None and self.pid != os.getpid():
+            raise RuntimeError("Backend used outside of the process "
+                               "that connected it")
+        if self.run_id is None:
+            self.start_run()
+        obj.s_id = self.split_id
+        fingerprint = None
+        if self.skip_unchanged:
+            fingerprint = get_fingerprint(obj.value)
+            key = (obj.name, obj.s_id)
+            if fingerprint is not None and \
+                    self.fingerprints.get(key) == fingerprint:
+                return False
+        if obj.type in self.pandas_classes or obj.type in self.numpy_classes:
+            self.apply_policy(obj)
+        if self.writer is not None:
+            self.writer.put(obj.snapshot())
+        else:
+            self.save_now(obj)
+            if self.concurrent:
+                self.commit()
+        if fingerprint is not None:
+            self.fingerprints[key] = fingerprint
+        return True
+
+    def is_handled(self, obj: DbObject):
+        return obj.type in self.scalar_classes or \
+            obj.type in self.array_like_classes or \
+            obj.type in self.pandas_classes or \
+            obj.type in self.numpy_classes
+
+    # Save a DbObject
+    # If the type of the object is handled,
+    # call the corresponding function
+    # Otherwise, raise a TypeError
+    def save_now(self, obj: DbObject):
+        with self.profile_save([obj]):
+            if isinstance(obj.value, Profile):
+                self.save_profile(obj)
+            elif obj.type in self.scalar_classes:
+                self.save_scalar(obj)
+            elif obj.type in self.array_like_classes:
+                self.save_array_like(obj)
+            # elif obj.type in self.dict_class:
+            #     self.save_dict(obj)
+            elif obj.type in self.pandas_classes:
+                self.save_pandas(obj)
+            elif obj.type in self.numpy_classes:
+                self.save_numpy(obj)
+            else:
+                raise TypeError("Obj type is not handled yet")
+
+    # Get the insert needed to save a scalar or array-like object
+    # as a (table, columns, rows) tuple
+    # Returns None for the other objects, as they can't be
+    # saved using a simple row insert
+    def get_insert(self, obj: DbObject):
+        if obj.type in self.scalar_classes:
+            return self.get_scalar_insert(obj)
+        elif obj.type in self.array_like_classes:
+            return self.get_array_like_insert(obj)
+        return None
+
+    # Insert multiple rows in a table
+    def insert_rows(self, table, cols, rows):
+        raise NotImplementedError()
+
+    def save_scalar(self, obj: DbObject):
+        self.insert_rows(*self.get_scalar_insert(obj))
+
+    def get_scalar_insert(self, obj: DbObject):
+        table = "{}_scalar".format(obj.type.__name__)
+        cols = ('run_id', 's_id', 't', 'lineno', 'name', 'value')
+        args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+                obj.value)
+        return table, cols, [args]
+
+    def save_array_like(self, obj: DbObject):
+        self.insert_rows(*self.get_array_like_insert(obj))
+
+    def get_array_like_insert(self, obj: DbObject):
+        try:
+            arr_type = get_array_type(obj.value)
+        except Exception as e:
+            raise e
+        else:
+            cols = ('run_id', 's_id', 't', 'lineno', 'arr_type', 'name')
+            args = (self.run_id, obj.s_id, obj.time, obj.lineno,
+                    type(obj.value).__name__, obj.name)
+            arr = list(obj.value)
+            if arr_type is ArrayType.EMPTY:
+                table = "empty_array"
+            elif arr_type is ArrayType.COMPOUND:
+                table = "compound_scalar_array"
+                cols += ('types', 'value')
+                args += (get_element_types(arr), list(map(str, arr)))
+            else:
+                table = "{}_scalar_array".format(type(arr[0]).__name__)
+                cols += ('value', )
+                args += (arr, )
+            return table, cols, [args]
+
+    def save_pandas(self, obj: DbObject):
+        raise NotImplementedError()
+
+    def save_numpy(self, obj: DbObject):
+        raise NotImplementedError()
+
+    # Save the profile of a dataframe, series or numpy array
+    def save_profile(self, obj: DbObject):
+        raise NotImplementedError()
+
+    # Get the rows of a query as dictionaries
+    def fetch_rows(self, sql, args=()):
+        raise NotImplementedError()
+
+    # Get the saved table of a dataframe, series or numpy array
+    # as a dataframe, in the order of its rows
+    def read_table(self, table_name):
+        raise NotImplementedError()
+
+    # Get the name of the table where the value of a dataframe,
+    # series or numpy object row is saved
+    def get_value_table(self, table, row):
+        raise NotImplementedError()
+
+    # Find the saved object of a variable as a (table, row) tuple,
+    # or None if there is none
+    # The object is the last one saved in the given split
+    # (None for the code executed before the split),
+    # at the given line and/or at or before the given time,
+    # in the given run or in any run
+    # The object is found in the variable_catalog view (see create_tables),
+    # with the lookup indexes of the object tables
+    def find_object(self, name, lineno=None, t=None, split_id=None,
+                    run_id=None):
+        p = self.placeholder
+        conditions = ["name = {}".format(p)]
+        args = [name]
+        if run_id is not None:
+            conditions.append("run_id = {}".format(p))
+            args.append(run_id)
+        if split_id is None:
+            conditions.append("s_id IS NULL")
+        else:
+            conditions.append("s_id = {}".format(p))
+            args.append(split_id)
+        if lineno is not None:
+            conditions.append("lineno = {}".format(p))
+            args.append(lineno)
+        if t is not None:
+            conditions.append("t <= {}".format(p))
+            args.append(t)
+        rows = self.fetch_rows(
+            """SELECT table_name, run_id, id FROM variable_catalog WHERE {}
+            ORDER BY t DESC, id DESC LIMIT 1""".format(
+                ' AND '.join(conditions)), args)
+        if len(rows) == 0:
+            return None
+        table = rows[0]['table_name']
+        return table, self.fetch_rows(
+            "SELECT * FROM {} WHERE run_id = {} AND id = {}".format(
+                table, p, p), (rows[0]['run_id'], rows[0]['id']))[0]
+
+    # Load the saved value of a variable (see find_object)
+    # The value is rebuilt with its original type
+    # If no value was saved, raise a KeyError
+    def load(self, name, lineno=None, t=None, split_id=None, run_id=None):
+        self.flush()
+        found = self.find_object(name, lineno, t, split_id, run_id)
+        if found is None:
+            raise KeyError(
+                "No value saved for {} (lineno: {}, t: {}, split_id: {}, "
+                "run_id: {})".format(name, lineno, t, split_id, run_id))
+        return self.load_row(*found)
+
+    # Rebuild the value of a saved object from its table and row
+    # Values saved with a logging policy are rebuilt as they were saved
+    # (the sampled rows, or the Profile for the summary policy)
+    def load_row(self, table, row):
+        if table.endswith('_scalar'):
+            return convert_scalar(table[:-len('_scalar')], row['value'])
+        elif table == 'empty_array':
+            return load_array(row['arr_type'], [], [])
+        elif table == 'compound_scalar_array':
+            return load_array(row['arr_type'],
+                              self.decode_array(row['value']),
+                              self.decode_array(row['types']))
+        elif table.endswith('_scalar_array'):
+            return load_array(row['arr_type'],
+                              self.decode_array(row['value']),
+                              table[:-len('_scalar_array')])
+        elif table in ('dataframe_object', 'series_object'):
+            df = self.read_table(self.get_value_table(table, row))
+            return restore_pandas(df, table[:-len('_object')],
+                                  row['nlevels'])
+        elif table == 'dataframe_delta_object':
+            return self.load_dataframe_delta(row)
+        elif table == 'dataframe_chunk_object':
+            return self.load_pandas_chunks(row)
+        elif table.startswith('np_'):
+            return self.load_numpy(table, row)
+        elif table == 'profile_object':
+            return self.load_profile(row)
+        raise TypeError("Unknown object table: {}".format(table))
+
+    # Get an array column value as a list
+    # (arrays are saved as json text by some backends)
+    def decode_array(self, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return list(value)
+
+    def load_dataframe_delta(self, row):
+        raise NotImplementedError()
+
+    # Get the data of the given chunks as a dictionary (chunk id -> data)
+    def read_chunks(self, chunk_ids):
+        raise NotImplementedError()
+
+    # Rebuild a dataframe or series from its chunk manifest
+    # (with sqlite, the chunk lists of the columns are encoded separately)
+    def load_pandas_chunks(self, row):
+        col_chunks = [
+            self.decode_array(chunks)
+            for chunks in self.decode_array(row['chunks'])
+        ]
+        data = self.read_chunks(
+            sorted({cid
+                    for chunks in col_chunks
+                    for cid in chunks}))
+        return join_pandas(row['obj_type'], row['nlevels'],
+                           self.decode_array(row['clist']),
+                           self.decode_array(row['dtypes']),
+                           [[data[cid] for cid in chunks]
+                            for chunks in col_chunks])
+
+    # Rebuild a numpy array from its saved table
+    # (one column for 0d and 1d arrays, one column per column for 2d arrays,
+    # after the index column giving the row order)
+    def load_numpy(self, table, row):
+        df = self.read_table(self.get_value_table(table, row))
+        df = df.sort_values(df.columns[0], kind='stable')
+        values = df.iloc[:, 1:].to_numpy(dtype=np.dtype(row['dtype']))
+        dim = int(table[len('np_')])
+        if dim == 0:
+            return values.reshape(())
+        elif dim == 1:
+            return values.reshape(-1)
+        return values
+
+    # Rebuild the profile of a dataframe, series or numpy array
+    def load_profile(self, row):
+        columns = self.fetch_rows(
+            """SELECT * FROM column_profile WHERE run_id = {0}
+            AND profile_id = {0} ORDER BY position""".format(self.placeholder),
+            (row['run_id'], row['id']))
+        return Profile(row['nrows'], [
+            ColumnProfile(
+                col['column_name'], col['dtype'], col['count'],
+                col['null_count'], col['min'], col['max'], col['mean'],
+                col['std'], None if col['quantiles'] is None else
+                self.decode_array(col['quantiles']),
+                np.frombuffer(bytes(col['hll']), dtype=np.uint8).copy())
+            for col in columns
+        ])
@@ -1,34 +1,141 @@
-import psycopg2
+import os
+import atexit
+from time import perf_counter
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
 from config import config, engine_config
 from sqlalchemy import create_engine
 
+# Minimum and maximum number of connections kept in the connection pool
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
 
-# Returns an sqlalchemy engine with the correct configs
+# The connection pool and the sqlalchemy engine are shared by
+# all the connections of the process, and created on first use
+# A forked process creates its own, as the inherited connections
+# are still used by the parent process
+_pool = None
+_engine = None
+_pid = None
+# Pools and engines inherited from the parent process
+# They are never used, but are kept so that their connections
+# are not closed by the child process
+_inherited = []
+
+
+# Check that the pool and engine belong to the current process
+def _check_pid():
+    global _pool, _engine, _pid
+    if _pid != os.getpid():
+        if _pool is not None or _engine is not None:
+            _inherited.append((_pool, _engine))
+        _pool = None
+        _engine = None
+        _pid = os.getpid()
+
+
+# Returns the connection pool, created with the database config
+def get_pool():
+    global _pool
+    _check_pid()
+    if _pool is None:
+        print('Connecting to the PostgreSQL database...')
+        _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN,
+                                       **config())
+    return _pool
+
+
+# Returns the sqlalchemy engine with the correct configs
+# The same engine is returned on every call
 def get_engine():
-    eng_config = engine_config()
-    print(eng_config)
-    engine = create_engine(eng_config)
-    return engine
+    global _engine
+    _check_pid()
+    if _engine is None:
+        _engine = create_engine(engine_config())
+    return _engine
+
+
+class ProfiledCursor(cursor):
+    """
+    ProfiledCursor class
 
+    Cursor recording the time and the number of bytes sent
+    of every database call in its profiler (see profiler)
+    """
+    profiler = None
 
-# Connect to the database
+    def execute(self, query, vars=None):
+        start = perf_counter()
+        try:
+            return super(ProfiledCursor, self).execute(query, vars)
+        finally:
+            self.profiler.record_db(perf_counter() - start,
+                                    len(self.query or b''))
+
+    def executemany(self, query, vars_list):
+        start = perf_counter()
+        try:
+            return super(ProfiledCursor, self).executemany(query, vars_list)
+        finally:
+            self.profiler.record_db(perf_counter() - start,
+                                    len(self.query or b'') * self.rowcount)
+
+    # The bytes sent are the bytes read from the file
+    def copy_expert(self, sql, file, size=8192):
+        start = perf_counter()
+        position = file.tell()
+        try:
+            return super(ProfiledCursor, self).copy_expert(sql, file, size)
+        finally:
+            self.profiler.record_db(perf_counter() - start,
+                                    len(sql) + file.tell() - position)
+
+
+# Connect to the database using a connection of the pool
 # raise an exception if the connection fails
-def connect():
-    conn = None
+# With a profiler, the database calls of the cursor are profiled
+def connect(profiler=None):
+    conn = get_pool().getconn()
     try:
-        params = config()
-        print('Connecting to the PostgreSQL database...')
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        return (cur, conn)
+        if profiler is None:
+            cur = conn.cursor()
+        else:
+            cur = conn.cursor(cursor_factory=ProfiledCursor)
+            cur.profiler = profiler
     except Exception as e:
+        get_pool().putconn(conn, close=True)
         raise e
+    return (cur, conn)
 
 
 # disconnect from the database,
-# and commit if needed
+# and commit if needed (otherwise the changes are rolled back)
+# The connection is given back to the pool
 def disconnect(cur, conn, commit=True):
     cur.close()
-    if commit:
-        conn.commit()
-    conn.close()
\ No newline at end of file
+    try:
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+    finally:
+        _check_pid()
+        if _pool is not None and not _pool.closed:
+            _pool.putconn(conn, close=conn.closed != 0)
+        else:
+            conn.close()
+
+
+# Close all the connections of the pool and dispose of the engine
+# Registered to be called at exit, a forked process only closes
+# its own pool and engine (see _check_pid)
+@atexit.register
+def close_all():
+    global _pool, _engine
+    _check_pid()
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
@@ -1,55 +1,61 @@
+import hashlib
 import numpy as np
 import pandas as pd
 from dbObject import DbObject
-from psycopg2.extensions import AsIs, ISOLATION_LEVEL_AUTOCOMMIT
+from dbBackend import DbBackend
+from snapshot_cache import SnapshotCache
+from chunk_utils import CHUNK_ROWS, split_pandas
+from psycopg2 import Binary
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from datetime import date, time, datetime
 from psycopg2.extras import execute_values
-from dataframe_utils import get_df_cols_rows
-from database_utils import get_db_cols, add_columns
-from dbConnection import connect, disconnect, get_engine
-from psycopg2.extras import execute_values, execute_batch
-from array_utils import ArrayType, get_array_type, get_element_types
+from dataframe_utils import get_df_data, get_df_type_map, hash_df_rows, \
+    restore_pandas, HASH_KEY
+from database_utils import copy_dataframe, copy_rows, copy_query, quote_ident
+from dbConnection import connect, disconnect
+from create_tables import PARTITIONED_TABLES
 
+# Memory of the hash joins when loading a dataframe saved with delta logging
+LOAD_WORK_MEM = '64MB'
 
-class DbResource(object):
-    """
-    DbResource class
-
-    Allows to write:
-    db_resource = DbResource(delta_logging)
-    with db_resource as db:
-       db.save(...)
-
-    The returned db object is an instance of DbInterface
-    The connection and disconnection is handled automatically
-    """
-    def __init__(self, delta_logging=True):
-        self.db_interface_obj = DbInterface(delta_logging)
+# Number of previous runs whose dataframe rows are reused by a run
+# (with the runs they depend on, see DbInterface.get_store_runs)
+STORE_RUNS = 3
 
-    def __enter__(self):
-        self.db_interface_obj.connect()
-        return self.db_interface_obj
+# Maximum number of fingerprints looked up in the row store with one query,
+# more fingerprints are sent in a temporary table
+STORE_LOOKUP_ROWS = 1000
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.db_interface_obj.disconnect()
+# Key of the checksums of the dataframe rows, a second fingerprint
+# compared when rows are reused from the row store
+CHECKSUM_KEY = 'dagger-checksum!'
 
 
-class DbInterface(object):
+class DbInterface(DbBackend):
     """
     DbInterface class
 
-    Interface to connect to the database and save DbObject instances
+    PostgreSQL backend: interface to connect to the database
+    and save DbObject instances (see DbBackend)
     Multiple python, numpy and pandas types are handled
 
     Connection and diconnection is manual
     For automatic connect and diconnect, use the DbResource class
-    """
-    scalar_classes = [int, float, str, bool, date, time, datetime]  # complex?
-    array_like_classes = [list, tuple, set, frozenset]
-    dict_class = [dict]  # Not handled yet
-    pandas_classes = [pd.DataFrame, pd.Series]
-    numpy_classes = [np.ndarray]
+    (in dbResource)
+
+    With asynchronous logging, the objects are copied and saved
+    in batches by a background DbWriter thread
+
+    With delta logging, the row fingerprints of the last snapshot
+    of every dataframe are cached (see SnapshotCache), so saving
+    the same dataframe again doesn't need to read from the database
+
+    With chunk logging, dataframes and series are saved column by column
+    as content-addressed chunks (see chunk_utils)
 
+    The tables are partitioned by run (see create_tables): the partitions
+    of a run are created when it starts, and detached to drop it
+    """
     # Used to convert a pandas column type into a postgres type
     # All other types are not handled specifically
     # and are converted to postgres text type
@@ -75,124 +81,254 @@ class DbInterface(object):
         np.timedelta64: 'interval',
     }
 
-    def __init__(self, delta_logging=True):
-        super(DbInterface, self).__init__()
+    def __init__(self, delta_logging=True, async_logging=False,
+                 queue_size=1000, batch_size=500,
+                 cache_size=256 * 1024 * 1024,
+                 chunk_logging=False,
+                 chunk_rows=CHUNK_ROWS):
+        super(DbInterface, self).__init__(async_logging, queue_size,
+                                          batch_size)
         self.delta_logging = delta_logging
+        self.chunk_logging = chunk_logging
+        self.chunk_rows = chunk_rows
         self.cur = None
-        self.conn = None
-        self.split_id = None
-
-    # Disconnect without committing if the instance is deleted
-    def __del__(self):
-        if self.conn is not None:
-            self.disconnect(False)
-
-    # when deepcopying the globals,
-    # just return the same dbInterface instance
-    def __deepcopy__(self, memo):
-        return self
+        self.snapshot_cache = SnapshotCache(cache_size)
+        self.data_type_map = None
+        self.data_tables = None
+        self.touched_tables = set()
+        self.known_chunks = set()
+        self.partitions = set()
+        self.foreign_rids = np.empty(0, dtype=np.int64)
+        self.store_runs = None
 
     # Connect to the database
     # raises an exception if the connection fails
-    def connect(self):
-        self.cur, self.conn = connect()
-        self.engine = get_engine()
-
-    # Diconnect to the database and commit the changes
-    def disconnect(self, commit=True):
+    def open(self):
+        self.cur, self.conn = connect(self.profiler)
+        self.snapshot_cache.clear()
+        self.data_type_map = None
+        self.touched_tables = set()
+        self.known_chunks = set()
+        self.partitions = set()
+        self.foreign_rids = np.empty(0, dtype=np.int64)
+        self.store_runs = None
+
+    # The snapshots, chunks, partitions and column tables written
+    # in the rolled back changes are not in the database anymore
+    # (the tables to vacuum are forgotten as well)
+    def discard_caches(self):
+        self.snapshot_cache.clear()
+        self.data_type_map = None
+        self.data_tables = None
+        self.touched_tables = set()
+        self.known_chunks = set()
+        self.partitions = set()
+
+    # Diconnect from the database
+    # The tables modified by delta logging are vacuumed before committing
+    def close(self, commit=True):
+        if commit and len(self.touched_tables) > 0:
+            self.vacuum(sorted(self.touched_tables))
+            self.touched_tables = set()
         disconnect(self.cur, self.conn, commit=commit)
         self.cur = None
         self.conn = None
-        self.engine = None
-
-    # Commit the changes (Could be called after each save call if needed)
-    def commit(self):
-        if self.conn is not None:
-            self.conn.commit()
 
-    # Vacuum the database
-    # To do after a big table update (ex: after
-    # adding a new column with data during delta logging)
-    def vacuum(self):
+    # Vacuum and analyze the given tables
+    # Done once at the end of a run for the tables modified
+    # by delta logging (the other tables are only appended to)
+    def vacuum(self, tables):
         self.commit()
         old_isolation_level = self.conn.isolation_level
         self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        self.cur.execute("VACUUM FULL")
+        self.cur.execute("VACUUM ANALYZE {}".format(','.join(tables)))
         self.commit()
         self.conn.set_isolation_level(old_isolation_level)
 
-    # Set the current split id
-    def set_split_id(self, split_id: int):
-        if isinstance(split_id, int):
-            if split_id >= 0:
-                self.split_id = split_id
-            else:
-                raise ValueError("split_id must be positive")
-        else:
-            raise TypeError("split_id must be an integer")
-
-    # Set the current split id to None
-    def reset_split_id(self):
-        self.split_id = None
-
-    # Save a DbObject in the database
-    # If the type of the object is handled,
-    # call the corresponding function
-    # Otherwise, raise a TypeError
-    def save(self, obj: DbObject):
-        if obj.type in self.scalar_classes:
-            self.save_scalar(obj)
-        elif obj.type in self.array_like_classes:
-            self.save_array_like(obj)
-        # elif obj.type in self.dict_class:
-        #     self.save_dict(obj)
-        elif obj.type in self.pandas_classes:
-            self.save_pandas(obj)
-        elif obj.type in self.numpy_classes:
-            self.save_numpy(obj)
-        else:
-            raise TypeError("Obj type is not handled yet")
-
-    def save_scalar(self, obj: DbObject):
-        sql = """
-            INSERT INTO {}_scalar(s_id, t, lineno, name, value) 
-            VALUES (%s,%s,%s,%s,%s)""".format(obj.type.__name__)
-        args = (self.split_id, obj.time, obj.lineno, obj.name, obj.value)
+    def execute(self, sql, args=()):
         self.cur.execute(sql, args)
 
-    def save_array_like(self, obj: DbObject):
-        try:
-            arr_type = get_array_type(obj.value)
-        except Exception as e:
-            raise e
+    # Insert a new run and create its partitions
+    # The partitions are committed right away, as creating them
+    # locks the partitioned tables
+    def create_run(self, script):
+        self.cur.execute("INSERT INTO runs(script) VALUES (%s) RETURNING run_id",
+                         (script, ))
+        run_id = self.cur.fetchone()[0]
+        self.snapshot_cache.clear()
+        self.partitions = set()
+        self.foreign_rids = np.empty(0, dtype=np.int64)
+        self.store_runs = None
+        self.get_data_cols()
+        for table in PARTITIONED_TABLES + sorted(self.data_tables.values()):
+            self.create_partition(table, run_id)
+        self.commit()
+        return run_id
+
+    # Create the partition of a run in a partitioned table
+    def create_partition(self, table, run_id=None):
+        run_id = self.run_id if run_id is None else run_id
+        if (table, run_id) in self.partitions:
+            return
+        self.cur.execute(
+            """CREATE TABLE IF NOT EXISTS {0}_run_{1}
+            PARTITION OF {0} FOR VALUES IN ({1})""".format(table, int(run_id)))
+        self.partitions.add((table, run_id))
+
+    # Drop a run by detaching its partitions
+    # The detached partitions and the tables of the run's dataframes,
+    # series and numpy arrays are dropped, or kept with archive
+    # (the run is then marked as archived)
+    # The dataframe rows reused by other runs are moved to them first
+    # (see move_shared_rows)
+    # The chunks of chunk logging are shared by the runs and are kept
+    def drop_run(self, run_id, archive=False):
+        if run_id == self.run_id:
+            raise ValueError("The current run can't be dropped")
+        self.flush()
+        self.commit()
+        self.move_shared_rows(run_id)
+        value_tables = []
+        for table in ('dataframe_object', 'series_object', 'np_0d_object',
+                      'np_1d_object', 'np_2d_object'):
+            value_tables.extend(
+                self.get_value_table(table, row) for row in self.fetch_rows(
+                    "SELECT value FROM {} WHERE run_id = %s".format(table),
+                    (run_id, )))
+        self.cur.execute(
+            """SELECT p.relname, c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE c.relname = p.relname || %s""", ('_run_{}'.format(int(run_id)), ))
+        partitions = self.cur.fetchall()
+        for table, partition in partitions:
+            self.cur.execute("ALTER TABLE {} DETACH PARTITION {}".format(
+                table, partition))
+        if archive:
+            self.cur.execute(
+                "UPDATE runs SET status = 'archived' WHERE run_id = %s",
+                (run_id, ))
         else:
-            sql, args = None, (self.split_id, obj.time, obj.lineno,
-                               type(obj.value).__name__, obj.name)
-            arr = list(obj.value)
-            if arr_type is ArrayType.EMPTY:
-                sql = """
-                    INSERT INTO empty_array(s_id, t, lineno, arr_type, name) 
-                    VALUES (%s,%s,%s,%s,%s)"""
-            elif arr_type is ArrayType.COMPOUND:
-                sql = """
-                    INSERT INTO compound_scalar_array(s_id, t, lineno, arr_type, name, types, value) 
-                    VALUES (%s,%s,%s,%s,%s,%s,%s)"""
-                args += (get_element_types(arr), list(map(str, arr)))
-            else:
-                sql = """
-                    INSERT INTO {}_scalar_array(s_id, t, lineno, arr_type, name, value) 
-                    VALUES (%s,%s,%s,%s,%s,%s)""".format(
-                    type(arr[0]).__name__)
-                args += (arr, )
-            self.cur.execute(sql, args)
+            tables = [partition for _, partition in partitions] + value_tables
+            if len(tables) > 0:
+                self.cur.execute("DROP TABLE IF EXISTS {}".format(
+                    ','.join(tables)))
+            self.cur.execute("DELETE FROM runs WHERE run_id = %s", (run_id, ))
+            # An archived run keeps its dependencies, so that the rows
+            # it reuses are copied to it when their runs are dropped
+            self.cur.execute("DELETE FROM run_dependency WHERE run_id = %s",
+                             (run_id, ))
+        self.commit()
+
+    # Move the dataframe rows of a run reused by other runs
+    # to the partitions of these runs, so that the run can be dropped
+    # The rows reused by the runs that are not archived are moved to
+    # the oldest of them, that the others then depend on instead,
+    # and the archived runs get a copy of the rows they reuse
+    # in their detached partitions
+    # The moved rows keep their rid, so the snapshots don't change
+    def move_shared_rows(self, run_id):
+        dependents = self.get_dependent_runs(run_id)
+        live = [d['run_id'] for d in dependents if d['status'] != 'archived']
+        groups = [(live[0], live)] if len(live) > 0 else []
+        groups += [(d['run_id'], [d['run_id']]) for d in dependents
+                   if d['status'] == 'archived']
+        if len(groups) == 0:
+            return
+        self.cur.execute(
+            "SELECT relname FROM pg_class WHERE relname ~ %s ORDER BY relname",
+            ('^dataframe_column_[0-9]+_run_{}$'.format(int(run_id)), ))
+        tables = [('dataframe_data', 'rid, index_key'),
+                  ('dataframe_fingerprint',
+                   'rid, index_key, fingerprint, checksum')]
+        tables += [(r[0][:-len('_run_{}'.format(int(run_id)))], 'rid, value')
+                   for r in self.cur.fetchall()]
+        for target, runs in groups:
+            snapshots = ' UNION ALL '.join(
+                'SELECT rlist FROM dataframe_delta_object_run_{}'.format(
+                    int(r)) for r in runs)
+            self.cur.execute("""DROP TABLE IF EXISTS moved_rows;
+                CREATE TEMPORARY TABLE moved_rows AS
+                SELECT DISTINCT r.rid FROM ({}) o
+                CROSS JOIN LATERAL unnest(o.rlist) r(rid)
+                JOIN dataframe_data_run_{} d ON d.rid = r.rid""".format(
+                snapshots, int(run_id)))
+            for table, cols in tables:
+                self.cur.execute("""INSERT INTO {0}(run_id, {1})
+                    SELECT %s, {1} FROM {2}_run_{3}
+                    WHERE rid IN (SELECT rid FROM moved_rows)""".format(
+                    self.get_run_partition(table, target, target not in live),
+                    cols, table, int(run_id)), (target, ))
+            self.cur.execute(
+                """DELETE FROM run_dependency
+                WHERE depends_on = %s AND run_id = ANY(%s)""",
+                (run_id, runs))
+            if len(runs) > 1:
+                execute_values(
+                    self.cur, """INSERT INTO run_dependency(run_id, depends_on)
+                    VALUES %s ON CONFLICT DO NOTHING""",
+                    [(r, target) for r in runs if r != target])
+        self.cur.execute("DROP TABLE moved_rows")
+
+    # Get the partition of a run in a partitioned table, created if needed
+    # The partitions of archived runs are detached, a missing one
+    # is created as a table with the columns of the partitioned table
+    def get_run_partition(self, table, run_id, archived=False):
+        if archived:
+            self.cur.execute(
+                "CREATE TABLE IF NOT EXISTS {0}_run_{1} (LIKE {0})".format(
+                    table, int(run_id)))
+        else:
+            self.create_partition(table, run_id)
+        return '{}_run_{}'.format(table, int(run_id))
+
+    # Get the runs reusing dataframe rows saved by the given run,
+    # with their status
+    def get_dependent_runs(self, run_id):
+        return self.fetch_rows(
+            """SELECT d.run_id, r.status FROM run_dependency d
+            JOIN runs r ON r.run_id = d.run_id
+            WHERE d.depends_on = %s ORDER BY d.run_id""", (run_id, ))
+
+    # Get the runs whose dataframe rows are reused by the given run
+    def get_run_dependencies(self, run_id):
+        self.cur.execute(
+            """SELECT depends_on FROM run_dependency WHERE run_id = %s
+            ORDER BY depends_on""", (run_id, ))
+        return [r[0] for r in self.cur.fetchall()]
+
+    # Get the number of dataframe rows referenced by the snapshots
+    # saved with delta logging (the rows a full copy would store)
+    # and the number of rows stored, for every run
+    def get_storage_savings(self):
+        return self.fetch_rows("""
+            SELECT r.run_id, coalesce(o.snapshots, 0) AS snapshots,
+                coalesce(o.rows, 0) AS rows,
+                coalesce(d.stored_rows, 0) AS stored_rows
+            FROM runs r
+            LEFT JOIN (SELECT run_id, count(*) AS snapshots,
+                    sum(cardinality(rlist)) AS rows
+                FROM dataframe_delta_object GROUP BY run_id) o
+            ON o.run_id = r.run_id
+            LEFT JOIN (SELECT run_id, count(*) AS stored_rows
+                FROM dataframe_data GROUP BY run_id) d
+            ON d.run_id = r.run_id
+            WHERE r.status != 'archived'
+            ORDER BY r.run_id""")
+
+    # Insert multiple rows in a table with one statement
+    def insert_rows(self, table, cols, rows):
+        sql = "INSERT INTO {}({}) VALUES %s".format(table, ','.join(cols))
+        execute_values(self.cur, sql, rows)
 
     def save_pandas(self, obj: DbObject):
-        if obj.type is pd.Series:
+        if self.chunk_logging:
+            self.save_pandas_chunks(obj)
+        elif obj.type is pd.Series:
             self.save_pandas_default(obj)
         elif obj.type is pd.DataFrame:
             if self.delta_logging:
                 self.save_dataframe_delta(obj)
-                self.vacuum()
             else:
                 self.save_pandas_default(obj)
         else:
@@ -200,38 +336,116 @@ class DbInterface(object):
 
     def save_pandas_default(self, obj: DbObject):
         sql = """
-            INSERT INTO {}_object(s_id, t, lineno, name) 
-            VALUES (%s,%s,%s,%s) RETURNING value""".format(
+            INSERT INTO {}_object(run_id, s_id, t, lineno, name, nlevels, policy) 
+            VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING value""".format(
             obj.type.__name__.lower())
-        args = (self.split_id, obj.time, obj.lineno, obj.name)
+        args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+                obj.value.index.nlevels, obj.policy)
         self.cur.execute(sql, args)
         table_id = self.cur.fetchone()[0]
         table_name = "{}_{}".format(obj.type.__name__.lower(), table_id)
-        obj.value.to_sql(table_name, self.engine)
+        self.copy_pandas(table_name, obj.value)
+
+    def save_pandas_chunks(self, obj: DbObject):
+        """
+        Dataframe and series chunk saving function
+
+        Every column (and index level) is cut in chunks of chunk_rows rows,
+        identified by the hash of their content (see chunk_utils)
+        Only the chunks that are not in the dataframe_chunk table yet
+        are saved, so a column that didn't change, or a block of rows
+        that is the same in another variable or run, is not saved again
+
+        The snapshot itself is a manifest in the dataframe_chunk_object table:
+        the column names and types, and the chunk ids of every column
+        """
+        df, col_chunks = split_pandas(obj.value, self.chunk_rows)
+        nlevels = obj.value.index.nlevels
+
+        chunks = {cid: data for cc in col_chunks for cid, data in cc}
+        new_ids = [cid for cid in chunks if cid not in self.known_chunks]
+        if len(new_ids) > 0:
+            self.cur.execute(
+                "SELECT chunk_id FROM dataframe_chunk WHERE chunk_id = ANY(%s)",
+                (new_ids, ))
+            self.known_chunks.update(r[0] for r in self.cur)
+            new_ids = [cid for cid in new_ids if cid not in self.known_chunks]
+        if len(new_ids) > 0:
+            insert_sql = """
+                INSERT INTO dataframe_chunk(chunk_id, data) VALUES %s
+                ON CONFLICT (chunk_id) DO NOTHING"""
+            execute_values(self.cur, insert_sql,
+                           [(cid, Binary(chunks[cid])) for cid in new_ids])
+            self.known_chunks.update(new_ids)
+
+        insert_manifest_sql = """
+            INSERT INTO dataframe_chunk_object(run_id, s_id, t, lineno, name,
+                obj_type, nlevels, nrows, clist, dtypes, chunks, policy) 
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"""
+        args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name, obj.type.__name__,
+                nlevels, len(df), [str(col) for col in df.columns],
+                [str(dtype) for dtype in df.dtypes],
+                [[cid for cid, _ in cc] for cc in col_chunks], obj.policy)
+        self.cur.execute(insert_manifest_sql, args)
 
     def save_dataframe_delta(self, obj: DbObject):
         """
         Dataframe delta saving function
 
-        Adds new and updated data to the dataframe_data table
+        Adds new and updated data to the dataframe data tables
         Saved the set of rows and columns of that table 
         that are needed to recreate the dataframe
 
+        Storage layout (all tables are only appended to,
+        except dataframe_max_rid, so no dead rows are left behind):
+            - dataframe_data: one row per (rid, index_key), the index_key
+              being a hash of the index values of the row
+            - dataframe_column_<id>: one table per dataframe column
+              or index level (registered in dataframe_column), with the
+              non-null values of the column as (rid, value)
+            - dataframe_fingerprint: the fingerprints of the rows,
+              one for every set of columns a row was saved with,
+              and their checksums (the row store: a row with the same
+              fingerprint and checksum, saved by any variable or split
+              of the run or of the last runs, is reused)
+            - dataframe_max_rid: the last rid of every index_key
+              of every variable
+            - run_dependency: the runs whose rows are reused by a run
+
+        The index can be of any type (integers, strings, timestamps,
+        multiple levels...), and index values can be removed and reused,
+        or appear multiple times: the rows of a snapshot are compared with
+        the last rows of the variable with the same index_key, and a row
+        with new values gets a new rid
+
         Assumptions:
             - The new dataframe is a modified version of the previous dataframe
               (i.e. we suppose iterative modifications to the dataframe)
             - Columns of the dataframe cannot change type,
               create a new column instead of modifying the type
-            - The indexes of the dataframe are integers and we cannot reuse old indexes
-              that were removed
+              (the index levels are saved with their type,
+              see type_index_levels)
 
         For more explanation of the execution of the function,
         please take a look at the file 'save_df_test.py' containing
         the iterative developement of this function and explanations of its execution
         """
+        try:
+            self.save_dataframe_rows(obj)
+        except Exception as e:
+            # The cached state may not match the database anymore
+            self.snapshot_cache.remove((obj.name, obj.s_id))
+            self.data_type_map = None
+            raise e
+
+    def save_dataframe_rows(self, obj: DbObject):
         df = obj.value
-        db_cols, db_type_map = get_db_cols(self.cur, 'dataframe_data')
-        df_cols, df_rows, df_type_map = get_df_cols_rows(df)
+        nlevels = df.index.nlevels
+        db_cols, db_type_map = self.get_data_cols()
+        df_2, df_type_map = get_df_data(df)
+        df_2, df_type_map = type_index_levels(df_2, df_type_map, nlevels)
+        df_cols = list(df_2.columns)
+        index_cols = df_cols[:nlevels]
         wrong = [
             k for k in db_type_map
             if k in df_type_map and db_type_map[k] != df_type_map[k]
@@ -244,82 +458,364 @@ class DbInterface(object):
 
         inter_cols = [col for col in df_cols if col in db_cols]
         add_cols = [col for col in df_cols if col not in db_cols]
-        df_indices = tuple([r[0] for r in df_rows])
-
-        max_rid_sql = "SELECT max_rid FROM dataframe_max_rid WHERE index in %s"
-        self.cur.execute(max_rid_sql, (df_indices, ))
-        max_rid_list = tuple([r[0] for r in self.cur])
-
-        if len(max_rid_list) > 0:
-            db_data_sql = """SELECT rid,{} 
-                    FROM dataframe_data 
-                    WHERE rid in %s
-                    """.format(','.join(inter_cols))
-            self.cur.execute(db_data_sql, (max_rid_list, ))
-            r_list = [r for r in self.cur]
-        else:
-            r_list = []
-        hash_list = [(hash(r[1:]), r[0]) for r in r_list]
-        hash_dic = dict(hash_list)
-
-        rids = []
-        update_rows = []
-        new_rows = []
-        for i, r in enumerate(df_rows):
-            row = tuple([
-                self.cast(r[0], df_type_map.get(r[1]))
-                for r in zip(r, df_cols) if r[1] in db_cols
-            ])
-            # if i < 5:
-            #     print(row)
-            rest_row = tuple(
-                [r[0] for r in zip(r, df_cols) if r[1] not in db_cols])
-            h = hash(row)
-            if h in hash_dic:
-                rid = hash_dic.get(h)
-                update_rows.append((*rest_row, rid))
-                rids.append(rid)
-            else:
-                new_rows.append(r)
+        index_keys = self.fingerprint(df_2, index_cols, df_type_map)
 
+        # Fingerprints of the rows with all the columns (saved in the database)
+        # and with the columns that are already in the database (to compare)
+        df_fps = self.fingerprint(df_2, df_cols, df_type_map)
         if len(add_cols) != 0:
-            add_columns(self.cur, 'dataframe_data', add_cols, df_type_map)
-            update_sql = """
-                UPDATE dataframe_data 
-                SET {} WHERE rid = %s""".format(','.join(
-                map(lambda x: '{} = %s'.format(x), add_cols)))
-            execute_batch(self.cur, update_sql, update_rows)
-
-        insert_sql = """
-            INSERT INTO dataframe_data({})
-            VALUES %s RETURNING rid, index
-        """.format(','.join(df_cols))
-        new_rids_indices = execute_values(self.cur,
-                                          insert_sql,
-                                          new_rows,
-                                          fetch=True)
+            inter_fps = self.fingerprint(df_2, inter_cols, df_type_map)
+        else:
+            inter_fps = df_fps
+
+        # If the last snapshot of this variable is cached with the same columns,
+        # compare with its rows, otherwise compare with the database rows
+        # (rows without any column in the database can't be compared)
+        key = (obj.name, obj.s_id)
+        cached = self.snapshot_cache.get(key)
+        if len(inter_cols) == 0:
+            matches = np.full(len(df_2), -1, dtype=np.int64)
+        elif cached is not None and cached[0] == tuple(sorted(inter_cols)):
+            matches = self.match_fingerprints(inter_fps, cached[1],
+                                              cached[2])
+        else:
+            matches = self.match_db_rows(df_2, obj.name, index_keys,
+                                         inter_cols, inter_fps, df_type_map,
+                                         db_type_map)
+        # The rows of other runs are only reused as they are,
+        # the values of new columns are saved in new rows,
+        # and only once for every row (repeated rows get new rows)
+        if len(add_cols) != 0:
+            if len(self.foreign_rids) > 0:
+                matches[np.isin(matches, self.foreign_rids)] = -1
+            matches[(matches >= 0)
+                    & pd.Series(matches).duplicated().to_numpy()] = -1
+        found = matches >= 0
+
+        # Checksums of the rows with all the columns, for the rows
+        # whose fingerprint with all the columns is saved
+        changed = ~found
+        df_sums = np.zeros(len(df_2), dtype=np.int64)
+        if len(add_cols) != 0:
+            df_sums = self.fingerprint(df_2, df_cols, df_type_map,
+                                       CHECKSUM_KEY)
+        elif changed.any():
+            df_sums[changed] = self.fingerprint(df_2.loc[changed], df_cols,
+                                                df_type_map, CHECKSUM_KEY)
+
+        # The rows that are already saved only need the values
+        # of the new columns and their new fingerprint
+        if len(add_cols) != 0:
+            self.add_data_columns(add_cols, df_type_map)
+            found_df = df_2.loc[found]
+            self.copy_data_values(found_df, matches[found], add_cols)
+            self.copy_fingerprints(index_keys[found], matches[found],
+                                   df_fps[found], df_sums[found])
+
+        # The other rows are looked up in the row store,
+        # with their fingerprint and checksum with all the columns
+        stored = np.full(len(df_2), -1, dtype=np.int64)
+        stored[~found] = self.match_store_rows(df_fps[~found],
+                                               df_sums[~found])
+        matches[~found] = stored[~found]
+        found = matches >= 0
+
+        # The repeated new rows are only saved once
+        new_inv = pd.DataFrame({
+            'fingerprint': df_fps[~found],
+            'checksum': df_sums[~found]
+        }).groupby(['fingerprint', 'checksum'], sort=False).ngroup().to_numpy()
+        new_pos = pd.Series(new_inv).drop_duplicates().index.to_numpy()
+        new_df = df_2.loc[~found].iloc[new_pos]
+        new_keys = index_keys[~found][new_pos]
+        new_fps = df_fps[~found][new_pos]
+        new_sums = df_sums[~found][new_pos]
+        new_rids = np.asarray(self.next_rids(len(new_df)), dtype=np.int64)
+        copy_rows(self.cur, 'dataframe_data',
+                  pd.DataFrame({
+                      'run_id': self.run_id,
+                      'rid': new_rids,
+                      'index_key': new_keys
+                  }))
+        self.copy_fingerprints(new_keys, new_rids, new_fps, new_sums)
+        self.copy_data_values(new_df, new_rids, df_cols)
+
+        # The rids are kept in the order of the dataframe rows
+        rids = matches.copy()
+        rids[~found] = new_rids[new_inv]
+
+        # The max rids of the new rows and of the reused rows of the current
+        # run are updated, so that the next snapshots of the variable
+        # compare with them
+        # With repeated index values, the last row of the index is kept
+        own = changed & ~np.isin(rids, self.foreign_rids)
+        max_rids = pd.DataFrame({
+            'index_key': index_keys[own],
+            'rid': rids[own]
+        }).drop_duplicates('index_key', keep='last')
         update_max_rids_sql = """
-            INSERT INTO dataframe_max_rid(max_rid, index) 
+            INSERT INTO dataframe_max_rid(run_id, name, max_rid, index_key) 
             VALUES %s 
-            ON CONFLICT (index) DO UPDATE SET max_rid = EXCLUDED.max_rid"""
-        execute_values(self.cur, update_max_rids_sql, new_rids_indices)
-        new_rids = [x[0] for x in new_rids_indices]
-        rids.extend(new_rids)
-
+            ON CONFLICT (run_id, name, index_key)
+            DO UPDATE SET max_rid = EXCLUDED.max_rid"""
+        # Sorted by index_key, so that concurrent processes lock the rows
+        # in the same order
+        execute_values(
+            self.cur, update_max_rids_sql,
+            sorted(((self.run_id, obj.name, rid, index_key)
+                    for rid, index_key in zip(max_rids['rid'].tolist(),
+                                              max_rids['index_key'].tolist())),
+                   key=lambda r: r[3]))
+        self.touched_tables.update(['dataframe_data', 'dataframe_fingerprint',
+                                    'dataframe_max_rid'])
+
+        self.snapshot_cache.put(key, sorted(df_cols), df_fps, rids)
+        rids = rids.tolist()
+
+        # The saved column names are in lower case (and the index levels
+        # typed), so the snapshot keeps the names of the index levels
+        # and columns of the dataframe, and the frequency of its index
         insert_versioning_sql = """
-            INSERT INTO dataframe_delta_object(s_id, t, lineno, name, rlist, clist) 
-            VALUES (%s,%s,%s,%s,%s,%s)"""
-        args = (self.split_id, obj.time, obj.lineno, obj.name, rids, df_cols)
+            INSERT INTO dataframe_delta_object(run_id, s_id, t, lineno, name, nlevels, rlist, clist, names, freq, policy) 
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"""
+        args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+                nlevels, rids, df_cols,
+                list(df.index.names) + list(df.columns),
+                getattr(df.index, 'freqstr', None), obj.policy)
         self.cur.execute(insert_versioning_sql, args)
 
+    # Get the dataframe columns saved in the database and their types
+    # They are read once per connection, and kept up to date
+    # when new columns are added
+    def get_data_cols(self):
+        if self.data_type_map is None:
+            self.data_type_map = {}
+            self.data_tables = {}
+            self.cur.execute("""SELECT name, col_id, type
+                FROM dataframe_column ORDER BY col_id""")
+            for name, col_id, col_type in self.cur.fetchall():
+                self.data_type_map[name] = col_type
+                self.data_tables[name] = "dataframe_column_{}".format(col_id)
+        return list(self.data_type_map), self.data_type_map
+
+    # Register new dataframe columns and create their tables
+    # (partitioned by run, with the partition of the current run)
+    def add_data_columns(self, cols, type_map):
+        insert_sql = """
+            INSERT INTO dataframe_column(name, type) VALUES %s
+            ON CONFLICT (name) DO NOTHING"""
+        execute_values(self.cur, insert_sql,
+                       [(col, type_map[col]) for col in sorted(cols)])
+        self.cur.execute(
+            """SELECT name, col_id, type
+            FROM dataframe_column WHERE name = ANY(%s)""", (cols, ))
+        for name, col_id, col_type in self.cur.fetchall():
+            if col_type != type_map[name]:
+                raise ValueError(
+                    "Column {} was added with another type ({})".format(
+                        name, col_type))
+            table_name = "dataframe_column_{}".format(col_id)
+            self.cur.execute("""CREATE TABLE IF NOT EXISTS {} (
+                    run_id integer NOT NULL,
+                    rid integer NOT NULL,
+                    value {},
+                    PRIMARY KEY (run_id, rid)
+                ) PARTITION BY LIST (run_id)""".format(table_name, col_type))
+            self.create_partition(table_name)
+            self.data_type_map[name] = col_type
+            self.data_tables[name] = table_name
+
+    # Reserve rids for n new rows
+    def next_rids(self, n):
+        if n == 0:
+            return []
+        self.cur.execute(
+            """SELECT nextval('dataframe_data_rid_seq')
+            FROM generate_series(1, %s)""", (n, ))
+        return [r[0] for r in self.cur]
+
+    # Save the non-null values of the given columns for the given rows
+    def copy_data_values(self, df, rids, cols):
+        for col in cols:
+            values = pd.DataFrame({
+                'run_id': self.run_id,
+                'rid': rids,
+                'value': df[col].to_numpy()
+            })
+            values = values[values['value'].notna()]
+            table_name = self.data_tables[col]
+            self.create_partition(table_name)
+            copy_rows(self.cur, table_name, values)
+            self.touched_tables.add(table_name)
+
+    # Save the fingerprints of the given rows (without repeating a row)
+    def copy_fingerprints(self, index_keys, rids, fps, sums):
+        copy_rows(
+            self.cur, 'dataframe_fingerprint',
+            pd.DataFrame({
+                'run_id': self.run_id,
+                'rid': rids,
+                'index_key': index_keys,
+                'fingerprint': fps,
+                'checksum': sums
+            }).drop_duplicates('rid'))
+
+    # For each dataframe row, get the rid of the last database row
+    # of the variable with the same index and values, or -1 if there is none
+    # (rows of the current run only, so that the runs can be dropped)
+    def match_db_rows(self, df_2, name, index_keys, inter_cols, inter_fps,
+                      df_type_map, db_type_map):
+        max_rid_sql = """SELECT f.rid, f.fingerprint
+                FROM dataframe_max_rid m
+                JOIN dataframe_fingerprint f
+                ON f.run_id = m.run_id AND f.rid = m.max_rid
+                WHERE m.run_id = %s AND m.name = %s
+                AND m.index_key = ANY(%s)"""
+        self.cur.execute(max_rid_sql,
+                         (self.run_id, name, np.unique(index_keys).tolist()))
+        db_fps = pd.DataFrame(self.cur.fetchall(),
+                              columns=['rid', 'fingerprint'])
+
+        matches = self.match_fingerprints(inter_fps, db_fps['fingerprint'],
+                                          db_fps['rid'])
+        found = matches >= 0
+
+        # The fingerprints were computed with the columns of the dataframe
+        # that saved the rows, so rows saved with other columns
+        # (ex: a column was dropped since) are compared with their data
+        db_rids = np.unique(db_fps['rid'].to_numpy())
+        other_rids = np.setdiff1d(db_rids, matches[found])
+        if not found.all() and len(other_rids) > 0:
+            db_df = self.read_data_rows(other_rids.tolist(), inter_cols)
+            db_hashes = hash_df_rows(db_df[inter_cols], db_type_map)
+            df_hashes = hash_df_rows(df_2.loc[~found, inter_cols],
+                                     df_type_map)
+            matches[~found] = self.match_fingerprints(df_hashes, db_hashes,
+                                                      db_df['rid'])
+        return matches
+
+    # For each fingerprint and checksum, get the rid of a row of the
+    # row store with the same fingerprint and checksum, or -1 if there is none
+    # Only the rows of the current run, of the last runs and of the runs
+    # they depend on are looked up (see get_store_runs), many fingerprints
+    # are sent in a temporary table joined with the fingerprints
+    # Rows of the current run are preferred, then rows of the latest runs,
+    # the runs of the other rows become dependencies of the current run
+    def match_store_rows(self, fps, sums):
+        if len(fps) == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.store_runs is None or self.store_runs[0] != self.run_id:
+            self.store_runs = (self.run_id, self.get_store_runs())
+        lookup = np.unique(fps)
+        if len(lookup) <= STORE_LOOKUP_ROWS:
+            self.cur.execute(
+                """SELECT f.run_id, f.rid, f.fingerprint, f.checksum
+                FROM dataframe_fingerprint f
+                WHERE f.run_id = ANY(%s) AND f.fingerprint = ANY(%s)""",
+                (self.store_runs[1], lookup.tolist()))
+        else:
+            self.cur.execute("""CREATE TEMPORARY TABLE IF NOT EXISTS
+                fingerprint_lookup (fingerprint bigint PRIMARY KEY)""")
+            self.cur.execute("TRUNCATE fingerprint_lookup")
+            copy_rows(self.cur, 'fingerprint_lookup',
+                      pd.DataFrame({'fingerprint': lookup}))
+            self.cur.execute("ANALYZE fingerprint_lookup")
+            self.cur.execute(
+                """SELECT f.run_id, f.rid, f.fingerprint, f.checksum
+                FROM fingerprint_lookup k
+                JOIN dataframe_fingerprint f ON f.fingerprint = k.fingerprint
+                WHERE f.run_id = ANY(%s)""", (self.store_runs[1], ))
+        store = pd.DataFrame(
+            self.cur.fetchall(),
+            columns=['run_id', 'rid', 'fingerprint', 'checksum'])
+        if len(store) == 0:
+            return np.full(len(fps), -1, dtype=np.int64)
+        store = store.assign(own=store['run_id'] == self.run_id).sort_values(
+            ['own', 'run_id'], kind='stable')
+        store_rids = pd.Series(store['rid'].to_numpy(np.int64),
+                               index=pd.MultiIndex.from_arrays(
+                                   [store['fingerprint'], store['checksum']]))
+        store_rids = store_rids[~store_rids.index.duplicated(keep='last')]
+        positions = store_rids.index.get_indexer(
+            pd.MultiIndex.from_arrays([fps, sums]))
+        matches = np.where(positions >= 0,
+                           store_rids.to_numpy()[positions], -1)
+        used = store[~store['own'] & store['rid'].isin(matches)]
+        if len(used) > 0:
+            execute_values(
+                self.cur, """INSERT INTO run_dependency(run_id, depends_on)
+                VALUES %s ON CONFLICT DO NOTHING""",
+                [(self.run_id, run_id)
+                 for run_id in sorted(used['run_id'].unique().tolist())])
+            self.foreign_rids = np.union1d(self.foreign_rids,
+                                           used['rid'].to_numpy(np.int64))
+        return matches
+
+    # Get the runs whose rows are reused by the current run: the current run,
+    # the last STORE_RUNS runs that are not archived and the runs they
+    # depend on (the runs holding the rows they reuse)
+    def get_store_runs(self):
+        self.cur.execute(
+            """WITH recent AS (
+                SELECT run_id FROM runs
+                WHERE run_id < %(run_id)s AND status != 'archived'
+                ORDER BY run_id DESC LIMIT %(runs)s)
+            SELECT run_id FROM recent
+            UNION SELECT depends_on FROM run_dependency
+            WHERE run_id IN (SELECT run_id FROM recent)""", {
+                'run_id': self.run_id,
+                'runs': STORE_RUNS
+            })
+        return sorted({self.run_id} | {r[0] for r in self.cur.fetchall()})
+
+    # Read the given columns (index levels and data columns)
+    # of the given rows from the database
+    def read_data_rows(self, rids, cols):
+        joins = ''.join(
+            ' LEFT JOIN {0} c{1} ON c{1}.run_id = %(run_id)s '
+            'AND c{1}.rid = d.rid'.format(self.data_tables[col], i)
+            for i, col in enumerate(cols))
+        sql = """SELECT d.rid{}
+                FROM dataframe_data d{}
+                WHERE d.run_id = %(run_id)s AND d.rid = ANY(%(rids)s)""".format(
+            ''.join(',c{}.value'.format(i) for i in range(len(cols))),
+            joins)
+        self.cur.execute(sql, {'run_id': self.run_id, 'rids': rids})
+        return pd.DataFrame(self.cur.fetchall(), columns=['rid', *cols])
+
+    # Get the fingerprints of the dataframe rows using the given columns
+    # as signed 64-bit integers (postgres bigint)
+    # The columns are sorted, so that the column order doesn't matter,
+    # and their names are part of the fingerprint, so that rows with
+    # the same values in other columns are different rows of the row store
+    # The checksums of the rows are fingerprints with another hash key
+    def fingerprint(self, df, cols, type_map, hash_key=HASH_KEY):
+        cols = sorted(cols)
+        names = hashlib.blake2b(repr(cols).encode(),
+                                digest_size=8,
+                                key=hash_key.encode()).digest()
+        return (hash_df_rows(df[cols], type_map, hash_key) ^ np.frombuffer(
+            names, dtype=np.uint64)[0]).view(np.int64)
+
+    # For each fingerprint, get the rid of the database row
+    # with the same fingerprint, or -1 if there is none
+    def match_fingerprints(self, fps, db_fps, db_rids):
+        db_rids = pd.Series(np.asarray(db_rids, dtype=np.int64),
+                            index=np.asarray(db_fps))
+        db_rids = db_rids[~db_rids.index.duplicated(keep='last')]
+        if len(db_rids) == 0:
+            return np.full(len(fps), -1, dtype=np.int64)
+        matches = db_rids.index.get_indexer(fps)
+        return np.where(matches >= 0, db_rids.to_numpy()[matches], -1)
+
     def save_numpy(self, obj: DbObject):
         dim = len(obj.value.shape)
         if dim == 0 or dim == 1 or dim == 2:
             sql = """
-                INSERT INTO np_{}d_object(s_id, t, lineno, name, dtype) 
-                VALUES (%s,%s,%s,%s,%s) RETURNING value""".format(dim)
-            args = (self.split_id, obj.time, obj.lineno, obj.name,
-                    str(obj.value.dtype))
+                INSERT INTO np_{}d_object(run_id, s_id, t, lineno, name, dtype, policy) 
+                VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING value""".format(dim)
+            args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+                    str(obj.value.dtype), obj.policy)
             self.cur.execute(sql, args)
             table_id = self.cur.fetchone()[0]
             table_name = "np_{}d_{}".format(dim, table_id)
@@ -327,31 +823,125 @@ class DbInterface(object):
                 pd_obj = pd.Series(data=obj.value, dtype=obj.value.dtype)
             else:
                 pd_obj = pd.DataFrame(data=obj.value, dtype=obj.value.dtype)
-            pd_obj.to_sql(table_name, self.engine)
+            self.copy_pandas(table_name, pd_obj)
         else:
             raise TypeError(
                 "Numpy arrays of dimension higher than 2 are not handled yet")
 
-    def cast(self, elem, psql_type):
-        """
-        Casts the element to the correct type/format
-        depending on its equivalent postgres type
+    # Save the profile of a dataframe, series or numpy array:
+    # one row in profile_object, and one row per column in column_profile
+    def save_profile(self, obj: DbObject):
+        profile = obj.value
+        sql = """
+            INSERT INTO profile_object(run_id, s_id, t, lineno, name, obj_type, nrows, policy) 
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id"""
+        args = (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name, obj.type.__name__,
+                profile.nrows, obj.policy)
+        self.cur.execute(sql, args)
+        profile_id = self.cur.fetchone()[0]
+        insert_sql = """
+            INSERT INTO column_profile(run_id, profile_id, position,
+                column_name, dtype, count, null_count, distinct_count, min, max,
+                mean, std, quantiles, hll) VALUES %s"""
+        execute_values(self.cur, insert_sql, [
+            (self.run_id, profile_id, i, col.name, col.dtype, col.count, col.null_count,
+             col.distinct_count(), col.min, col.max, col.mean, col.std,
+             col.quantiles, Binary(col.hll.tobytes()))
+            for i, col in enumerate(profile.columns)
+        ])
+
+    # Save a dataframe or series (with its index) in a new table
+    # The column types are taken from the dataframe_utils conversion table
+    def copy_pandas(self, table_name, pd_obj):
+        if isinstance(pd_obj, pd.Series):
+            pd_obj = pd_obj.to_frame()
+        df = pd_obj.reset_index()
+        df.columns = [str(col) for col in df.columns]
+        copy_dataframe(self.cur, table_name, df, get_df_type_map(df))
+
+    # Get the rows of a query as dictionaries
+    def fetch_rows(self, sql, args=()):
+        self.cur.execute(sql, args)
+        cols = [desc[0] for desc in self.cur.description]
+        return [dict(zip(cols, row)) for row in self.cur.fetchall()]
+
+    def get_value_table(self, table, row):
+        return "{}_{}".format(table[:-len('_object')], row['value'])
+
+    # Read a saved table with COPY, in the order of its rows
+    # (the tables are only appended to, so the physical order is kept)
+    def read_table(self, table_name):
+        self.cur.execute(
+            """SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+            ORDER BY ordinal_position""", (table_name, ))
+        type_map = dict(self.cur.fetchall())
+        sql = "SELECT {} FROM {} ORDER BY ctid".format(
+            ','.join(map(quote_ident, type_map)), table_name)
+        return copy_query(self.cur, sql, type_map)
+
+    def read_chunks(self, chunk_ids):
+        self.cur.execute(
+            "SELECT chunk_id, data FROM dataframe_chunk WHERE chunk_id = ANY(%s)",
+            (chunk_ids, ))
+        return dict(self.cur.fetchall())
+
+    # Rebuild a dataframe saved with delta logging
+    # The rows are read with one query, joining the rids of the snapshot
+    # (in the order of the dataframe rows) with the column tables
+    # of its index levels and columns, and the result is read with COPY
+    # The planner estimates only a few rows for unnest, so the nested loops
+    # (one index lookup per row and table) are disabled in favour of hash joins
+    # The rows are in the partitions of the run of the snapshot,
+    # or of the runs it reuses rows from
+    def load_dataframe_delta(self, row):
+        self.get_data_cols()
+        run_ids = [row['run_id']] + self.get_run_dependencies(row['run_id'])
+        cols = row['clist']
+        values = ','.join('c{}.value'.format(i) for i in range(len(cols)))
+        joins = ''.join(
+            ' LEFT JOIN {0} c{1} ON c{1}.run_id = ANY(%(run_ids)s) '
+            'AND c{1}.rid = r.rid'.format(self.data_tables[col], i)
+            for i, col in enumerate(cols))
+        sql = """SELECT {}
+            FROM dataframe_delta_object o
+            CROSS JOIN LATERAL unnest(o.rlist) WITH ORDINALITY r(rid, ord){}
+            WHERE o.run_id = %(run_id)s AND o.id = %(id)s
+            ORDER BY r.ord""".format(values, joins)
+        type_map = {col: self.data_type_map[col] for col in cols}
+        self.cur.execute("SET LOCAL enable_nestloop = off")
+        self.cur.execute("SET LOCAL work_mem = '{}'".format(LOAD_WORK_MEM))
+        df = copy_query(self.cur, sql, type_map, {
+            'run_id': row['run_id'],
+            'run_ids': run_ids,
+            'id': row['id']
+        })
+        self.cur.execute("RESET enable_nestloop; RESET work_mem")
+        df.columns = [
+            untype_index_level(col) if i < row['nlevels'] else col
+            for i, col in enumerate(cols)
+        ]
+        df = restore_pandas(df, 'dataframe', row['nlevels'])
+        df.index.names = row['names'][:row['nlevels']]
+        df.columns = row['names'][row['nlevels']:]
+        if row['freq'] is not None:
+            df.index.freq = row['freq']
+        return df
+
+
+# Rename the index levels of a dataframe saved with delta logging
+# (the first nlevels columns, see get_df_data) as <name>:<type>
+# The index levels are saved by name and type, so that the unnamed
+# indexes of different types of different dataframes don't clash
+def type_index_levels(df_2, type_map, nlevels):
+    names = {
+        col: '{}:{}'.format(col, type_map[col])
+        for col in df_2.columns[:nlevels]
+    }
+    type_map = {names.get(col, col): t for col, t in type_map.items()}
+    return df_2.rename(columns=names), type_map
 
-        This is used to be able to compare new (from the new dataframe) 
-        and old (from the database) dataframe rows using their hashes
-        """
-        if psql_type == 'real':
-            return float(format(elem, '.6g'))
-        elif psql_type == 'double precision':
-            return float(format(elem, '.15g'))
-        elif psql_type == 'timestamp':
-            if isinstance(elem, pd.Timestamp):
-                return elem.to_pydatetime()
-            else:
-                return elem
-        elif psql_type == 'text':
-            if type(elem) == float:
-                return "NaN"
-            return str(elem)
-        else:
-            return elem
\ No newline at end of file
+
+# Get the name of an index level renamed by type_index_levels
+def untype_index_level(col):
+    return col.rsplit(':', 1)[0]
@@ -1,5 +1,28 @@
+import pickle
 from datetime import datetime
 
+# Placeholder types of the unpicklable types, by name (see DbObject.__reduce__)
+placeholder_types = {}
+
+
+# Get the placeholder type with the given name
+def get_placeholder_type(name):
+    if name not in placeholder_types:
+        placeholder_types[name] = type(name, (object, ), {})
+    return placeholder_types[name]
+
+
+# Rebuild a pickled DbObject
+# An unpicklable type is replaced by a placeholder type with the same name
+def load_db_object(_type, type_name, _time, lineno, name, value, s_id,
+                   policy=None):
+    if _type is None:
+        _type = get_placeholder_type(type_name)
+    obj = DbObject(_type, _time, lineno, name, value)
+    obj.s_id = s_id
+    obj.policy = policy
+    return obj
+
 
 class DbObject(object):
     """
@@ -15,14 +38,40 @@ class DbObject(object):
         self.lineno = lineno
         self.name = name
         self.value = value
+        self.s_id = None
+        self.policy = None
 
     def __repr__(self):
+        if self.policy is not None:
+            return "DbObject(name: {}, type: {}, lineno: {}, policy: {})".format(
+                self.name, self.type.__name__, self.lineno, self.policy)
         return "DbObject(name: {}, type: {}, lineno: {})".format(
             self.name, self.type.__name__, self.lineno)
 
     def __str__(self):
         return repr(self)
 
+    # Replace the value by a copy of itself, so that the object can
+    # still be saved later if the original value is modified in between
+    # Immutable values (scalars, tuples, frozensets) are kept as they are
+    def snapshot(self):
+        if hasattr(self.value, 'copy'):
+            self.value = self.value.copy()
+        return self
+
+    # Pickle the object (used to send the log of a worker process back)
+    # Types defined by the executed code can't be pickled,
+    # only their name is kept in that case
+    def __reduce__(self):
+        _type = self.type
+        try:
+            pickle.dumps(_type)
+        except Exception:
+            _type = None
+        return (load_db_object, (_type, self.type.__name__, self.time,
+                                 self.lineno, self.name, self.value,
+                                 self.s_id, self.policy))
+
     @property
     def __class__(self):
         return self.type
\ No newline at end of file
@@ -0,0 +1,55 @@
+import importlib
+
+# Storage backends, as (module, class) names
+# The module of a backend is only imported when it is used,
+# so the sqlite backend doesn't need psycopg2 or sqlalchemy
+BACKENDS = {
+    'postgresql': ('dbInterface', 'DbInterface'),
+    'sqlite': ('sqliteInterface', 'SqliteInterface'),
+}
+
+
+# Get the backend class with the given name
+def get_backend_class(backend):
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: {} (options are: {})".format(
+            backend, ', '.join(BACKENDS)))
+    module_name, class_name = BACKENDS[backend]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class DbResource(object):
+    """
+    DbResource class
+
+    Allows to write:
+    db_resource = DbResource(delta_logging)
+    with db_resource as db:
+       db.save(...)
+
+    The returned db object is an instance of the chosen backend
+    (DbInterface for postgresql, SqliteInterface for sqlite)
+    The connection and disconnection is handled automatically
+    With asynchronous logging, all the queued objects
+    are written before disconnecting
+    """
+    def __init__(self, delta_logging=True, async_logging=False,
+                 queue_size=1000, chunk_logging=False,
+                 backend='postgresql', logging_policies=None,
+                 skip_unchanged=False, profiler=None):
+        backend_class = get_backend_class(backend)
+        self.db_interface_obj = backend_class(delta_logging,
+                                              async_logging,
+                                              queue_size,
+                                              chunk_logging=chunk_logging)
+        self.db_interface_obj.set_logging_policies(logging_policies)
+        self.db_interface_obj.set_skip_unchanged(skip_unchanged)
+        self.db_interface_obj.set_profiler(profiler)
+
+    def __enter__(self):
+        self.db_interface_obj.connect()
+        return self.db_interface_obj
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.db_interface_obj.flush()
+        self.db_interface_obj.disconnect()
@@ -0,0 +1,128 @@
+import queue
+import threading
+from collections import OrderedDict
+
+# Seconds between the checks that the writer is running
+# while waiting for the queue
+WAIT_TIMEOUT = 0.1
+
+
+class DbWriter(threading.Thread):
+    """
+    DbWriter class
+
+    Background thread saving DbObject instances for a DbInterface
+
+    The objects are put on a bounded queue, so the put call blocks
+    when the writer can't keep up (backpressure)
+
+    The queued objects are written in batches:
+    scalars and arrays are grouped by table and inserted with
+    one statement per table, other objects are saved one by one
+
+    Errors can't be raised in the executing code anymore,
+    so they are collected in the errors list as (obj, exception) tuples
+    If the thread stops on an unexpected error, it is kept in failure
+    and the calls waiting for the writer raise
+    """
+    def __init__(self, db, queue_size=1000, batch_size=500):
+        super(DbWriter, self).__init__(daemon=True)
+        self.db = db
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.errors = []
+        self.failure = None
+
+    # Queue an object to save
+    # Blocks if the queue is full, raises if the writer stopped
+    def put(self, obj):
+        while True:
+            self.check_alive()
+            try:
+                self.queue.put(obj, timeout=WAIT_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    # Wait until all the queued objects are written
+    # Raises if the writer stopped before writing them
+    def flush(self):
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0:
+                self.check_alive()
+                self.queue.all_tasks_done.wait(WAIT_TIMEOUT)
+
+    # Write all the queued objects and stop the thread
+    # Raises if the writer stopped before
+    def close(self):
+        if self.is_alive():
+            self.put(None)
+        self.join()
+        if self.failure is not None:
+            raise RuntimeError("The background writer failed") \
+                from self.failure
+
+    # Raise if the thread is not running anymore
+    def check_alive(self):
+        if not self.is_alive():
+            raise RuntimeError("The background writer is not running") \
+                from self.failure
+
+    def run(self):
+        try:
+            stop = False
+            while not stop:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                objs = [obj for obj in batch if obj is not None]
+                stop = len(objs) < len(batch)
+                try:
+                    self.write_batch(objs)
+                except Exception as e:
+                    # The changes that are not committed are lost,
+                    # but the next batches can still be written
+                    self.db.rollback()
+                    failed = {id(obj) for obj, _ in self.errors}
+                    self.errors.extend([(obj, e) for obj in objs
+                                        if id(obj) not in failed])
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+        except BaseException as e:
+            self.failure = e
+
+    # Write a batch of objects
+    # The rows of the same table are inserted together,
+    # in the order in which they were queued
+    # Each object saved alone and each insert is done in a savepoint,
+    # so that a failure doesn't abort the writing of the other objects
+    def write_batch(self, objs):
+        tables = OrderedDict()
+        for obj in objs:
+            try:
+                insert = self.db.get_insert(obj)
+                if insert is None:
+                    with self.db.savepoint():
+                        self.db.save_now(obj)
+                    obj.value = None
+                else:
+                    table, cols, rows = insert
+                    tables.setdefault((table, cols), []).append((obj, rows))
+            except Exception as e:
+                self.errors.append((obj, e))
+        for (table, cols), items in tables.items():
+            rows = [row for _, obj_rows in items for row in obj_rows]
+            try:
+                with self.db.profile_save([obj for obj, _ in items]), \
+                        self.db.savepoint():
+                    self.db.insert_rows(table, cols, rows)
+            except Exception as e:
+                self.errors.extend([(obj, e) for obj, _ in items])
+            for obj, _ in items:
+                obj.value = None
+        if self.db.concurrent:
+            self.db.commit()
@@ -1,8 +1,82 @@
+import pickle
+import multiprocessing
+from time import perf_counter
 from datetime import datetime
 from dbObject import DbObject
-from dbInterface import DbResource
+from profiler import Profiler
+from dbResource import DbResource
 from split_primitive_classes import DfPartitioner, SplitCommandParser
 
+# State of the parallel execution of the split partitions:
+# (executor, globals before the split, globals of every partition,
+# code blocks to execute, index of the first code block to execute)
+# It is set before forking the worker processes, so that the workers
+# inherit it instead of receiving it pickled (code objects
+# and the globals of the executed code can't be pickled)
+parallel_state = None
+
+
+# Run the remaining code blocks on one partition in a worker process
+# The values are saved with a new connection, and
+# the log is sent back without the values
+# With profiling, the worker has its own profiler, sent back with the log
+def run_partition(split_id):
+    executor, main_globs, globs_list, code_list, start = parallel_state
+    # The functions defined before the split look up the log and the backend
+    # in the globals they were defined in, so the partition is run
+    # in the worker's own copy of those globals
+    globs = main_globs
+    globs.update(globs_list[split_id])
+    log = []
+    profiler = None if executor.profiler is None else Profiler()
+    db_resource = DbResource(executor.delta_logging, executor.async_logging,
+                             executor.queue_size, executor.chunk_logging,
+                             executor.backend, executor.logging_policies,
+                             executor.skip_unchanged, profiler)
+    with db_resource as db:
+        db.set_concurrent(True)
+        db.set_run_id(executor.run_id)
+        db.set_split_id(split_id)
+        globs['log'] = log
+        globs['db'] = db
+        for i, code in enumerate(code_list):
+            exec_code(code, globs, profiler, start + i,
+                      executor.block_flag_list[start + i], split_id)
+    executor.mark_async_errors(db.get_async_errors(), log)
+    return [get_log_summary(log_item) for log_item in log], profiler
+
+
+# Execute a code block with the given globals
+# With a profiler, the execution time of the block is recorded
+def exec_code(code, globs, profiler, index, flag, split_id=None):
+    if profiler is None:
+        exec(code, globs)
+        return
+    log_time = profiler.log_time
+    start = perf_counter()
+    try:
+        exec(code, globs)
+    finally:
+        profiler.record_block(index, flag, split_id, perf_counter() - start,
+                              profiler.log_time - log_time)
+
+
+# Get a copy of a log item without the value of the object,
+# that can be sent back from a worker process
+def get_log_summary(log_item):
+    obj = log_item[0]
+    summary = DbObject(obj.type, obj.time, obj.lineno, obj.name, None)
+    summary.s_id = obj.s_id
+    summary.policy = obj.policy
+    if len(log_item) < 3:
+        return (summary, log_item[1])
+    e = log_item[2]
+    try:
+        pickle.dumps(e)
+    except Exception:
+        e = Exception(str(e))
+    return (summary, log_item[1], e)
+
 
 class Executor(object):
     """
@@ -17,7 +91,18 @@ class Executor(object):
                  code_list=None,
                  block_flag_list=None,
                  delta_logging=False,
-                 split_command=None):
+                 split_command=None,
+                 async_logging=False,
+                 queue_size=1000,
+                 chunk_logging=False,
+                 backend='postgresql',
+                 parallel=False,
+                 processes=None,
+                 fork=False,
+                 logging_policies=None,
+                 skip_unchanged=False,
+                 profiler=None,
+                 script=None):
         super(Executor, self).__init__()
         self.code_list = code_list
         self.block_flag_list = block_flag_list
@@ -25,12 +110,28 @@ class Executor(object):
         self.num_logged_blocks = sum(block_flag_list)
         self.set_split_command(split_command)
         self.delta_logging = delta_logging
+        self.chunk_logging = chunk_logging
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+        self.backend = backend
+        self.parallel = parallel
+        self.processes = processes
+        self.fork = fork
+        self.logging_policies = logging_policies
+        self.skip_unchanged = skip_unchanged
+        self.profiler = profiler
+        self.script = script
+        self.run_id = None
         self.log = None
 
     # Get the log of the last execution
     def get_log(self):
         return self.log
 
+    # Get the id of the run of the last execution (see DbBackend.start_run)
+    def get_run_id(self):
+        return self.run_id
+
     # Set the code block list
     def set_code_list(self, code_list):
         self.code_list = code_list
@@ -54,36 +155,152 @@ class Executor(object):
     def set_delta_logging(self, delta_logging):
         self.delta_logging = delta_logging
 
+    # Set the chunk logging parameter
+    def set_chunk_logging(self, chunk_logging):
+        self.chunk_logging = chunk_logging
+
+    # Set the asynchronous logging parameters
+    def set_async_logging(self, async_logging, queue_size=1000):
+        self.async_logging = async_logging
+        self.queue_size = queue_size
+
+    # Set the storage backend (see dbResource)
+    def set_backend(self, backend):
+        self.backend = backend
+
+    # Set the parallel execution parameters
+    # With parallel execution, the split partitions are executed
+    # in a pool of processes (by default, as many as there are cores)
+    def set_parallel(self, parallel, processes=None):
+        self.parallel = parallel
+        self.processes = processes
+
+    # Set the fork parameter
+    # With fork, every split partition is executed in a forked process,
+    # one after the other, so the globals don't need to be copied
+    # (the forked process shares the memory until it is modified)
+    def set_fork(self, fork):
+        self.fork = fork
+
+    # Set the logging policies (see DbBackend.set_logging_policies)
+    def set_logging_policies(self, logging_policies):
+        self.logging_policies = logging_policies
+
+    # Set the skip unchanged parameter
+    # With skip unchanged, values that didn't change since
+    # they were last saved are not saved again
+    def set_skip_unchanged(self, skip_unchanged):
+        self.skip_unchanged = skip_unchanged
+
+    # Set the profiler recording the logging overhead of the run
+    # (see profiler), None to not profile the run
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+
+    # Set the name of the executed script, saved with the run
+    def set_script(self, script):
+        self.script = script
+
     # Run the given code blocks using the given logging function
     def run(self, log_func):
         if self.code_list is None:
             raise ValueError("Code list is not defined")
         if self.block_flag_list is None:
             raise ValueError("Block flag list is not defined")
-        db_resource = DbResource(self.delta_logging)
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            self.run_blocks(log_func)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+
+    def run_blocks(self, log_func):
+        db_resource = DbResource(self.delta_logging, self.async_logging,
+                                 self.queue_size, self.chunk_logging,
+                                 self.backend, self.logging_policies,
+                                 self.skip_unchanged, self.profiler)
         with db_resource as db:
-            lb_count = 0  # logged block count
-            self.log = []
-            if self.split_params is not None:
-                globs_list = [{
-                    'log_variable': log_func,
-                    'log': self.log,
-                    'db': db
-                }]
-                for i, code in enumerate(self.code_list):
-                    if self.block_flag_list[i] == 1:
-                        lb_count += 1
-                        if lb_count == self.split_params['block']:
-                            df_partitioner = DfPartitioner(self.split_params)
-                            globs_list = df_partitioner.partition_from_globs(
-                                *globs_list)
-                    for j, globs in enumerate(globs_list):
-                        if len(globs_list) > 1:
-                            db.set_split_id(j)
-                        else:
-                            db.reset_split_id()
-                        exec(code, globs)
-            else:
-                globs = {'log_variable': log_func, 'log': self.log, 'db': db}
-                for i, code in enumerate(self.code_list):
-                    exec(code, globs)
\ No newline at end of file
+            self.run_id = db.start_run(self.script)
+            try:
+                self.run_code(db, log_func)
+            except BaseException:
+                db.end_run('failed')
+                raise
+            db.end_run()
+        self.mark_async_errors(db.get_async_errors(), self.log)
+
+    # Run the code blocks, saving the values with the given backend
+    def run_code(self, db, log_func):
+        lb_count = 0  # logged block count
+        self.log = []
+        if self.split_params is not None:
+            main_globs = {
+                'log_variable': log_func,
+                'log': self.log,
+                'db': db
+            }
+            globs_list = [main_globs]
+            for i, code in enumerate(self.code_list):
+                if self.block_flag_list[i] == 1:
+                    lb_count += 1
+                    if lb_count == self.split_params['block']:
+                        df_partitioner = DfPartitioner(self.split_params)
+                        globs_list = df_partitioner.partition_from_globs(
+                            *globs_list,
+                            deepcopy=not (self.parallel or self.fork))
+                if (self.parallel or self.fork) and len(globs_list) > 1:
+                    self.run_parallel(db, main_globs, globs_list, i)
+                    break
+                for j, globs in enumerate(globs_list):
+                    if len(globs_list) > 1:
+                        db.set_split_id(j)
+                    else:
+                        db.reset_split_id()
+                    exec_code(code, globs, self.profiler, i,
+                              self.block_flag_list[i], db.split_id)
+        else:
+            globs = {'log_variable': log_func, 'log': self.log, 'db': db}
+            for i, code in enumerate(self.code_list):
+                exec_code(code, globs, self.profiler, i,
+                          self.block_flag_list[i])
+
+    # Run the code blocks from the given index once for every partition,
+    # each partition in a worker process with its own split id
+    # Without parallel execution (fork only), there is one worker at a time
+    # The logs of the workers are added to the log in the partition order
+    def run_parallel(self, db, main_globs, globs_list, start):
+        global parallel_state
+        # The values saved until now are written and committed before forking
+        db.flush()
+        db.commit()
+        if self.parallel:
+            processes = self.processes or multiprocessing.cpu_count()
+            processes = min(processes, len(globs_list))
+        else:
+            processes = 1
+        parallel_state = (self, main_globs, globs_list,
+                          self.code_list[start:], start)
+        try:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(processes, maxtasksperchild=1) as pool:
+                results = pool.map(run_partition,
+                                   range(len(globs_list)),
+                                   chunksize=1)
+        finally:
+            parallel_state = None
+        for log, profiler in results:
+            self.log.extend(log)
+            if profiler is not None:
+                self.profiler.merge(profiler)
+
+    # With asynchronous logging, the objects are logged as saved
+    # when they are queued, so mark the ones that
+    # the background writer failed to save afterwards
+    def mark_async_errors(self, errors, log):
+        if len(errors) == 0:
+            return
+        failed = {id(obj): e for obj, e in errors}
+        for i, log_item in enumerate(log):
+            if id(log_item[0]) in failed:
+                log[i] = (log_item[0], False, failed[id(log_item[0])])
@@ -0,0 +1,121 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from decimal import Decimal
+from datetime import date, time, datetime, timedelta
+"""
+Functions to compute the content fingerprint of a value,
+used to know if a variable changed since it was last saved
+
+Dataframes, series and numpy arrays are hashed with vectorized
+functions (no python loop over the rows), scalars with the hash
+of their type and representation, and lists, tuples, sets and dicts
+with the fingerprints of their items
+Other values have no fingerprint (the representation of an object
+can leave out a part of its content), so they are always saved
+"""
+
+# Types of the scalars whose representation holds their whole value
+SCALAR_TYPES = {
+    type(None), bool, int, float, complex, str, bytes, Decimal, date, time,
+    datetime, timedelta, pd.Timestamp, pd.Timedelta
+}
+
+
+# Get the content fingerprint of a value
+# Returns None if the value can't be fingerprinted
+def get_fingerprint(value):
+    try:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return pandas_fingerprint(value)
+        elif isinstance(value, np.ndarray):
+            return numpy_fingerprint(value)
+        return value_fingerprint(value)
+    except Exception:
+        return None
+
+
+# Fingerprint of the other values (see update_value_hash)
+# Raises a TypeError if the value can't be fingerprinted
+def value_fingerprint(value):
+    h = hashlib.blake2b(digest_size=20)
+    update_value_hash(h, value)
+    return h.hexdigest()
+
+
+# Add a value to a hash: its type, then its representation for scalars,
+# or its items for lists, tuples, sets and dicts
+# (the representation of a container of scalars is hashed at once)
+# The length of every part is hashed before it, so that the parts
+# of different values can't give the same bytes
+def update_value_hash(h, value):
+    update_hash(h, type(value).__name__)
+    if is_scalar(value):
+        update_hash(h, repr(value))
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        update_hash(h, pandas_fingerprint(value))
+    elif isinstance(value, np.ndarray):
+        update_hash(h, numpy_fingerprint(value))
+    elif isinstance(value, (list, tuple)):
+        if all(is_scalar(v) for v in value):
+            update_hash(h, repr(value))
+        else:
+            update_hash(h, str(len(value)))
+            for v in value:
+                update_value_hash(h, v)
+    elif isinstance(value, dict):
+        update_hash(h, str(len(value)))
+        for k, v in value.items():
+            update_value_hash(h, k)
+            update_value_hash(h, v)
+    elif isinstance(value, (set, frozenset)):
+        # The items are in no particular order
+        update_hash(h, str(len(value)))
+        for fingerprint in sorted(value_fingerprint(v) for v in value):
+            update_hash(h, fingerprint)
+    else:
+        raise TypeError("Values of type {} have no fingerprint".format(
+            type(value).__name__))
+
+
+# Add a part of a value to a hash, after its length
+def update_hash(h, text):
+    data = text.encode()
+    h.update(str(len(data)).encode() + b':')
+    h.update(data)
+
+
+# A scalar is fingerprinted with its representation
+def is_scalar(value):
+    return type(value) in SCALAR_TYPES or isinstance(value, np.generic)
+
+
+# Fingerprint of a dataframe or series:
+# the hash of its values (with the index), of its column names and types
+def pandas_fingerprint(value):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        h.update(repr(list(value.columns)).encode())
+        h.update(repr(list(value.dtypes)).encode())
+    else:
+        h.update(repr(value.name).encode())
+        h.update(repr(value.dtype).encode())
+    h.update(repr(value.index.names).encode())
+    h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().data)
+    return h.hexdigest()
+
+
+# Fingerprint of a numpy array: the hash of its type, shape and bytes
+# The values of object arrays are hashed by pandas
+def numpy_fingerprint(value):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(value.dtype.str.encode())
+    h.update(repr(value.shape).encode())
+    if value.dtype == object:
+        h.update(
+            pd.util.hash_pandas_object(pd.Series(value.ravel()),
+                                       index=False).to_numpy().data)
+    else:
+        h.update(np.ascontiguousarray(value).data)
+    return h.hexdigest()
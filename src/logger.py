@@ -4,6 +4,29 @@ from typing import List
 
 NodeList = List[ast.AST]
 
+# Loop logging policies:
+#  - all: log the variables at every iteration
+#  - final: log the variables assigned in the loop once, after the loop
+#  - every:<k>: log the variables every k-th iteration
+#  - buffer: keep the values of every iteration in a list,
+#    and log the lists once, after the loop
+LOOP_POLICIES = ['all', 'final', 'every', 'buffer']
+
+
+# Parse a loop logging policy written as: all, final, every:<k> or buffer
+# Returns a (policy, k) tuple
+def parse_loop_policy(text):
+    policy, _, k = text.strip().lower().partition(':')
+    if policy not in LOOP_POLICIES or (policy == 'every') != (k != ''):
+        raise ValueError("Incorrect loop logging policy: {}".format(text))
+    if policy == 'every':
+        if not k.isdigit() or int(k) < 1:
+            raise ValueError(
+                "The iteration step must be a positive integer: {}".format(
+                    text))
+        return (policy, int(k))
+    return (policy, None)
+
 
 class Logger(ast.NodeTransformer):
     """
@@ -11,6 +34,10 @@ class Logger(ast.NodeTransformer):
 
     Implements visit functions of the NodeTransformer 
     to add logging functions at the needed places
+
+    The variables assigned in for and while loops are logged
+    according to the loop logging policy (see parse_loop_policy)
+    Nested loops follow the policy of the outermost loop
     """
     def __init__(self, log_function, *log_function_args):
         super(Logger, self).__init__()
@@ -20,6 +47,9 @@ class Logger(ast.NodeTransformer):
             self.log_function = log_function
         self.log_function_args = log_function_args
         self.modifier_functions = set(['append', 'pop', 'sort'])
+        self.loop_policy = ('all', None)
+        self.loop_count = 0
+        self.in_loop = False
 
     def add_modifier_attr_fcts(self, fct_names):
         self.modifier_functions.update(fct_names)
@@ -27,15 +57,25 @@ class Logger(ast.NodeTransformer):
     def get_modifier_attr_fcts(self):
         return self.modifier_functions.copy()
 
+    # Set the loop logging policy used for the next visits
+    def set_loop_policy(self, loop_policy):
+        self.loop_policy = parse_loop_policy(loop_policy)
+
+    def get_loop_policy(self):
+        return ':'.join(str(v) for v in self.loop_policy if v is not None)
+
     # This is kinda hardcoded, but just change this
     # depending on the arguments of the logging function used
-    def get_log_function_args(self, node):
+    # The logged value is the variable, unless another value node is given
+    def get_log_function_args(self, node, value=None):
         if not isinstance(node, ast.Name):
             raise ValueError("Node must be of type ast.Name")
         args = []
         for arg in self.log_function_args:
             if arg == 'val':
-                args.append(ast.Name(id=node.id, ctx=ast.Load()))
+                if value is None:
+                    value = ast.Name(id=node.id, ctx=ast.Load())
+                args.append(value)
             elif arg == 'name':
                 args.append(ast.Str(s=node.id))
             elif arg == 'lineno':
@@ -51,15 +91,58 @@ class Logger(ast.NodeTransformer):
     def visit_ClassDef(self, node):
         return node
 
-    # # We don't want to handle for-loops yet,
-    # # so no generic_visit call (do not visit its children)
-    # def visit_For(self, node):
-    #     return node
+    # Log the variables of the loop according to the loop logging policy
+    def visit_For(self, node):
+        return self.visit_loop(node)
+
+    # Log the variables of the loop according to the loop logging policy
+    def visit_While(self, node):
+        return self.visit_loop(node)
 
-    # # We don't want to handle for-loops yet,
-    # # so no generic_visit call (do not visit its children)
-    # def visit_While(self, node):
-    #     return node
+    # The loop body is first visited as any other code,
+    # then the logging calls of the body are changed according to the policy
+    # The else clause of the loop is not part of the loop
+    def visit_loop(self, node):
+        policy, k = self.loop_policy
+        if self.in_loop or policy == 'all':
+            return self.generic_visit(node)
+        self.in_loop = True
+        try:
+            node.body = [self.visit_stmt(stmt) for stmt in node.body]
+        finally:
+            self.in_loop = False
+        node.orelse = [self.visit_stmt(stmt) for stmt in node.orelse]
+        node.body = [y for x in node.body for y in x]
+        node.orelse = [y for x in node.orelse for y in x]
+
+        loop_var = '_dagger_loop_{}'.format(self.loop_count)
+        self.loop_count += 1
+        rewriter = LoopLogRewriter(self, policy, k, loop_var)
+        node.body = [
+            new_stmt for stmt in node.body
+            for new_stmt in [rewriter.visit(stmt)] if new_stmt is not None
+        ]
+        body_nodes = rewriter.get_body_nodes()
+        before_nodes, after_nodes = rewriter.get_loop_nodes()
+        node.body = body_nodes + node.body
+        # try: <loop> finally: <after nodes>
+        try_node = ast.Try(body=[node],
+                           handlers=[],
+                           orelse=[],
+                           finalbody=after_nodes)
+        for new_node in body_nodes + before_nodes + [try_node]:
+            ast.copy_location(new_node, node)
+            ast.fix_missing_locations(new_node)
+        return [*before_nodes, try_node]
+
+    # Visit a statement and return the list of resulting statements
+    def visit_stmt(self, stmt) -> NodeList:
+        new_stmt = self.visit(stmt)
+        if new_stmt is None:
+            return []
+        elif isinstance(new_stmt, list):
+            return new_stmt
+        return [new_stmt]
 
     # If the node is an expression,
     # test if it is a call to the logging function
@@ -152,3 +235,200 @@ class Logger(ast.NodeTransformer):
             return self.log_name(node.value)
         else:
             return []
+
+
+class LoopLogRewriter(ast.NodeTransformer):
+    """
+    LoopLogRewriter class
+
+    Changes the logging calls in the body of a loop,
+    that was already visited by the Logger, according to the policy:
+     - final: the calls are replaced by adding the variable name
+       to a set, and the last value of every variable in the set
+       is logged after the loop
+     - every:<k>: the calls are only done every k-th iteration
+       (the first one included), using an iteration counter
+     - buffer: the scalar values (int, float, str, bool) are appended
+       to a list per variable, and the lists are logged after the loop
+       A variable with another value is logged as with final
+       (the list would only hold references to its last state)
+
+    The set, counter or buffers are named loop_var,
+    and deleted after the loop
+    The logging after the loop is done in the finally clause of a try
+    statement around the loop, so that it is also done when
+    the loop is left by a return or an exception
+    """
+    # Types of the values kept in the buffers
+    scalar_types = ('int', 'float', 'str', 'bool')
+
+    def __init__(self, logger, policy, k, loop_var):
+        super(LoopLogRewriter, self).__init__()
+        self.logger = logger
+        self.policy = policy
+        self.k = k
+        self.loop_var = loop_var
+        # logged variable name -> line number of its last logging call
+        self.logged = {}
+
+    # Functions and classes defined in the loop are not changed
+    def visit_FunctionDef(self, node):
+        return node
+
+    def visit_AsyncFunctionDef(self, node):
+        return node
+
+    def visit_ClassDef(self, node):
+        return node
+
+    def visit_Lambda(self, node):
+        return node
+
+    def visit_Expr(self, node):
+        if not self.logger.is_log_expr(node)[0]:
+            return node
+        name_node = node.value.args[0]
+        self.logged[name_node.id] = name_node.lineno
+        if self.policy == 'final':
+            # <set>.add('<name>')
+            new_node = ast.Expr(value=self.call_loop_var(
+                'add', [ast.Str(s=name_node.id)]))
+        elif self.policy == 'every':
+            # if <counter> % k == 0: <log call>
+            test = ast.Compare(left=ast.BinOp(left=self.load_loop_var(),
+                                              op=ast.Mod(),
+                                              right=ast.Num(self.k)),
+                               ops=[ast.Eq()],
+                               comparators=[ast.Num(0)])
+            new_node = ast.If(test=test, body=[node], orelse=[])
+        else:
+            # if type(<name>) in (<scalar types>) and
+            #         <buffer>.get('<name>', ()) is not None:
+            #     <buffer>.setdefault('<name>', []).append(<name>)
+            # else:
+            #     <buffer>['<name>'] = None
+            name = ast.Str(s=name_node.id)
+            is_scalar = ast.Compare(
+                left=ast.Call(func=ast.Name(id='type', ctx=ast.Load()),
+                              args=[ast.Name(id=name_node.id, ctx=ast.Load())],
+                              keywords=[]),
+                ops=[ast.In()],
+                comparators=[
+                    ast.Tuple(elts=[
+                        ast.Name(id=scalar_type, ctx=ast.Load())
+                        for scalar_type in self.scalar_types
+                    ],
+                              ctx=ast.Load())
+                ])
+            is_buffered = ast.Compare(
+                left=self.call_loop_var('get', [name, ast.Tuple(elts=[],
+                                                                ctx=ast.Load())]),
+                ops=[ast.IsNot()],
+                comparators=[ast.NameConstant(value=None)])
+            setdefault = self.call_loop_var(
+                'setdefault', [name, ast.List(elts=[], ctx=ast.Load())])
+            append = ast.Expr(value=ast.Call(
+                func=ast.Attribute(value=setdefault,
+                                   attr='append',
+                                   ctx=ast.Load()),
+                args=[ast.Name(id=name_node.id, ctx=ast.Load())],
+                keywords=[]))
+            not_buffered = ast.Assign(targets=[
+                ast.Subscript(value=self.load_loop_var(),
+                              slice=ast.Index(value=name),
+                              ctx=ast.Store())
+            ],
+                                      value=ast.NameConstant(value=None))
+            new_node = ast.If(test=ast.BoolOp(op=ast.And(),
+                                              values=[is_scalar, is_buffered]),
+                              body=[append],
+                              orelse=[not_buffered])
+        new_node = ast.copy_location(new_node, node)
+        ast.fix_missing_locations(new_node)
+        return new_node
+
+    # Get a node loading the counter, set or buffers of the loop
+    def load_loop_var(self):
+        return ast.Name(id=self.loop_var, ctx=ast.Load())
+
+    # Get a node calling a method of the counter, set or buffers of the loop
+    def call_loop_var(self, method, args):
+        return ast.Call(func=ast.Attribute(value=self.load_loop_var(),
+                                           attr=method,
+                                           ctx=ast.Load()),
+                        args=args,
+                        keywords=[])
+
+    # Get the statements to add at the start of the loop body
+    def get_body_nodes(self):
+        if self.policy == 'every':
+            # <counter> += 1
+            return [
+                ast.AugAssign(target=ast.Name(id=self.loop_var,
+                                              ctx=ast.Store()),
+                              op=ast.Add(),
+                              value=ast.Num(1))
+            ]
+        return []
+
+    # Get the statements to add before the loop,
+    # and the ones to add in the finally clause around the loop
+    def get_loop_nodes(self):
+        if self.policy == 'final':
+            # <set> = set()
+            value = ast.Call(func=ast.Name(id='set', ctx=ast.Load()),
+                             args=[],
+                             keywords=[])
+        elif self.policy == 'every':
+            # <counter> = -1 before the loop, <counter> += 1 in the loop
+            value = ast.Num(-1)
+        else:
+            # <buffer> = {}
+            value = ast.Dict(keys=[], values=[])
+        before_nodes = [
+            ast.Assign(targets=[ast.Name(id=self.loop_var, ctx=ast.Store())],
+                       value=value)
+        ]
+        after_nodes = []
+        for name, lineno in self.logged.items():
+            name_node = ast.Name(id=name,
+                                 ctx=ast.Load(),
+                                 lineno=lineno,
+                                 end_lineno=lineno,
+                                 col_offset=0,
+                                 end_col_offset=0)
+            # The variable is not defined if its assignment
+            # in the loop was never executed
+            # if '<name>' in <set or buffer>: ...
+            test = ast.Compare(left=ast.Str(s=name),
+                               ops=[ast.In()],
+                               comparators=[self.load_loop_var()])
+            if self.policy == 'final':
+                # <log call>
+                body = self.logger.log_name(name_node)
+            elif self.policy == 'buffer':
+                # if <buffer>['<name>'] is None: <log call>
+                # else: <log call of <buffer>['<name>']>
+                value = ast.Subscript(value=self.load_loop_var(),
+                                      slice=ast.Index(value=ast.Str(s=name)),
+                                      ctx=ast.Load())
+                log_node = ast.Expr(value=ast.Call(
+                    func=ast.Name(id=self.logger.log_function,
+                                  ctx=ast.Load()),
+                    args=self.logger.get_log_function_args(name_node, value),
+                    keywords=[]))
+                body = [
+                    ast.If(test=ast.Compare(
+                        left=value,
+                        ops=[ast.Is()],
+                        comparators=[ast.NameConstant(value=None)]),
+                           body=self.logger.log_name(name_node),
+                           orelse=[log_node])
+                ]
+            else:
+                continue
+            after_nodes.append(ast.If(test=test, body=body, orelse=[]))
+        # del <set, counter or buffer>
+        after_nodes.append(
+            ast.Delete(targets=[ast.Name(id=self.loop_var, ctx=ast.Del())]))
+        return before_nodes, after_nodes
@@ -0,0 +1,152 @@
+import re
+import numpy as np
+import pandas as pd
+from profile_utils import profile_value
+"""
+Logging policies for big dataframes, series and numpy arrays
+
+Instead of saving the full value, a policy saves a bounded part of it:
+ - full: the whole value (default)
+ - head:<n>: the first n rows
+ - tail:<n>: the last n rows
+ - sample:<n>: a uniform random sample of n rows
+ - stratified:<n>:<column>: a random sample of about n rows, where every
+   value of the column keeps its share of the rows (at least one row)
+   For series and 1d numpy arrays, the values themselves are the strata
+ - summary: the profile of the columns only (see profile_utils)
+
+The sampled rows keep their order in the value, and the samples
+are reproducible (fixed random seed)
+"""
+
+# Random seed of the samples
+SAMPLE_SEED = 0
+
+policy_pattern = re.compile(
+    r"(?P<kind>full|head|tail|sample|stratified|summary)" +
+    r"(?::(?P<n>[\d]+))?(?::(?P<col_name>.+))?$", re.IGNORECASE)
+
+
+class LoggingPolicy(object):
+    """
+    LoggingPolicy class
+
+    A policy deciding which part of a dataframe, series or
+    numpy array is saved (see the module description)
+
+    Created from its text definition with LoggingPolicy.parse,
+    the text definition is saved with every value saved with the policy
+    """
+    row_kinds = ['head', 'tail', 'sample', 'stratified']
+
+    def __init__(self, kind='full', n=None, col_name=None):
+        super(LoggingPolicy, self).__init__()
+        self.kind = kind
+        self.n = n
+        self.col_name = col_name
+
+    def __repr__(self):
+        return ':'.join(
+            str(v) for v in (self.kind, self.n, self.col_name)
+            if v is not None)
+
+    def __str__(self):
+        return repr(self)
+
+    @classmethod
+    def parse(cls, text):
+        match = policy_pattern.match(text.strip())
+        if match is None:
+            raise ValueError("Incorrect logging policy: {}".format(text))
+        kind = match.group('kind').lower()
+        n = match.group('n')
+        col_name = match.group('col_name')
+        if kind in cls.row_kinds and n is None:
+            raise ValueError(
+                "The {} logging policy needs a number of rows".format(kind))
+        if kind not in cls.row_kinds and (n is not None
+                                          or col_name is not None):
+            raise ValueError(
+                "The {} logging policy has no parameters".format(kind))
+        if kind != 'stratified' and col_name is not None:
+            raise ValueError(
+                "Only the stratified logging policy has a column")
+        return cls(kind, None if n is None else int(n), col_name)
+
+    def is_full(self):
+        return self.kind == 'full'
+
+    # Get the part of the value to save
+    # Summaries are Profile instances, the other parts have the type of the value
+    def apply(self, value):
+        if self.kind == 'full':
+            return value
+        elif self.kind == 'summary':
+            return profile_value(value)
+        elif isinstance(value, np.ndarray) and value.ndim == 0:
+            return value
+        elif self.kind == 'head':
+            return take_rows(value, slice(0, self.n))
+        elif self.kind == 'tail':
+            return take_rows(value, slice(max(len(value) - self.n, 0), None))
+        elif self.kind == 'sample':
+            return take_rows(value, uniform_sample(len(value), self.n))
+        elif self.kind == 'stratified':
+            return take_rows(
+                value, stratified_sample(get_strata(value, self.col_name),
+                                         self.n))
+        raise ValueError("Unknown logging policy: {}".format(self.kind))
+
+
+# Get a dictionary mapping variable names to logging policies
+# from a list of policy definitions written as <name>=<policy>,
+# or as <policy> for the default policy (saved with the key None)
+def parse_policies(definitions):
+    policies = {}
+    for definition in definitions:
+        name, sep, text = definition.rpartition('=')
+        policies[name if sep else None] = LoggingPolicy.parse(text)
+    return policies
+
+
+# Get the given rows (positions or slice) of a dataframe, series or numpy array
+def take_rows(value, positions):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.iloc[positions]
+    return value[positions]
+
+
+# Get the sorted positions of a uniform random sample of n rows
+def uniform_sample(n_rows, n):
+    if n >= n_rows:
+        return np.arange(n_rows)
+    rng = np.random.default_rng(SAMPLE_SEED)
+    return np.sort(rng.choice(n_rows, n, replace=False))
+
+
+# Get the values defining the strata of the rows
+def get_strata(value, col_name):
+    if isinstance(value, pd.DataFrame):
+        if col_name is None or col_name not in value.columns:
+            raise ValueError(
+                "Dataframe has no column named {}".format(col_name))
+        return value[col_name]
+    if isinstance(value, np.ndarray) and value.ndim != 1:
+        raise ValueError(
+            "Stratified samples of numpy arrays need a 1d array")
+    return pd.Series(value)
+
+
+# Get the sorted positions of a stratified random sample of about n rows
+# Every stratum gets its share of the n rows, and at least one row
+def stratified_sample(strata: pd.Series, n):
+    n_rows = len(strata)
+    if n >= n_rows:
+        return np.arange(n_rows)
+    codes, _ = pd.factorize(strata, use_na_sentinel=False)
+    sizes = np.bincount(codes)
+    quotas = np.minimum(sizes, np.maximum(1, n * sizes // n_rows))
+    rng = np.random.default_rng(SAMPLE_SEED)
+    ranks = pd.Series(rng.random(n_rows)).groupby(codes).rank(
+        method='first').to_numpy() - 1
+    return np.flatnonzero(ranks < quotas[codes])
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+"""
+Functions to compute the profile of a dataframe, series or numpy array:
+per column statistics computed in one vectorized pass over the values,
+without saving (or copying) the values themselves
+
+A column profile contains:
+ - the number of values and of null values
+ - min, max, mean and standard deviation (numeric columns)
+ - a quantile sketch: the QUANTILES quantiles of the values (numeric columns)
+ - an approximate distinct count, and the HyperLogLog registers
+   it is computed from, so that the profiles can be merged
+"""
+
+# Quantiles saved in the quantile sketch of a numeric column
+QUANTILES = np.linspace(0, 1, 21)
+
+# Number of bits of the hash used to choose a HyperLogLog register
+# (2^10 = 1024 registers of 1 byte, about 3% error on the distinct count)
+HLL_BITS = 10
+
+
+class Profile(object):
+    """
+    Profile class
+
+    Profile of a dataframe, series or numpy array:
+    the number of rows and the ColumnProfile of each column
+    """
+    def __init__(self, nrows, columns):
+        super(Profile, self).__init__()
+        self.nrows = nrows
+        self.columns = columns
+
+    def __len__(self):
+        return self.nrows
+
+
+class ColumnProfile(object):
+    """
+    ColumnProfile class
+
+    Statistics of one column (see the module description)
+    The statistics of non-numeric columns are None
+    """
+    def __init__(self, name, dtype, count, null_count, minimum, maximum,
+                 mean, std, quantiles, hll):
+        super(ColumnProfile, self).__init__()
+        self.name = name
+        self.dtype = dtype
+        self.count = count
+        self.null_count = null_count
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+        self.std = std
+        self.quantiles = quantiles
+        self.hll = hll
+
+    # Approximate number of distinct values
+    def distinct_count(self):
+        return hll_estimate(self.hll)
+
+
+# Get the profile of a dataframe, series or numpy array
+def profile_value(value):
+    if isinstance(value, pd.Series):
+        df = value.to_frame()
+    elif isinstance(value, np.ndarray):
+        df = pd.DataFrame(value.reshape(len(value), -1) if value.ndim > 0
+                          else value.reshape(1, 1),
+                          copy=False)
+    else:
+        df = value
+    return Profile(len(df), [
+        profile_column(str(col_name), df.iloc[:, i])
+        for i, col_name in enumerate(df.columns)
+    ])
+
+
+# Get the profile of a column
+def profile_column(name, col: pd.Series):
+    nulls = col.isna().to_numpy()
+    null_count = int(nulls.sum())
+    count = len(col) - null_count
+    stats = (None, ) * 5
+    if is_numeric(col) and count > 0:
+        values = col.to_numpy(dtype=float, na_value=np.nan)
+        values = values[~nulls] if null_count > 0 else values
+        stats = (float(values.min()), float(values.max()),
+                 float(values.mean()), float(values.std()),
+                 np.quantile(values, QUANTILES).tolist())
+    non_null = col[~nulls] if null_count > 0 else col
+    return ColumnProfile(name, str(col.dtype), count, null_count, *stats,
+                         hll_registers(non_null))
+
+
+# Numeric columns have statistics (booleans are not numeric here)
+def is_numeric(col: pd.Series):
+    return pd.api.types.is_numeric_dtype(col) and \
+        not pd.api.types.is_bool_dtype(col)
+
+
+# Get the number of bits needed to write each value of an uint64 array
+def bit_length(x):
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        n[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+# Get the HyperLogLog registers of the values of a column
+def hll_registers(col: pd.Series, bits=HLL_BITS):
+    registers = np.zeros(1 << bits, dtype=np.uint8)
+    if len(col) == 0:
+        return registers
+    hashes = pd.util.hash_pandas_object(col, index=False).to_numpy()
+    rest_bits = 64 - bits
+    indices = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    ranks = (rest_bits - bit_length(rest) + 1).astype(np.uint8)
+    np.maximum.at(registers, indices, ranks)
+    return registers
+
+
+# Estimate the number of distinct values from HyperLogLog registers
+def hll_estimate(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(int)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
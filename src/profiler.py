@@ -0,0 +1,274 @@
+import sys
+import json
+import threading
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from contextlib import contextmanager
+"""
+Profiler of the logging overhead of a run
+
+Records, per variable and per line (variable name and line number):
+ - the number of logged values, and how many were saved,
+   skipped as unchanged or failed
+ - the estimated size in bytes of the logged values (see value_nbytes)
+ - the logging time: time spent in log_variable by the executed code
+ - the save time: time spent saving the values (serialization and
+   database), in the background writer with asynchronous logging
+ - the database time and the number of bytes sent to the database,
+   measured by the cursors of the backends
+The serialization time is the save time without the database time
+
+Also records the execution time of every code block, and the logging
+time spent in it: the rest of the time is spent in the user's code
+"""
+
+# Number of lines shown in the report
+REPORT_LINES = 20
+
+STAT_KEYS = [
+    'count', 'saved', 'unchanged', 'failed', 'value_bytes', 'log_time',
+    'save_time', 'db_time', 'db_bytes'
+]
+
+
+# Get an empty set of statistics
+def new_stats():
+    return dict.fromkeys(STAT_KEYS, 0)
+
+
+# Add the statistics of other to stats
+def add_stats(stats, other):
+    for key in STAT_KEYS:
+        stats[key] += other[key]
+
+
+# Get an estimate of the size in bytes of a value, without going
+# through its items (computed outside of the measured logging time):
+# the objects of the object columns of dataframes and series are not
+# measured, and the items of lists, tuples and sets are estimated
+# from the size of their first item
+def value_nbytes(value):
+    try:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return int(np.sum(value.memory_usage(index=True, deep=False)))
+        elif isinstance(value, np.ndarray):
+            return int(value.nbytes)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            if len(value) == 0:
+                return sys.getsizeof(value)
+            return sys.getsizeof(value) + len(value) * sys.getsizeof(
+                next(iter(value)))
+        return sys.getsizeof(value)
+    except Exception:
+        return 0
+
+
+class Profiler(object):
+    """
+    Profiler class
+
+    Records the logging overhead of a run (see the module description)
+
+    The backends call record_db for every database call,
+    log_variable calls record_log for every logged value,
+    the saves are timed with save_timer and the code blocks with record_block
+    The background writer records from its own thread, so the
+    statistics are updated under a lock
+
+    The profilers of worker processes are merged with merge
+    """
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.lock = threading.Lock()
+        self.variables = {}
+        self.lines = {}
+        self.blocks = []
+        self.db_calls = 0
+        self.db_time = 0.0
+        self.db_bytes = 0
+        self.log_time = 0.0
+        self.total_time = 0.0
+        self.start_time = None
+
+    # The lock can't be pickled (profilers are sent back by worker processes)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    # Start and stop measuring the total time of the run
+    def start(self):
+        self.start_time = perf_counter()
+
+    def stop(self):
+        if self.start_time is not None:
+            self.total_time += perf_counter() - self.start_time
+            self.start_time = None
+
+    # Get the statistics of a variable and of a line of the variable
+    def get_stats(self, name, lineno):
+        if name not in self.variables:
+            self.variables[name] = new_stats()
+        if (name, lineno) not in self.lines:
+            self.lines[(name, lineno)] = new_stats()
+        return self.variables[name], self.lines[(name, lineno)]
+
+    # Record one database call
+    def record_db(self, duration, nbytes):
+        with self.lock:
+            self.db_calls += 1
+            self.db_time += duration
+            self.db_bytes += nbytes
+
+    # Record one logged value
+    # saved is True if the value was saved, None if it was skipped
+    # as unchanged and False if it couldn't be saved
+    def record_log(self, name, lineno, saved, duration, nbytes):
+        with self.lock:
+            self.log_time += duration
+            for stats in self.get_stats(name, lineno):
+                stats['count'] += 1
+                stats['value_bytes'] += nbytes
+                stats['log_time'] += duration
+                if saved:
+                    stats['saved'] += 1
+                elif saved is None:
+                    stats['unchanged'] += 1
+                else:
+                    stats['failed'] += 1
+
+    # Time the saving of the given objects, with their database time
+    # and bytes (measured with record_db)
+    # Objects saved together share the times and bytes equally
+    @contextmanager
+    def save_timer(self, objs):
+        with self.lock:
+            db_time, db_bytes = self.db_time, self.db_bytes
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start
+            with self.lock:
+                n = max(len(objs), 1)
+                shares = (('save_time', duration / n),
+                          ('db_time', (self.db_time - db_time) / n),
+                          ('db_bytes', (self.db_bytes - db_bytes) / n))
+                for obj in objs:
+                    for stats in self.get_stats(obj.name, obj.lineno):
+                        for key, share in shares:
+                            stats[key] += share
+
+    # Record the execution of a code block
+    # (flag 1 for the logged blocks, see CodeSplitter)
+    # The logging time is the time spent in log_variable during the block
+    def record_block(self, index, flag, split_id, duration, log_time):
+        with self.lock:
+            self.blocks.append({
+                'block': index,
+                'logged': flag == 1,
+                'split_id': split_id,
+                'time': duration,
+                'log_time': log_time,
+            })
+
+    # Add the statistics of another profiler (of a worker process)
+    # The total time is not added, as the workers run during the run
+    def merge(self, other):
+        with self.lock:
+            for name, stats in other.variables.items():
+                add_stats(self.variables.setdefault(name, new_stats()), stats)
+            for key, stats in other.lines.items():
+                add_stats(self.lines.setdefault(key, new_stats()), stats)
+            self.blocks.extend(other.blocks)
+            self.db_calls += other.db_calls
+            self.db_time += other.db_time
+            self.db_bytes += other.db_bytes
+            self.log_time += other.log_time
+
+    # Get the profile as a dictionary that can be saved as json
+    # The variables and lines are sorted by decreasing logging time
+    def to_dict(self):
+        def sort_key(item):
+            return -item[1]['log_time']
+
+        return {
+            'total_time': self.total_time,
+            'log_time': self.log_time,
+            'db_calls': self.db_calls,
+            'db_time': self.db_time,
+            'db_bytes': self.db_bytes,
+            'blocks': list(self.blocks),
+            'variables': [
+                dict(name=name, **stats)
+                for name, stats in sorted(self.variables.items(), key=sort_key)
+            ],
+            'lines': [
+                dict(name=name, lineno=lineno, **stats)
+                for (name, lineno), stats in sorted(self.lines.items(),
+                                                    key=sort_key)
+            ],
+        }
+
+    # Save the profile in a json file
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    # Get the text report of the profile
+    def report(self, max_lines=REPORT_LINES):
+        profile = self.to_dict()
+        block_time = sum(block['time'] for block in self.blocks)
+        out = [
+            "Total time: {:.3f}s, code blocks: {:.3f}s, logging: {:.3f}s".
+            format(self.total_time, block_time, self.log_time),
+            "Database: {} calls, {:.3f}s, {} sent".format(
+                self.db_calls, self.db_time, format_bytes(self.db_bytes)),
+            "Blocks:",
+            "  {:>5} {:>5} {:>6} {:>10} {:>10} {:>10}".format(
+                'block', 'split', 'logged', 'time(s)', 'logging(s)',
+                'code(s)'),
+        ]
+        for block in self.blocks:
+            out.append("  {:>5} {:>5} {:>6} {:>10.4f} {:>10.4f} {:>10.4f}".
+                       format(block['block'],
+                              '-' if block['split_id'] is None else
+                              block['split_id'], 'yes' if block['logged']
+                              else 'no', block['time'], block['log_time'],
+                              block['time'] - block['log_time']))
+        header = "  {:<30} {:>6} {:>6} {:>6} {:>6} {:>10} {:>8} {:>8} " \
+            "{:>8} {:>8} {:>10}".format('variable', 'count', 'saved',
+                                        'unch.', 'failed', 'est.size', 'log(s)',
+                                        'save(s)', 'ser.(s)', 'db(s)',
+                                        'db sent')
+        for title, key in (('Variables', 'variables'), ('Lines', 'lines')):
+            out.append("{} (by logging time, top {}):".format(
+                title, max_lines))
+            out.append(header)
+            for stats in profile[key][:max_lines]:
+                name = stats['name'] if key == 'variables' else \
+                    '{}:{}'.format(stats['name'], stats['lineno'])
+                out.append(
+                    "  {:<30} {:>6} {:>6} {:>6} {:>6} {:>10} {:>8.4f} "
+                    "{:>8.4f} {:>8.4f} {:>8.4f} {:>10}".format(
+                        name[:30], stats['count'], stats['saved'],
+                        stats['unchanged'], stats['failed'],
+                        format_bytes(stats['value_bytes']),
+                        stats['log_time'], stats['save_time'],
+                        stats['save_time'] - stats['db_time'],
+                        stats['db_time'], format_bytes(stats['db_bytes'])))
+        return '\n'.join(out)
+
+
+# Format a number of bytes with a unit
+def format_bytes(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024 or unit == 'GB':
+            return "{:.1f}{}".format(nbytes, unit) if unit != 'B' else \
+                "{}B".format(int(nbytes))
+        nbytes /= 1024
@@ -2,35 +2,77 @@ import ast
 import astor
 import argparse
 import astpretty
-from logger import Logger
+from logger import Logger, parse_loop_policy
 from executor import Executor
 from datetime import datetime
 from dbObject import DbObject
 from block import Block, BlockList
 from code_splitter import CodeSplitter
-from dbInterface import DbResource, DbInterface
+from code_cache import CodeCache, get_cache_key
+from dbBackend import DbBackend
+from logging_policies import parse_policies
+from profiler import Profiler, value_nbytes
+from time import perf_counter
 
 ltz = datetime.utcnow().astimezone().tzinfo
 
 
 # Saves the variable in the database and adds an entry in the log
+# (obj, True) if saved, (obj, None) if skipped because it didn't change,
+# (obj, False, exception) if it couldn't be saved
 # If you change the arguments of this function, you also need to
 # modify them in the Logger class and below in the arguments when creating the logger,
 # and possibly add, change or remove variables in the globals in executor
 def log_variable(value: object,
                  name: str = None,
                  lineno: int = None,
-                 db: DbInterface = None,
+                 db: DbBackend = None,
                  log=None):
     if name is None:
         return
+    profiler = db.profiler
+    if profiler is not None:
+        nbytes = value_nbytes(value)
+        start = perf_counter()
     obj = DbObject(type(value), datetime.now(ltz), lineno, name, value)
     try:
         res = db.save(obj)
     except Exception as e:
         log.append((obj, False, e))
     else:
-        log.append((obj, True))
+        log.append((obj, True if res else None))
+    if profiler is not None:
+        profiler.record_log(name, lineno, log[-1][1],
+                            perf_counter() - start, nbytes)
+
+
+# Split the code of a script in code blocks, add the logging functions
+# in the code blocks of the blocklist and compile the code blocks
+# Returns the compiled code blocks and their block flags (see CodeSplitter)
+def instrument(source, name, blocklist, logger, loop_policy='all'):
+    tree = ast.parse(source)
+
+    # Split the code in different code blocks
+    # according to the given blocklist
+    splitter = CodeSplitter(blocklist)
+    tree_splits, block_flags = splitter.split(tree)
+
+    # Visit the ast of the source code and add the needed logging functions
+    # The loop logging policy of a block is its own policy if it has one,
+    # the given loop policy otherwise
+    code_splits = []
+    blocks_iter = iter(blocklist.get_blocks())
+    for i, tree_split in enumerate(tree_splits):
+        if block_flags[i] == 1:
+            block = next(blocks_iter)
+            logger.set_loop_policy(block.loop_policy or loop_policy)
+            tree_split = logger.visit(tree_split)
+        # # Uncomment/Comment this to view/hide
+        # # source code of created code blocks
+        # print("-----", i, "-----")
+        # print(astor.to_source(tree_split))
+        code_splits.append(compile(tree_split, name, 'exec'))
+    return code_splits, block_flags
 
 
 # Runs a python script file and saves the variables
@@ -42,19 +84,27 @@ def main(name,
          blocks=[],
          modifier_attr_fcts=[],
          delta_logging=True,
-         split_command=None):
+         split_command=None,
+         async_logging=False,
+         queue_size=1000,
+         chunk_logging=False,
+         backend='postgresql',
+         parallel=False,
+         processes=None,
+         fork=False,
+         logging_policies=[],
+         skip_unchanged=False,
+         loop_policy='all',
+         code_cache=True,
+         profile=False,
+         profile_json=None):
 
-    # Read the script file and parse the code into an ast
-    source = open(name, 'r').read()
-    tree = ast.parse(source)
+    # Read the script file
+    with open(name, 'rb') as f:
+        source = f.read()
 
     blocklist = BlockList(*blocks)
 
-    # Split the code in different code blocks
-    # according to the given blocklist
-    splitter = CodeSplitter(blocklist)
-    tree_splits, block_flags = splitter.split(tree)
-
     print("Blocks checked:")
     print(blocklist.get_blocks())
 
@@ -65,23 +115,41 @@ def main(name,
     print("Modifier functions logged:")
     print(list(logger.get_modifier_attr_fcts()))
 
-    # Visit the ast of the source code and add the needed logging functions
-    code_splits = []
-    for i, tree_split in enumerate(tree_splits):
-        if block_flags[i] == 1:
-            tree_split = logger.visit(tree_split)
-        # # Uncomment/Comment this to view/hide
-        # # source code of created code blocks
-        # print("-----", i, "-----")
-        # print(astor.to_source(tree_split))
-        code_splits.append(compile(tree_split, name, 'exec'))
+    # Get the instrumented code blocks from the code cache,
+    # or instrument and compile the code and cache it
+    cached = None
+    if code_cache:
+        cache = CodeCache(name)
+        key = get_cache_key(source, blocklist.get_blocks(),
+                            logger.get_modifier_attr_fcts(), loop_policy)
+        cached = cache.get(key)
+    if cached is not None:
+        code_splits, block_flags = cached
+    else:
+        code_splits, block_flags = instrument(source, name, blocklist, logger,
+                                              loop_policy)
+        if code_cache:
+            cache.put(key, code_splits, block_flags)
 
     # Execute the given code blocks
     # Specify delta logging and split command as needed
     executor = Executor(code_splits, block_flags, delta_logging=delta_logging)
     executor.set_split_command(split_command)
+    executor.set_async_logging(async_logging, queue_size)
+    executor.set_chunk_logging(chunk_logging)
+    executor.set_backend(backend)
+    executor.set_parallel(parallel, processes)
+    executor.set_fork(fork)
+    executor.set_logging_policies(parse_policies(logging_policies))
+    executor.set_skip_unchanged(skip_unchanged)
+    executor.set_script(name)
+    profiler = None
+    if profile or profile_json is not None:
+        profiler = Profiler()
+        executor.set_profiler(profiler)
     executor.run(log_func=log_variable)
     log = executor.get_log()
+    print("Run id: {}".format(executor.get_run_id()))
 
     # Print the log after execution
     print("Log:")
@@ -89,27 +157,53 @@ def main(name,
         if log_item[1]:
             print("{}: Saved {}".format(log_item[0].time.strftime('%H:%M:%S'),
                                         log_item[0]))
+        elif log_item[1] is None:
+            print("{}: Unchanged {}".format(
+                log_item[0].time.strftime('%H:%M:%S'), log_item[0]))
         else:
             print("{}: Not Saved {}".format(
                 log_item[0].time.strftime('%H:%M:%S'), log_item[0]))
             print("Message: {}".format(log_item[2]))
 
+    # Print the profile of the logging overhead and save it as json
+    if profiler is not None:
+        print("Profile:")
+        print(profiler.report())
+        if profile_json is not None:
+            profiler.save_json(profile_json)
+            print("Profile saved in {}".format(profile_json))
+
 
 if __name__ == '__main__':
 
     # Creates a block from a tuple of line numbers written as: (start,end)
+    # or (start,end,loop_policy) to give the block its own loop logging policy
     def block_list(s):
         try:
-            block = tuple(map(int, s.strip('()').split(',')))
+            block = s.strip('()').split(',')
+            loop_policy = None
+            if len(block) == 3:
+                loop_policy = block.pop().strip()
+                parse_loop_policy(loop_policy)
+            block = tuple(map(int, block))
             if len(block) == 2 and block[0] < block[1]:
-                return Block(block[0], block[1])
+                return Block(block[0], block[1], loop_policy)
             else:
                 raise argparse.ArgumentTypeError(
                     "Blocks must be defined as '(start,end)', with end > start"
                 )
         except:
             raise argparse.ArgumentTypeError(
-                "Blocks must be defined as '(start,end)', with end > start")
+                "Blocks must be defined as '(start,end)' or "
+                "'(start,end,loop_policy)', with end > start")
+
+    # Check the loop logging policy
+    def loop_policy(s):
+        try:
+            parse_loop_policy(s)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+        return s
 
     # Parse input string into a boolean value
     def str2bool(v):
@@ -132,7 +226,8 @@ if __name__ == '__main__':
                         default=[],
                         type=block_list,
                         nargs='*',
-                        help='Pipeline blocks written as (start,end)')
+                        help='Pipeline blocks written as (start,end) '
+                        'or (start,end,loop_policy)')
     # Get the list of modifier attribute functions
     parser.add_argument('-maf',
                         '--modifier_attr_fcts',
@@ -150,6 +245,38 @@ if __name__ == '__main__':
                         type=str2bool,
                         nargs='?',
                         help='Save dataframes using delta logging or not')
+    # Save dataframes and series as column chunks or not
+    parser.add_argument('-cl',
+                        '--chunk_logging',
+                        const=True,
+                        default=False,
+                        dest='cl',
+                        type=str2bool,
+                        nargs='?',
+                        help='Save dataframes as column chunks or not')
+    # Save values asynchronously in a background thread or not
+    parser.add_argument('-al',
+                        '--async_logging',
+                        const=True,
+                        default=False,
+                        dest='al',
+                        type=str2bool,
+                        nargs='?',
+                        help='Save values in a background thread or not')
+    # Maximum number of values waiting to be saved with asynchronous logging
+    parser.add_argument('-qs',
+                        '--queue_size',
+                        default=1000,
+                        dest='qs',
+                        type=int,
+                        help='Size of the asynchronous logging queue')
+    # Storage backend where the values are saved
+    parser.add_argument('-db',
+                        '--backend',
+                        default='postgresql',
+                        dest='db',
+                        choices=['postgresql', 'sqlite'],
+                        help='Storage backend (postgresql or sqlite)')
     # Command to split a dataframe during execution
     # To view command syntax, look at the SplitCommandParser class
     parser.add_argument('-s',
@@ -158,9 +285,100 @@ if __name__ == '__main__':
                         dest='s',
                         type=str,
                         help='Split command')
+    # Execute the split partitions in parallel or not
+    parser.add_argument('-p',
+                        '--parallel',
+                        const=True,
+                        default=False,
+                        dest='p',
+                        type=str2bool,
+                        nargs='?',
+                        help='Execute the split partitions in parallel or not')
+    # Number of worker processes for the parallel execution
+    parser.add_argument('-np',
+                        '--processes',
+                        default=None,
+                        dest='np',
+                        type=int,
+                        help='Number of processes executing the partitions')
+    # Execute every split partition in a forked process or not
+    parser.add_argument('-f',
+                        '--fork',
+                        const=True,
+                        default=False,
+                        dest='f',
+                        type=str2bool,
+                        nargs='?',
+                        help='Execute the split partitions in forked processes')
+    # Logging policies of the dataframes, series and numpy arrays
+    # To view the possible policies, look at the logging_policies module
+    parser.add_argument('-lp',
+                        '--logging_policies',
+                        default=[],
+                        dest='lp',
+                        type=str,
+                        nargs='*',
+                        help='Logging policies written as [name=]policy '
+                        '(ex: sample:1000 df=head:100)')
+    # Skip saving values that didn't change since they were last saved or not
+    parser.add_argument('-su',
+                        '--skip_unchanged',
+                        const=True,
+                        default=False,
+                        dest='su',
+                        type=str2bool,
+                        nargs='?',
+                        help='Skip saving unchanged values or not')
+    # Loop logging policy of the blocks without their own policy
+    # To view the possible policies, look at the logger module
+    parser.add_argument('-lo',
+                        '--loop_policy',
+                        default='all',
+                        dest='lo',
+                        type=loop_policy,
+                        help='Loop logging policy: all, final, every:<k> '
+                        'or buffer')
+    # Use the cached compiled code of previous runs or not
+    parser.add_argument('-cc',
+                        '--code_cache',
+                        const=True,
+                        default=True,
+                        dest='cc',
+                        type=str2bool,
+                        nargs='?',
+                        help='Cache the compiled code of the script or not')
+    # Profile the logging overhead of the run or not
+    parser.add_argument('-pr',
+                        '--profile',
+                        const=True,
+                        default=False,
+                        dest='pr',
+                        type=str2bool,
+                        nargs='?',
+                        help='Print the profile of the logging overhead')
+    # Save the profile of the logging overhead in a json file
+    parser.add_argument('-pj',
+                        '--profile_json',
+                        default=None,
+                        dest='pj',
+                        type=str,
+                        help='Json file where the profile is saved')
     args = parser.parse_args()
     main(args.filename,
          blocks=args.b,
          modifier_attr_fcts=args.maf,
          delta_logging=args.dl,
-         split_command=args.s)
\ No newline at end of file
+         split_command=args.s,
+         async_logging=args.al,
+         queue_size=args.qs,
+         chunk_logging=args.cl,
+         backend=args.db,
+         parallel=args.p,
+         processes=args.np,
+         fork=args.f,
+         logging_policies=args.lp,
+         skip_unchanged=args.su,
+         loop_policy=args.lo,
+         code_cache=args.cc,
+         profile=args.pr,
+         profile_json=args.pj)
\ No newline at end of file
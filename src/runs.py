@@ -0,0 +1,102 @@
+import argparse
+from dbResource import DbResource
+"""
+Lists and drops the runs saved in the database (see create_tables),
+and prints the storage savings of delta logging
+
+Usage:
+    python runs.py [-db sqlite] list
+    python runs.py [-db sqlite] drop <run_id> [<run_id> ...] [-a]
+    python runs.py savings
+
+With postgresql, dropping a run detaches its partitions,
+with '-a' the detached partitions are kept as archive tables
+A run reusing the dataframe rows of another run depends on it,
+dropping the run moves the rows its dependents reuse to them
+
+The savings are the dataframe rows of the snapshots saved with
+delta logging that were not stored again (see DbInterface.save_dataframe_delta)
+"""
+
+
+# Print the runs, one per line
+def list_runs(backend='postgresql'):
+    with DbResource(backend=backend) as db:
+        runs = db.get_runs()
+    print("{:>6}  {:<32} {:<32} {:<10} {}".format('run', 'started', 'ended',
+                                                  'status', 'script'))
+    for run in runs:
+        print("{:>6}  {:<32} {:<32} {:<10} {}".format(
+            run['run_id'], str(run['started']), str(run['ended'] or '-'),
+            run['status'], run['script'] or '-'))
+
+
+# Print the rows referenced and stored by the delta logging snapshots
+# of every run, and the share of the rows that were not stored again
+def print_savings(backend='postgresql'):
+    with DbResource(backend=backend) as db:
+        savings = db.get_storage_savings()
+    print("{:>6} {:>10} {:>12} {:>12} {:>8}".format('run', 'snapshots',
+                                                   'rows', 'stored', 'saved'))
+    total_rows = total_stored = 0
+    for run in savings:
+        total_rows += run['rows']
+        total_stored += run['stored_rows']
+        print("{:>6} {:>10} {:>12} {:>12} {:>8}".format(
+            run['run_id'], run['snapshots'], run['rows'], run['stored_rows'],
+            format_saved(run['rows'], run['stored_rows'])))
+    print("{:>6} {:>10} {:>12} {:>12} {:>8}".format(
+        'total', '', total_rows, total_stored,
+        format_saved(total_rows, total_stored)))
+
+
+# Format the share of the rows that were not stored
+def format_saved(rows, stored_rows):
+    if rows == 0:
+        return '-'
+    return "{:.1f}%".format(100 * (1 - stored_rows / rows))
+
+
+# Drop or archive the given runs
+def drop_runs(run_ids, archive=False, backend='postgresql'):
+    with DbResource(backend=backend) as db:
+        for run_id in run_ids:
+            try:
+                db.drop_run(run_id, archive)
+            except ValueError as e:
+                print(e)
+                return
+            print("{} run {}".format('Archived' if archive else 'Dropped',
+                                     run_id))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-db',
+                        '--backend',
+                        default='postgresql',
+                        dest='db',
+                        choices=['postgresql', 'sqlite'],
+                        help='Storage backend (postgresql or sqlite)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List the runs')
+    drop_parser = subparsers.add_parser('drop', help='Drop runs')
+    drop_parser.add_argument('run_ids',
+                             type=int,
+                             nargs='+',
+                             help='Ids of the runs to drop')
+    # Keep the detached partitions of the runs or not
+    drop_parser.add_argument('-a',
+                             '--archive',
+                             action='store_true',
+                             help='Keep the values of the runs in detached '
+                             'partitions (postgresql only)')
+    subparsers.add_parser('savings',
+                          help='Print the storage savings of delta logging')
+    args = parser.parse_args()
+    if args.command == 'list':
+        list_runs(args.db)
+    elif args.command == 'savings':
+        print_savings(args.db)
+    else:
+        drop_runs(args.run_ids, args.archive, args.db)
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+class SnapshotCache(object):
+    """
+    SnapshotCache class
+
+    LRU cache of the last saved snapshot of each dataframe variable,
+    keyed by (name, split_id)
+
+    A cached snapshot is a (cols, fingerprints, rids) tuple:
+     - cols: the sorted columns used to compute the fingerprints
+     - fingerprints: numpy array with the fingerprint of every row
+     - rids: numpy array with the dataframe_data rid of every row
+
+    The cache is bounded by the total size in bytes of the cached arrays,
+    the least recently used snapshots are evicted first
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        super(SnapshotCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.snapshots = OrderedDict()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    # Get the cached snapshot of a variable, or None if there is none
+    def get(self, key):
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None:
+            self.snapshots.move_to_end(key)
+        return snapshot
+
+    # Cache the last snapshot of a variable
+    # Snapshots bigger than the cache itself are not cached
+    def put(self, key, cols, fingerprints, rids):
+        self.remove(key)
+        nbytes = fingerprints.nbytes + rids.nbytes
+        if nbytes > self.max_bytes:
+            return
+        self.snapshots[key] = (tuple(cols), fingerprints, rids)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, old_fps, old_rids) = self.snapshots.popitem(last=False)
+            self.nbytes -= old_fps.nbytes + old_rids.nbytes
+
+    def remove(self, key):
+        snapshot = self.snapshots.pop(key, None)
+        if snapshot is not None:
+            self.nbytes -= snapshot[1].nbytes + snapshot[2].nbytes
+
+    def clear(self):
+        self.snapshots.clear()
+        self.nbytes = 0
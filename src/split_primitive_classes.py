@@ -1,6 +1,8 @@
 import re
 import ast
 import operator as op
+import numpy as np
+import pandas as pd
 from copy import deepcopy
 from pandas import DataFrame
 
@@ -14,53 +16,97 @@ class SplitCommandParser(object):
 
     List of arguments:
      - dataframe name
-     - column name
-     - comparison operator
-     - comparison value
+     - split method ('where', 'by', 'quantile' or 'hash')
+     - predicates: list of (column name, comparison operator,
+       comparison value) for the 'where' method
+     - column name and number of partitions for the other methods
      - block number
 
-    Example of command:
+    Examples of commands:
     "SPLIT students WHERE age >= 21 ON BLOCK 2"
-
     This will split the dataframe named 'students' in two:
     one containing the stundents aged 21 and more, 
     and another one containing th younger students
 
+    "SPLIT students WHERE age >= 21 AND grade > 12 ON BLOCK 2"
+    The predicates of a conjunction must all be true for the first partition
+
+    "SPLIT students BY class ON BLOCK 2"
+    One partition for every value of the column
+
+    "SPLIT students BY QUANTILE(age, 4) ON BLOCK 2"
+    Four partitions of (about) the same size, by age quantile
+    (the column must be numeric, or hold dates or durations)
+
+    "SPLIT students BY HASH(name, 8) ON BLOCK 2"
+    Eight partitions, using the hash of the column values
+
     This dataframe splitting will be done right before the 
     execution of the second block defined by the user
     """
 
-    # regex pattern
+    # regex patterns
     pattern = re.compile(
-        r"SPLIT (?P<df_name>[\w]+) WHERE (?P<col_name>[\w]+) " +
-        r"(?P<comp_op><|<=|=|!=|>=|>) (?P<comp_val>[\S]+) " +
-        r"ON BLOCK (?P<block>[\d]+)", re.IGNORECASE)
+        r"SPLIT (?P<df_name>[\w]+) " +
+        r"(?:WHERE (?P<predicates>.+?)|BY (?P<by>.+?)) " +
+        r"ON BLOCK (?P<block>[\d]+)$", re.IGNORECASE)
+    and_pattern = re.compile(r"\s+AND\s+", re.IGNORECASE)
+    predicate_pattern = re.compile(
+        r"(?P<col_name>[\w]+) (?P<comp_op><|<=|=|!=|>=|>) (?P<comp_val>[\S]+)$")
+    by_pattern = re.compile(
+        r"(?:(?P<method>QUANTILE|HASH)\(\s*(?P<col_name>[\w]+)\s*," +
+        r"\s*(?P<n>[\d]+)\s*\)|(?P<by_col_name>[\w]+))$", re.IGNORECASE)
+
+    comp_ops = {
+        '<': op.lt,
+        '<=': op.le,
+        '=': op.eq,
+        '!=': op.ne,
+        '>=': op.ge,
+        '>': op.gt
+    }
 
     def __init__(self):
         super(SplitCommandParser, self).__init__()
 
     @classmethod
     def parse(cls, command):
-        def convert(key, val):
-            if key in ['df_name', 'col_name']:
-                return val
-            elif key == 'comp_op':
-                return {
-                    '<': op.lt,
-                    '<=': op.le,
-                    '=': op.eq,
-                    '!=': op.ne,
-                    '>=': op.ge,
-                    '>': op.gt
-                }.get(val)
-            elif key in ['comp_val', 'block']:
-                return ast.literal_eval(val)
-
-        match = cls.pattern.match(command)
+        match = cls.pattern.match(command.strip())
         if match is None:
             raise ValueError("Incorrect command")
-        params = match.groupdict()
-        return {k: convert(k, v) for k, v in params.items()}
+        params = {
+            'df_name': match.group('df_name'),
+            'block': ast.literal_eval(match.group('block'))
+        }
+        if match.group('predicates') is not None:
+            params['method'] = 'where'
+            params['predicates'] = [
+                cls.parse_predicate(predicate) for predicate in
+                cls.and_pattern.split(match.group('predicates'))
+            ]
+        else:
+            by_match = cls.by_pattern.match(match.group('by'))
+            if by_match is None:
+                raise ValueError("Incorrect command")
+            if by_match.group('method') is None:
+                params['method'] = 'by'
+                params['col_name'] = by_match.group('by_col_name')
+            else:
+                params['method'] = by_match.group('method').lower()
+                params['col_name'] = by_match.group('col_name')
+                params['n'] = int(by_match.group('n'))
+                if params['n'] < 1:
+                    raise ValueError("The number of partitions must be positive")
+        return params
+
+    # Parses a predicate written as: <column_name> <comparison_operator> <comparison_value>
+    @classmethod
+    def parse_predicate(cls, predicate):
+        match = cls.predicate_pattern.match(predicate)
+        if match is None:
+            raise ValueError("Incorrect predicate: {}".format(predicate))
+        return (match.group('col_name'), cls.comp_ops[match.group('comp_op')],
+                ast.literal_eval(match.group('comp_val')))
 
 
 class DfPartitioner(object):
@@ -70,6 +116,9 @@ class DfPartitioner(object):
     Partitions a dataframe using the parameters 
     returned by SplitCommandParser
 
+    Every row gets the number of its partition, and the dataframe
+    is cut in partitions in one pass using these numbers
+
     When given the globals from the code execution 
     instead of a dataframe, partitions the dataframe if it exists
     and returns multiple copies of the globals, each with a
@@ -81,18 +130,76 @@ class DfPartitioner(object):
 
     # Partitions a given dataframe
     def partition(self, df: DataFrame):
-        col_name = self.params['col_name']
-        if col_name not in df.columns:
-            print("Dataframe has no column named ", col_name)
+        if self.params['method'] == 'where':
+            col_names = [pred[0] for pred in self.params['predicates']]
         else:
-            comp_op = self.params['comp_op']
-            comp_val = self.params['comp_val']
-            col_type = df.dtypes[col_name]
-            mask = comp_op(df[col_name], comp_val)
-            df_comp_true = df.loc[mask]
-            df_comp_false = df.loc[~mask]
-            return [df_comp_true, df_comp_false]
-        return [df]
+            col_names = [self.params['col_name']]
+        missing = [col for col in col_names if col not in df.columns]
+        if len(missing) > 0:
+            print("Dataframe has no column named ", missing[0])
+            return [df]
+        labels, n = self.get_labels(df)
+        return self.split(df, labels, n)
+
+    # Get the partition number of every row of the dataframe
+    # and the number of partitions
+    def get_labels(self, df: DataFrame):
+        method = self.params['method']
+        if method == 'where':
+            # Rows satisfying all the predicates go in the first partition
+            mask = np.ones(len(df), dtype=bool)
+            for col_name, comp_op, comp_val in self.params['predicates']:
+                mask &= np.asarray(comp_op(df[col_name], comp_val), dtype=bool)
+            return (~mask).astype(np.int64), 2
+        col = df[self.params['col_name']]
+        if method == 'by':
+            # One partition per value (sorted), missing values last
+            labels, uniques = pd.factorize(col, sort=True)
+            n = len(uniques)
+            if (labels < 0).any():
+                labels = np.where(labels < 0, n, labels)
+                n += 1
+            return labels, n
+        n = self.params['n']
+        if method == 'quantile':
+            # Missing values are in an extra last partition if there are any
+            values = self.get_quantile_values(col)
+            edges = np.nanquantile(values, np.linspace(0, 1, n + 1)[1:-1]) \
+                if len(values) > 0 else np.array([])
+            labels = np.searchsorted(edges, values, side='right')
+            nan_mask = np.isnan(values)
+            if nan_mask.any():
+                labels[nan_mask] = n
+                n += 1
+            return labels, n
+        if method == 'hash':
+            hashes = pd.util.hash_pandas_object(col, index=False).to_numpy()
+            return (hashes % np.uint64(n)).astype(np.int64), n
+        raise ValueError("Unknown split method: {}".format(method))
+
+    # Get the values of a column as floats to compute its quantiles,
+    # missing values as NaN
+    # Dates and durations are compared by their number of nanoseconds
+    # (from the smallest one), other non-numeric columns can't be used
+    def get_quantile_values(self, col):
+        if pd.api.types.is_numeric_dtype(col):
+            return col.to_numpy(dtype=float, na_value=np.nan)
+        if pd.api.types.is_datetime64_any_dtype(col) or \
+                pd.api.types.is_timedelta64_dtype(col):
+            return ((col - col.min()) / pd.Timedelta(1, 'ns')).to_numpy(
+                dtype=float, na_value=np.nan)
+        raise ValueError(
+            "QUANTILE needs a numeric, datetime or timedelta column, "
+            "column {} has type {}".format(col.name, col.dtype))
+
+    # Cut the dataframe in n partitions using the partition numbers
+    # of the rows, the rows keep their order in every partition
+    def split(self, df: DataFrame, labels, n):
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(n + 1))
+        return [
+            df.iloc[order[bounds[i]:bounds[i + 1]]] for i in range(n)
+        ]
 
     # Deepcopy function for the globals
     # The standard deepcopy can't be used,
@@ -114,7 +221,10 @@ class DfPartitioner(object):
     # Returns multiple copies of the globals,
     # each with a different partition of
     # the dataframe that has to be partitioned
-    def partition_from_globs(self, globs: dict):
+    # Without deepcopy, the copies share the values of the globals:
+    # only use this when every partition is executed in
+    # its own forked process (the memory is then copied on write)
+    def partition_from_globs(self, globs: dict, deepcopy=True):
         df_name = self.params['df_name']
         if df_name not in globs.keys():
             raise ValueError("Parameter ", df_name, " is not defined")
@@ -124,7 +234,10 @@ class DfPartitioner(object):
         df_partitions = self.partition(df_val)
         globs_partitions = []
         for i, df_partition in enumerate(df_partitions):
-            globs_copy = self.deepcopy_globs(globs)
+            if deepcopy:
+                globs_copy = self.deepcopy_globs(globs)
+            else:
+                globs_copy = dict(globs)
             globs_copy[df_name] = df_partition
             globs_copy['split_id'] = i
             globs_partitions.append(globs_copy)
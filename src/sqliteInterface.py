@@ -0,0 +1,441 @@
+import contextlib
+import json
+import sqlite3
+import pandas as pd
+from time import perf_counter
+from config import config
+from dbObject import DbObject
+from dbBackend import DbBackend
+from datetime import date, time, datetime
+from chunk_utils import CHUNK_ROWS, split_pandas
+
+
+# Sqlite types of the scalar tables
+sqlite_scalar_types = {
+    'int': 'integer',
+    'float': 'real',
+    'str': 'text',
+    'bool': 'integer',
+    'date': 'text',
+    'time': 'text',
+    'datetime': 'text',
+}
+
+
+# Get the sqlite tables where the logged objects are saved
+# (see create_tables.OBJECT_TABLES, without delta logging)
+def get_sqlite_object_tables():
+    tables = []
+    for type_name in sqlite_scalar_types:
+        tables.extend(
+            ['{}_scalar'.format(type_name), '{}_scalar_array'.format(type_name)])
+    tables.extend([
+        'empty_array', 'compound_scalar_array', 'dataframe_object',
+        'series_object', 'np_0d_object', 'np_1d_object', 'np_2d_object',
+        'dataframe_chunk_object', 'profile_object'
+    ])
+    return tables
+
+
+# Create statements of the sqlite tables
+# Same tables as the postgresql tables (see create_tables),
+# arrays are saved as json text and dates and times as iso format text
+# The table of a dataframe, series or numpy object is named
+# after the id of the object (ex: dataframe_12)
+# The policy column is the logging policy used to save the value
+# (see logging_policies), NULL if the full value is saved
+# The object tables have the same lookup indexes and catalog view
+# as the postgresql tables
+def get_sqlite_create_statements():
+    sql_stmts = []
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id integer PRIMARY KEY,
+                script text,
+                started text NOT NULL,
+                ended text,
+                status text NOT NULL DEFAULT 'running'
+            )""")
+    obj_cols = """
+                id integer PRIMARY KEY,
+                run_id integer NOT NULL,
+                s_id integer,
+                t text NOT NULL,
+                lineno integer NOT NULL,
+                name text NOT NULL"""
+    for type_name, sqlite_type in sqlite_scalar_types.items():
+        sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS {}_scalar ({},
+                value {} NOT NULL
+            )""".format(type_name, obj_cols, sqlite_type))
+        sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS {}_scalar_array ({},
+                arr_type text NOT NULL,
+                value text NOT NULL
+            )""".format(type_name, obj_cols))
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS empty_array ({},
+                arr_type text NOT NULL
+            )""".format(obj_cols))
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS compound_scalar_array ({},
+                arr_type text NOT NULL,
+                types text NOT NULL,
+                value text NOT NULL
+            )""".format(obj_cols))
+    for table_name in ('dataframe_object', 'series_object'):
+        sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS {} ({},
+                nlevels integer NOT NULL,
+                policy text
+            )""".format(table_name, obj_cols))
+    for dim in range(3):
+        sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS np_{}d_object ({},
+                dtype text NOT NULL,
+                policy text
+            )""".format(dim, obj_cols))
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS dataframe_chunk_object ({},
+                obj_type text NOT NULL,
+                nlevels integer NOT NULL,
+                nrows integer NOT NULL,
+                clist text NOT NULL,
+                dtypes text NOT NULL,
+                chunks text NOT NULL,
+                policy text
+            )""".format(obj_cols))
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS profile_object ({},
+                obj_type text NOT NULL,
+                nrows integer NOT NULL,
+                policy text
+            )""".format(obj_cols))
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS column_profile (
+                run_id integer NOT NULL,
+                profile_id integer NOT NULL,
+                position integer NOT NULL,
+                column_name text NOT NULL,
+                dtype text NOT NULL,
+                count integer NOT NULL,
+                null_count integer NOT NULL,
+                distinct_count integer NOT NULL,
+                min real,
+                max real,
+                mean real,
+                std real,
+                quantiles text,
+                hll blob NOT NULL,
+                PRIMARY KEY (profile_id, position)
+            )""")
+    sql_stmts.append("""
+            CREATE TABLE IF NOT EXISTS dataframe_chunk (
+                chunk_id text PRIMARY KEY,
+                data blob NOT NULL
+            )""")
+    object_tables = get_sqlite_object_tables()
+    for table_name in object_tables:
+        sql_stmts.append("""
+            CREATE INDEX IF NOT EXISTS {0}_lookup_idx
+                ON {0} (name, s_id, t, lineno)""".format(table_name))
+    sql_stmts.append("""
+            CREATE VIEW IF NOT EXISTS variable_catalog AS
+{}""".format('\n                UNION ALL\n'.join(
+        """                SELECT '{0}' AS table_name, run_id, id, s_id, t, lineno,
+                    name
+                FROM {0}""".format(table_name) for table_name in object_tables)))
+    return sql_stmts
+
+
+# Convert a value to a value that can be saved in sqlite
+# Dates and times are converted to iso format text
+# and arrays to json text
+def to_sqlite_value(value):
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    elif isinstance(value, (list, tuple)):
+        return json.dumps([to_sqlite_value(v) for v in value])
+    return value
+
+
+# Get the approximate number of bytes of the parameters of a statement
+def params_nbytes(params):
+    return sum(
+        len(p) if isinstance(p, (str, bytes)) else 8 for p in params)
+
+
+class ProfiledSqliteCursor(sqlite3.Cursor):
+    """
+    ProfiledSqliteCursor class
+
+    Cursor recording the time and the approximate number of bytes sent
+    of every statement in the profiler of its connection (see profiler)
+    """
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super(ProfiledSqliteCursor,
+                         self).execute(sql, parameters)
+        finally:
+            self.connection.profiler.record_db(
+                perf_counter() - start,
+                len(sql) + params_nbytes(parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        start = perf_counter()
+        try:
+            return super(ProfiledSqliteCursor,
+                         self).executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.profiler.record_db(
+                perf_counter() - start,
+                len(sql) + sum(map(params_nbytes, seq_of_parameters)))
+
+
+class ProfiledSqliteConnection(sqlite3.Connection):
+    """
+    ProfiledSqliteConnection class
+
+    Connection whose statements are executed with a ProfiledSqliteCursor
+    """
+    profiler = None
+
+    def cursor(self, factory=ProfiledSqliteCursor):
+        return super(ProfiledSqliteConnection, self).cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class SqliteInterface(DbBackend):
+    """
+    SqliteInterface class
+
+    SQLite backend: saves the DbObject instances in a local sqlite file
+    (see DbBackend), no database server is needed
+    The path of the file is read from the sqlite section of the config file,
+    and the tables are created when connecting
+
+    With chunk logging, dataframes and series are saved column by column
+    as content-addressed chunks (see chunk_utils)
+    Delta logging is not available with this backend,
+    dataframes are saved in their own table instead
+    """
+    placeholder = '?'
+
+    def __init__(self, delta_logging=True, async_logging=False,
+                 queue_size=1000, batch_size=500,
+                 chunk_logging=False,
+                 chunk_rows=CHUNK_ROWS,
+                 path=None,
+                 timeout=30):
+        super(SqliteInterface, self).__init__(async_logging, queue_size,
+                                              batch_size)
+        self.delta_logging = delta_logging
+        self.chunk_logging = chunk_logging
+        self.chunk_rows = chunk_rows
+        self.path = path
+        self.timeout = timeout
+        self.known_chunks = set()
+
+    # Open the sqlite file and create the tables if needed
+    # The connection is shared with the background writer thread
+    # (only one of the two threads uses it at a time)
+    # When the file is locked by another process, wait for timeout seconds
+    # With a profiler, the statements are profiled
+    def open(self):
+        path = self.path
+        if path is None:
+            path = config(section='sqlite')['path']
+        factory = sqlite3.Connection
+        if self.profiler is not None:
+            factory = ProfiledSqliteConnection
+        self.conn = sqlite3.connect(path,
+                                    timeout=self.timeout,
+                                    check_same_thread=False,
+                                    factory=factory)
+        if self.profiler is not None:
+            self.conn.profiler = self.profiler
+        for sql in get_sqlite_create_statements():
+            self.conn.execute(sql)
+        self.conn.commit()
+        self.known_chunks = set()
+
+    def close(self, commit=True):
+        if commit:
+            self.conn.commit()
+        self.conn.close()
+        self.conn = None
+
+    def execute(self, sql, args=()):
+        self.conn.execute(sql, tuple(map(to_sqlite_value, args)))
+
+    # No savepoint with sqlite: a failed statement doesn't abort
+    # the transaction, and pandas commits when it writes a table
+    def savepoint(self):
+        return contextlib.nullcontext()
+
+    # The chunks written in the rolled back changes
+    # are not in the database anymore
+    def discard_caches(self):
+        self.known_chunks = set()
+
+    def create_run(self, script):
+        run_id = self.insert_object('runs', ('script', 'started'),
+                                    (script, datetime.now().astimezone()))
+        self.conn.commit()
+        return run_id
+
+    # Drop a run by deleting its rows (the tables are not partitioned)
+    # and the tables of its dataframes, series and numpy arrays
+    # The chunks of chunk logging are shared by the runs and are kept
+    def drop_run(self, run_id, archive=False):
+        if archive:
+            raise ValueError(
+                "Runs can only be archived with the postgresql backend")
+        if run_id == self.run_id:
+            raise ValueError("The current run can't be dropped")
+        self.flush()
+        for table in ('dataframe_object', 'series_object', 'np_0d_object',
+                      'np_1d_object', 'np_2d_object'):
+            for row in self.fetch_rows(
+                    "SELECT id FROM {} WHERE run_id = ?".format(table),
+                    (run_id, )):
+                self.conn.execute('DROP TABLE IF EXISTS "{}"'.format(
+                    self.get_value_table(table, row)))
+        for table in get_sqlite_object_tables() + ['column_profile', 'runs']:
+            self.conn.execute("DELETE FROM {} WHERE run_id = ?".format(table),
+                              (run_id, ))
+        self.conn.commit()
+
+    # Insert multiple rows in a table with one statement
+    def insert_rows(self, table, cols, rows):
+        sql = "INSERT INTO {}({}) VALUES ({})".format(
+            table, ','.join(cols), ','.join('?' * len(cols)))
+        self.conn.executemany(
+            sql, [tuple(map(to_sqlite_value, row)) for row in rows])
+
+    # Insert one object row and return its id
+    def insert_object(self, table, cols, row):
+        sql = "INSERT INTO {}({}) VALUES ({})".format(
+            table, ','.join(cols), ','.join('?' * len(cols)))
+        return self.conn.execute(sql, tuple(map(to_sqlite_value,
+                                                row))).lastrowid
+
+    def save_pandas(self, obj: DbObject):
+        if self.chunk_logging:
+            self.save_pandas_chunks(obj)
+        elif obj.type in self.pandas_classes:
+            self.save_pandas_default(obj)
+        else:
+            raise TypeError("This should not happen")
+
+    def save_pandas_default(self, obj: DbObject):
+        type_name = obj.type.__name__.lower()
+        table_id = self.insert_object(
+            "{}_object".format(type_name),
+            ('run_id', 's_id', 't', 'lineno', 'name', 'nlevels', 'policy'),
+            (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+             obj.value.index.nlevels, obj.policy))
+        self.copy_pandas("{}_{}".format(type_name, table_id), obj.value)
+
+    # Save a dataframe or series as content-addressed column chunks
+    # (see DbInterface.save_pandas_chunks)
+    def save_pandas_chunks(self, obj: DbObject):
+        df, col_chunks = split_pandas(obj.value, self.chunk_rows)
+        new_chunks = [(cid, data) for cc in col_chunks for cid, data in cc
+                      if cid not in self.known_chunks]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO dataframe_chunk(chunk_id, data) VALUES (?,?)",
+            new_chunks)
+        self.known_chunks.update(cid for cid, _ in new_chunks)
+        self.insert_object(
+            'dataframe_chunk_object',
+            ('run_id', 's_id', 't', 'lineno', 'name', 'obj_type', 'nlevels',
+             'nrows', 'clist', 'dtypes', 'chunks', 'policy'),
+            (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name, obj.type.__name__,
+             obj.value.index.nlevels, len(df),
+             [str(col) for col in df.columns],
+             [str(dtype) for dtype in df.dtypes],
+             [[cid for cid, _ in cc] for cc in col_chunks], obj.policy))
+
+    def save_numpy(self, obj: DbObject):
+        dim = len(obj.value.shape)
+        if dim == 0 or dim == 1 or dim == 2:
+            table_id = self.insert_object(
+                "np_{}d_object".format(dim),
+                ('run_id', 's_id', 't', 'lineno', 'name', 'dtype', 'policy'),
+                (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name,
+                 str(obj.value.dtype), obj.policy))
+            if dim < 2:
+                pd_obj = pd.Series(data=obj.value, dtype=obj.value.dtype)
+            else:
+                pd_obj = pd.DataFrame(data=obj.value, dtype=obj.value.dtype)
+            self.copy_pandas("np_{}d_{}".format(dim, table_id), pd_obj)
+        else:
+            raise TypeError(
+                "Numpy arrays of dimension higher than 2 are not handled yet")
+
+    # Save the profile of a dataframe, series or numpy array
+    # (see DbInterface.save_profile)
+    def save_profile(self, obj: DbObject):
+        profile = obj.value
+        profile_id = self.insert_object(
+            'profile_object',
+            ('run_id', 's_id', 't', 'lineno', 'name', 'obj_type', 'nrows',
+             'policy'),
+            (self.run_id, obj.s_id, obj.time, obj.lineno, obj.name, obj.type.__name__,
+             profile.nrows, obj.policy))
+        self.insert_rows(
+            'column_profile',
+            ('run_id', 'profile_id', 'position', 'column_name', 'dtype',
+             'count', 'null_count', 'distinct_count', 'min', 'max', 'mean',
+             'std', 'quantiles', 'hll'),
+            [(self.run_id, profile_id, i, col.name, col.dtype, col.count, col.null_count,
+              col.distinct_count(), col.min, col.max, col.mean, col.std,
+              col.quantiles, col.hll.tobytes())
+             for i, col in enumerate(profile.columns)])
+
+    # Save a dataframe or series (with its index) in a new table
+    def copy_pandas(self, table_name, pd_obj):
+        if isinstance(pd_obj, pd.Series):
+            pd_obj = pd_obj.to_frame()
+        df = pd_obj.reset_index()
+        df.columns = [str(col) for col in df.columns]
+        df.to_sql(table_name, self.conn, index=False)
+
+    # Get the rows of a query as dictionaries
+    def fetch_rows(self, sql, args=()):
+        cur = self.conn.execute(sql, tuple(map(to_sqlite_value, args)))
+        cols = [desc[0] for desc in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def get_value_table(self, table, row):
+        return "{}_{}".format(table[:-len('_object')], row['id'])
+
+    # Read a saved table, in the order of its rows
+    # The timestamp columns are parsed from their declared type,
+    # bool columns are declared as integers so they are read as integers
+    def read_table(self, table_name):
+        columns = self.conn.execute(
+            'PRAGMA table_info("{}")'.format(table_name)).fetchall()
+        return pd.read_sql(
+            'SELECT * FROM "{}" ORDER BY rowid'.format(table_name),
+            self.conn,
+            parse_dates=[col[1] for col in columns if col[2] == 'TIMESTAMP'])
+
+    def read_chunks(self, chunk_ids):
+        data = {}
+        # Bounded number of parameters per statement
+        for start in range(0, len(chunk_ids), 500):
+            ids = chunk_ids[start:start + 500]
+            data.update(
+                self.conn.execute(
+                    "SELECT chunk_id, data FROM dataframe_chunk WHERE chunk_id IN ({})"
+                    .format(','.join('?' * len(ids))), ids).fetchall())
+        return data
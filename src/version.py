@@ -0,0 +1,5 @@
+# Version of dagger
+# Change it when the instrumentation of the code changes
+# (Logger, CodeSplitter), so that the cached compiled code
+# of older versions is not used anymore (see code_cache)
+__version__ = '0.2.2'